@@ -33,6 +33,8 @@ const mapToFlowEdge = (edge: any): FlowEdge => {
     id: edge.id,
     source: edge.source,
     target: edge.target,
+    sourceHandle: edge.sourceHandle ?? null,
+    targetHandle: edge.targetHandle ?? null,
     type: edge.type || 'smoothstep',
     animated: edge.animated ?? true,
     data: edge.data || {},
@@ -1,7 +1,8 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { Handle, Position } from 'reactflow';
 import { Settings, Trash2, Zap, ChevronDown, AlertCircle } from 'lucide-react';
 import { useFlowStore } from '../../../../store/flowStore';
+import workflowService from '../../../../lib/workflowService';
 
 interface PipelineNodeProps {
   id: string;
@@ -19,6 +20,14 @@ interface PipelineNodeProps {
 const PipelineNode: React.FC<PipelineNodeProps> = ({ id, data, selected }) => {
   const removeNode = useFlowStore((state) => state.removeNode);
   const updateNodeData = useFlowStore((state) => state.updateNodeData);
+  // The backend runs the selected workflow in place of this node, so offer the user's saved workflows
+  const [workflows, setWorkflows] = useState<{ id: string; name: string }[]>([]);
+
+  useEffect(() => {
+    workflowService.getWorkflows()
+      .then((list) => setWorkflows(list.map(({ id, name }) => ({ id, name }))))
+      .catch(() => setWorkflows([]));
+  }, []);
 
   return (
     <div
@@ -83,9 +92,9 @@ const PipelineNode: React.FC<PipelineNodeProps> = ({ id, data, selected }) => {
               className="w-full appearance-none px-3 py-1.5 text-sm bg-white border border-gray-200 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent pr-10"
             >
               <option value="">Choose a workflow</option>
-              <option value="pipeline_1">Data Processing Workflow</option>
-              <option value="pipeline_2">Document Analysis Workflow</option>
-              <option value="pipeline_3">Customer Support Workflow</option>
+              {workflows.map((workflow) => (
+                <option key={workflow.id} value={workflow.id}>{workflow.name}</option>
+              ))}
             </select>
             <ChevronDown className="w-4 h-4 text-gray-400 absolute right-3 top-1/2 -translate-y-1/2 pointer-events-none" />
           </div>
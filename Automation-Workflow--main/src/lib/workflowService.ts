@@ -1,5 +1,5 @@
 import api from './axios';
-import { Workflow, WorkflowCreate, WorkflowUpdate } from '../types/workflow';
+import { Workflow, WorkflowCreate, WorkflowDelta, WorkflowUpdate } from '../types/workflow';
 
 export const workflowService = {
   // Get all workflows
@@ -55,6 +55,23 @@ export const workflowService = {
     }
   },
 
+  // Apply node/edge deltas; pass the last ETag to reject concurrent edits with a 412
+  patchWorkflow: async (id: string, delta: WorkflowDelta, etag?: string): Promise<{ workflow: Workflow; etag: string }> => {
+    try {
+      const response = await api.patch(`/workflows/${id}`, delta, {
+        headers: etag ? { 'If-Match': etag } : {}
+      });
+      return { workflow: response.data, etag: response.headers['etag'] };
+    } catch (error) {
+      console.error(`Error patching workflow ${id}:`, error);
+      if (error.response) {
+        console.error('Response data:', error.response.data);
+        console.error('Status:', error.response.status);
+      }
+      throw error;
+    }
+  },
+
   // Delete a workflow
   deleteWorkflow: async (id: string): Promise<void> => {
     try {
@@ -175,6 +192,24 @@ export const workflowService = {
     }
   },
 
+  // Run a single node and the nodes it depends on, reusing unchanged upstream outputs
+  runNode: async (id: string, nodeId: string, inputs: Record<string, any>, mode: string = 'standard', refresh: boolean = false): Promise<any> => {
+    try {
+      const formattedInputs: Record<string, any> = {};
+      for (const [key, inputValue] of Object.entries(inputs)) {
+        formattedInputs[key] = { value: inputValue.value, type: inputValue.type || 'Text' };
+      }
+      const response = await api.post(`/workflows/${id}/nodes/${nodeId}/run`, {
+        inputs: formattedInputs,
+        mode: mode
+      }, { params: refresh ? { refresh: true } : {} });
+      return response.data;
+    } catch (error) {
+      console.error(`Error running node ${nodeId} of workflow ${id}:`, error);
+      throw error;
+    }
+  },
+
   // Add the function to fix input types
   fixInputTypes: async function(workflowId: string): Promise<any> {
     try {
@@ -23,6 +23,7 @@ export interface Workflow {
   lastModified: string;
   status: 'active' | 'draft';
   userId?: string;
+  version?: number;
 }
 
 export interface WorkflowCreate {
@@ -39,4 +40,15 @@ export interface WorkflowUpdate {
   nodes: FlowNode[];
   edges: FlowEdge[];
   status?: 'active' | 'draft';
-}
\ No newline at end of file
+}
+
+export interface WorkflowDelta {
+  name?: string;
+  description?: string;
+  add_nodes?: FlowNode[];
+  update_nodes?: Array<Partial<FlowNode> & { id: string }>;
+  remove_nodes?: string[];
+  add_edges?: FlowEdge[];
+  update_edges?: Array<Partial<FlowEdge> & { id: string }>;
+  remove_edges?: string[];
+}
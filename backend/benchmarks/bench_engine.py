@@ -0,0 +1,241 @@
+"""Micro-benchmarks for the workflow execution engine.
+
+Runs calculate_execution_order, compile_plan, get_node_inputs, render_prompt and
+execute_graph over synthetic DAGs (chain, fan-out, diamond) of increasing size. Provider calls go
+to the simulate_ai_response stand-in, so no network or API keys are needed.
+
+Usage (from the backend directory):
+    python benchmarks/bench_engine.py                      # run and compare against the baseline
+    python benchmarks/bench_engine.py --save-baseline      # record a new baseline
+    python benchmarks/bench_engine.py --sizes 10 100 --shapes chain
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.workflow import InputValue
+from routers.nodes import MODEL_HANDLERS, simulate_ai_response
+from routers.workflows import execute_graph, get_node_inputs, render_prompt
+from utils.plans import ExecutionPlan, calculate_execution_order, compile_plan
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+SHAPES = ["chain", "fanout", "diamond"]
+PROMPT = "Summarize the following text in one sentence: {{input}}"
+
+def use_simulated_providers():
+    """Route every provider to simulate_ai_response"""
+    def make_handler(provider):
+        async def handler(data):
+            return simulate_ai_response(provider)
+        return handler
+    for provider in MODEL_HANDLERS:
+        MODEL_HANDLERS[provider] = make_handler(provider)
+
+# Synthetic graphs in the same shape the editor saves
+
+def _node(node_id, node_type, params=None):
+    return {"id": node_id, "type": node_type, "position": {"x": 0, "y": 0}, "data": {"params": params or {}}}
+
+def _edge(source, target):
+    return {"id": f"e-{source}-{target}", "source": source, "target": target}
+
+def _llm(index):
+    return _node(f"openai-{index}", "openai", {"model": "gpt-4o", "prompt": PROMPT, "system": "Be brief."})
+
+def build_chain(size):
+    """input -> llm -> llm -> ... -> output"""
+    nodes = [_node("input-0", "input", {"type": "Text"})]
+    nodes += [_llm(i) for i in range(size - 2)]
+    nodes.append(_node("output-0", "output", {"type": "Text"}))
+    edges = [_edge(nodes[i]["id"], nodes[i + 1]["id"]) for i in range(len(nodes) - 1)]
+    return nodes, edges
+
+def build_fanout(size):
+    """input -> N llm nodes, each feeding its own output"""
+    width = max(1, (size - 1) // 2)
+    nodes = [_node("input-0", "input", {"type": "Text"})]
+    edges = []
+    for i in range(width):
+        nodes.append(_llm(i))
+        nodes.append(_node(f"output-{i}", "output", {"type": "Text"}))
+        edges.append(_edge("input-0", f"openai-{i}"))
+        edges.append(_edge(f"openai-{i}", f"output-{i}"))
+    return nodes, edges
+
+def build_diamond(size):
+    """Repeated input -> (a, b) -> join diamonds chained into one output"""
+    nodes = [_node("input-0", "input", {"type": "Text"})]
+    edges = []
+    previous = "input-0"
+    index = 0
+    while len(nodes) + 3 < size:
+        a, b, join = _llm(index), _llm(index + 1), _llm(index + 2)
+        nodes += [a, b, join]
+        edges += [
+            _edge(previous, a["id"]), _edge(previous, b["id"]),
+            _edge(a["id"], join["id"]), _edge(b["id"], join["id"])
+        ]
+        previous = join["id"]
+        index += 3
+    nodes.append(_node("output-0", "output", {"type": "Text"}))
+    edges.append(_edge(previous, "output-0"))
+    return nodes, edges
+
+BUILDERS = {"chain": build_chain, "fanout": build_fanout, "diamond": build_diamond}
+
+# Benchmarked operations; each takes a prepared graph and returns nothing
+
+def bench_execution_order(graph):
+    calculate_execution_order(graph["nodes"], graph["edges"])
+
+def bench_compile_plan(graph):
+    compile_plan(graph["nodes"], graph["edges"])
+
+def bench_node_inputs(graph):
+    for node in graph["plan"].nodes:
+        get_node_inputs(node, graph["outputs"], graph["inputs"])
+
+def bench_render_prompt(graph):
+    values = {"input": "The quick brown fox jumps over the lazy dog. " * 20}
+    for node in graph["plan"].nodes:
+        template = node.data["templates"].get("prompt")
+        if template:
+            render_prompt(template, values)
+
+def bench_execute_graph(graph):
+    asyncio.run(execute_graph(graph["plan"], graph["inputs"], "standard", {}))
+
+OPERATIONS = {
+    "calculate_execution_order": bench_execution_order,
+    "compile_plan": bench_compile_plan,
+    "get_node_inputs": bench_node_inputs,
+    "render_prompt": bench_render_prompt,
+    "execute_graph": bench_execute_graph,
+}
+
+def prepare(shape, size):
+    nodes, edges = BUILDERS[shape](size)
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        # Plans are compiled when a workflow is saved, so execution benchmarks start from one
+        "plan": ExecutionPlan.from_document(compile_plan(nodes, edges)),
+        "inputs": {"input_0": InputValue(value="benchmark input", type="Text")},
+        # Every node "already ran", so get_node_inputs reads every binding
+        "outputs": {index: {"output": "x"} for index in range(len(nodes))},
+    }
+
+def time_operation(func, graph, repeat, budget):
+    """Run func up to `repeat` times, stopping early once `budget` seconds are spent"""
+    timings = []
+    spent = 0.0
+    while len(timings) < repeat and (not timings or spent < budget):
+        start = time.perf_counter()
+        func(graph)
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        spent += elapsed
+    return timings
+
+def run(shapes, sizes, operations, repeat, budget):
+    results = {}
+    for operation in operations:
+        for shape in shapes:
+            too_slow = False
+            for size in sizes:
+                key = f"{operation}/{shape}/{size}"
+                if too_slow:
+                    # A smaller size already blew the budget; larger ones only take longer
+                    results[key] = {"skipped": "previous size exceeded budget"}
+                    print(f"{key:<45} skipped")
+                    continue
+                graph = prepare(shape, size)
+                try:
+                    timings = time_operation(OPERATIONS[operation], graph, repeat, budget)
+                except RecursionError:
+                    results[key] = {"error": "RecursionError"}
+                    print(f"{key:<45} RecursionError")
+                    too_slow = True
+                    continue
+                median = statistics.median(timings)
+                results[key] = {"median": median, "min": min(timings), "runs": len(timings)}
+                print(f"{key:<45} median {median * 1000:>10.3f}ms  min {min(timings) * 1000:>10.3f}ms  runs {len(timings)}")
+                if timings[0] > budget:
+                    too_slow = True
+    return results
+
+def compare(results, baseline, threshold):
+    """Return the keys whose median regressed by more than `threshold` against the baseline"""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous or "median" not in previous:
+            continue
+        if "error" in result:
+            regressions.append((key, previous["median"], None, float("inf")))
+            continue
+        if "median" not in result:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((key, previous["median"], result["median"], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Workflow engine micro-benchmarks")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=SHAPES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--operations", nargs="+", choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument("--repeat", type=int, default=5, help="Maximum runs per case")
+    parser.add_argument("--budget", type=float, default=10.0, help="Seconds per case before larger sizes are skipped")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    use_simulated_providers()
+
+    results = run(args.shapes, sorted(args.sizes), args.operations, args.repeat, args.budget)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "created_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+        return 0
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+    for key, before, after, ratio in regressions:
+        if after is None:
+            print(f"  {key:<45} {before * 1000:.3f}ms -> {results[key]['error']}")
+        else:
+            print(f"  {key:<45} {before * 1000:.3f}ms -> {after * 1000:.3f}ms ({ratio:.2f}x)")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""End-to-end load harness for the FastAPI app.
+
+Drives a realistic mix of login, list, get, save and execute requests from N
+concurrent virtual users and reports throughput and latency percentiles.
+
+By default the app runs in-process (one worker) against local stand-ins:
+  - MongoDB: mongomock-motor (pip install mongomock-motor)
+  - Redis:   fakeredis (pip install fakeredis)
+  - Qdrant:  qdrant-client's in-memory mode
+  - LLMs:    a local OpenAI-compatible HTTP server with configurable latency
+Use --url to drive an already running server over HTTP instead.
+
+Usage (from the backend directory):
+    python benchmarks/load_test.py --users 50 --duration 30
+    python benchmarks/load_test.py --latency lognormal:0.8:0.5 --mix login=2,list=20,get=30,save=20,execute=28
+    python benchmarks/load_test.py --cassette cassettes/providers.jsonl --cassette-scale 0.5
+    python benchmarks/load_test.py --url http://localhost:8000 --users 20
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = "login=5,list=25,get=30,save=20,execute=20"
+
+# Fake LLM server
+
+def parse_latency(spec):
+    """Parse a latency distribution: fixed:S, uniform:LO:HI or lognormal:MEDIAN:SIGMA (seconds)"""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+def start_fake_llm_server(latency):
+    """Serve an OpenAI-compatible /v1/chat/completions on localhost; returns its base URL"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    fake = FastAPI()
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        await asyncio.sleep(latency())
+        prompt = body.get("messages", [{}])[-1].get("content", "")
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Simulated answer to: {prompt[:80]}"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 20, "total_tokens": len(prompt) // 4 + 20}
+        }
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="fake-llm", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+# In-process app wired to stand-ins
+
+def build_in_process_app():
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+        import fakeredis
+    except ImportError as e:
+        sys.exit(f"In-process mode needs the stand-in packages: pip install mongomock-motor fakeredis ({e})")
+    from qdrant_client import QdrantClient
+    from main import app
+    from config import settings
+
+    # The lifespan would connect to real services, so wire the stand-ins directly
+    app.mongodb_client = AsyncMongoMockClient()
+    app.mongodb = app.mongodb_client[settings.MONGODB_DB_NAME]
+    app.redis = fakeredis.FakeRedis(decode_responses=True)
+    app.qdrant = QdrantClient(location=":memory:")
+    from utils.admission import configure_admission
+    configure_admission(
+        settings.EXECUTION_MAX_IN_FLIGHT, settings.EXECUTION_MAX_PER_USER,
+        settings.EXECUTION_QUEUE_SIZE, settings.EXECUTION_QUEUE_TIMEOUT,
+        settings.EXECUTION_LANE_WEIGHTS, settings.EXECUTION_PLAN_WEIGHTS
+    )
+    return app
+
+def use_cassette(path, latency_scale):
+    """Serve provider calls from a recorded cassette instead of the fake LLM server"""
+    from utils.cassettes import configure_cassettes
+    configure_cassettes("replay", path, latency_scale)
+
+# Workload
+
+def sample_workflow(name):
+    def node(node_id, node_type, params):
+        return {"id": node_id, "type": node_type, "position": {"x": 0, "y": 0}, "data": {"params": params}}
+    return {
+        "name": name,
+        "description": "load test",
+        "nodes": [
+            node("input-0", "input", {"type": "Text", "nodeName": "input_0"}),
+            node("openai-0", "openai", {"model": "gpt-4o", "prompt": "Summarize: {{input}}", "system": "Be brief."}),
+            node("output-0", "output", {"type": "Text"}),
+        ],
+        "edges": [
+            {"id": "e1", "source": "input-0", "target": "openai-0"},
+            {"id": "e2", "source": "openai-0", "target": "output-0"},
+        ]
+    }
+
+class VirtualUser:
+    def __init__(self, client, index):
+        self.client = client
+        self.email = f"loadtest-{index}-{uuid.uuid4().hex[:8]}@example.com"
+        self.password = "load-test-password"
+        self.headers = {}
+        self.workflow_ids = []
+
+    async def setup(self):
+        await self.client.post("/api/auth/register", json={
+            "email": self.email, "password": self.password, "full_name": "Load Test"
+        })
+        await self.login()
+        response = await self.client.post("/api/workflows/", json=sample_workflow("load test"), headers=self.headers)
+        response.raise_for_status()
+        self.workflow_ids.append(response.json()["id"])
+
+    async def login(self):
+        response = await self.client.post("/api/auth/token", data={"username": self.email, "password": self.password})
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def list(self):
+        return await self.client.get("/api/workflows/", headers=self.headers)
+
+    async def get(self):
+        return await self.client.get(f"/api/workflows/{random.choice(self.workflow_ids)}", headers=self.headers)
+
+    async def save(self):
+        workflow = sample_workflow(f"load test {random.randint(0, 1000)}")
+        return await self.client.put(f"/api/workflows/{random.choice(self.workflow_ids)}", json=workflow, headers=self.headers)
+
+    async def execute(self):
+        return await self.client.post(
+            f"/api/workflows/{random.choice(self.workflow_ids)}/execute",
+            json={"inputs": {"input_0": {"value": "The quick brown fox jumps over the lazy dog.", "type": "Text"}}},
+            headers=self.headers
+        )
+
+async def user_loop(user, mix, deadline, samples):
+    operations, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        operation = random.choices(operations, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await getattr(user, operation)()
+            ok = response.status_code < 400 and not (
+                operation == "execute" and response.json().get("status") == "error"
+            )
+        except Exception:
+            ok = False
+        samples.append((operation, time.perf_counter() - start, ok))
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+def build_report(samples, elapsed, users):
+    report = {"users": users, "duration": elapsed, "operations": {}}
+    for operation in sorted({s[0] for s in samples}):
+        latencies = [s[1] for s in samples if s[0] == operation]
+        errors = sum(1 for s in samples if s[0] == operation and not s[2])
+        report["operations"][operation] = {
+            "count": len(latencies),
+            "errors": errors,
+            "throughput": len(latencies) / elapsed,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies),
+        }
+    report["total_throughput"] = len(samples) / elapsed
+    report["executions_per_second"] = report["operations"].get("execute", {}).get("throughput", 0.0)
+    return report
+
+def print_report(report):
+    print(f"\n{report['users']} users, {report['duration']:.1f}s")
+    print(f"{'operation':<10} {'count':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for operation, stats in report["operations"].items():
+        print(
+            f"{operation:<10} {stats['count']:>7} {stats['errors']:>7} {stats['throughput']:>8.1f} "
+            f"{stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f} {stats['max'] * 1000:>9.1f}"
+        )
+    print(f"\nTotal: {report['total_throughput']:.1f} req/s, executions: {report['executions_per_second']:.2f}/s")
+
+async def run_load(args):
+    import httpx
+
+    mix = {}
+    for part in args.mix.split(","):
+        operation, weight = part.split("=")
+        if operation not in ("login", "list", "get", "save", "execute"):
+            sys.exit(f"Unknown operation in mix: {operation}")
+        mix[operation] = float(weight)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        app = build_in_process_app()
+        if args.cassette:
+            use_cassette(args.cassette, args.cassette_scale)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=args.timeout)
+
+    async with client:
+        users = [VirtualUser(client, i) for i in range(args.users)]
+        await asyncio.gather(*(user.setup() for user in users))
+
+        samples = []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(user_loop(user, mix, deadline, samples) for user in users))
+        elapsed = time.perf_counter() - start
+
+    return build_report(samples, elapsed, args.users)
+
+def main():
+    parser = argparse.ArgumentParser(description="Workflow API load test")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run after setup")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--latency", default="lognormal:0.5:0.4", help="Fake LLM latency: fixed:S, uniform:LO:HI, lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--cassette", help="Replay provider calls from this recorded cassette file")
+    parser.add_argument("--cassette-scale", type=float, default=1.0, help="Multiplier for recorded latencies")
+    parser.add_argument("--url", help="Drive a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.url:
+        # Must be set before routers.nodes reads its module-level keys
+        os.environ["OPENAI_BASE_URL"] = start_fake_llm_server(parse_latency(args.latency))
+        os.environ.setdefault("OPENAI_API_KEY", "load-test")
+        import logging
+        logging.disable(logging.WARNING)
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     # MongoDB settings
@@ -43,6 +43,108 @@ class Settings(BaseSettings):
     AZURE_API_KEY: Optional[str] = None
     AZURE_ENDPOINT: Optional[str] = None
     
+    # Logging settings
+    LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "workflow_api.log"
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_JSON: bool = True
+    # Fraction of sub-WARNING records kept per logger prefix
+    LOG_SAMPLE_RATES: Dict[str, float] = {"workflow_api.engine": 0.1}
+    
+    # Tracing settings
+    TRACING_ENABLED: bool = True
+    TRACE_DIR: str = "traces"
+    # Fraction of executions traced, and how many trace files are kept (oldest deleted first)
+    TRACE_SAMPLE_RATE: float = 1.0
+    TRACE_MAX_FILES: int = 10000
+    
+    # Live intermediate node outputs above this size are spilled to disk (0 disables)
+    EXECUTION_MEMORY_LIMIT_MB: int = 256
+    EXECUTION_SPILL_DIR: Optional[str] = None  # Defaults to the system temp directory
+    
+    # Intermediate outputs of full executions kept for single-node runs to reuse: the
+    # largest output stored (0 disables) and how long an entry lasts
+    NODE_OUTPUT_CACHE_MAX_KB: int = 256
+    NODE_OUTPUT_CACHE_TTL: int = 7 * 24 * 3600
+    
+    # Compiled execution plans kept in memory, keyed by workflow ID and version
+    PLAN_CACHE_SIZE: int = 256
+    
+    # Most nodes of one execution (or one for-each element) running at once
+    EXECUTION_NODE_CONCURRENCY: int = 8
+    
+    # For-each nodes: elements run at once (params.concurrency overrides, up to the max)
+    FOR_EACH_CONCURRENCY: int = 4
+    FOR_EACH_MAX_CONCURRENCY: int = 16
+    FOR_EACH_MAX_ITEMS: int = 1000
+    
+    # Admission control for executions; EXECUTION_MAX_IN_FLIGHT <= 0 disables it
+    EXECUTION_MAX_IN_FLIGHT: int = 32
+    EXECUTION_MAX_PER_USER: int = 4
+    EXECUTION_QUEUE_SIZE: int = 64
+    EXECUTION_QUEUE_TIMEOUT: float = 10.0
+    # Fair-share weights for queued executions, by priority lane and by user plan
+    EXECUTION_LANE_WEIGHTS: Dict[str, int] = {"interactive": 8, "scheduled": 2, "batch": 1}
+    EXECUTION_PLAN_WEIGHTS: Dict[str, int] = {"free": 1, "pro": 4, "enterprise": 8}
+    
+    # Cron and interval schedules; one process at a time dispatches, holding a lease in Redis
+    SCHEDULER_ENABLED: bool = True
+    # Off only for single-process deployments: every process would dispatch
+    SCHEDULER_LEADER_ELECTION: bool = True
+    SCHEDULER_LEASE_TTL: float = 30.0
+    # How often the leader rereads schedules changed by other processes
+    SCHEDULER_REFRESH_INTERVAL: float = 15.0
+    # Runs later than this are misfires, handled by the schedule's misfire policy
+    SCHEDULER_MISFIRE_GRACE: float = 60.0
+    SCHEDULER_MAX_CATCH_UP: int = 10
+    SCHEDULER_MIN_INTERVAL: int = 60
+    
+    # Webhook triggers: deliveries go through a Redis stream and run in the batch lane
+    WEBHOOK_CONSUMER_ENABLED: bool = True
+    WEBHOOK_MAX_BYTES: int = 1024 * 1024
+    # Approximate cap on the stream; beyond it the oldest deliveries are trimmed, even if pending
+    WEBHOOK_STREAM_MAX_LENGTH: int = 100000
+    WEBHOOK_BATCH_SIZE: int = 100
+    # Deliveries of this process running at once
+    WEBHOOK_CONCURRENCY: int = 16
+    # Seconds a delivery stays pending before another consumer retries it
+    WEBHOOK_CLAIM_IDLE: float = 60.0
+    # Seconds an idempotency key is remembered
+    WEBHOOK_DEDUP_TTL: int = 86400
+    WEBHOOK_TOKEN_CACHE_TTL: float = 30.0
+    
+    # Seconds an execution Idempotency-Key is remembered, and a repeat waits for the first run to finish
+    IDEMPOTENCY_KEY_TTL: int = 86400
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 300.0
+    
+    # Event loop lag probe and slow-callback watchdog
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.1
+    # Blocking the loop longer than this logs the blocking stack
+    LOOP_SLOW_CALLBACK_THRESHOLD: float = 0.25
+    
+    # Process pool for CPU-bound node executors; workers default to the CPU count
+    CPU_POOL_ENABLED: bool = True
+    CPU_POOL_WORKERS: Optional[int] = None
+    CPU_POOL_TASK_TIMEOUT: float = 30.0
+    # str/bytes inputs and outputs at least this large go through shared memory
+    CPU_POOL_SHM_THRESHOLD: int = 1024 * 1024
+    
+    # Trace allocations with tracemalloc to report per-node peak bytes (adds overhead)
+    NODE_ALLOC_TRACKING: bool = False
+    
+    # Profiling: ?profile=cpu|alloc on execute is limited to these user emails
+    PROFILING_ALLOWED_USERS: List[str] = []
+    PROFILE_DIR: str = "profiles"
+    
+    # Provider record/replay: "record", "replay" or unset
+    PROVIDER_CASSETTE_MODE: Optional[str] = None
+    PROVIDER_CASSETTE_PATH: str = "cassettes/providers.jsonl"
+    # Multiplier for recorded latency on replay; 0 replays instantly
+    PROVIDER_REPLAY_LATENCY_SCALE: float = 1.0
+    
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,23 @@
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from main import app
+from models.user import User
+from routers.auth import get_current_user
+
+USER = User(id="65f000000000000000000001", email="owner@example.com", full_name="Owner")
+
+@pytest.fixture
+def api():
+    """Client for the app backed by in-memory Mongo and Redis, signed in as USER.
+
+    The lifespan doesn't run, so no scheduler, webhook consumer or pool is started.
+    """
+    app.mongodb_client = AsyncMongoMockClient()
+    app.mongodb = app.mongodb_client["flowmind_test"]
+    app.redis = fakeredis.FakeRedis(decode_responses=True)
+    app.dependency_overrides[get_current_user] = lambda: USER
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_current_user, None)
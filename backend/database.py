@@ -1,6 +1,72 @@
 from motor.motor_asyncio import AsyncIOMotorCollection
 from fastapi import FastAPI, Request
 from contextlib import asynccontextmanager
+from pymongo import monitoring
+from utils.metrics import MONGO_OPERATION_DURATION
+from utils.tracing import begin_span, KIND_CLIENT
+from config import settings
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """Record the duration of every MongoDB command the driver sends"""
+    
+    def __init__(self):
+        # request_id -> collection name; succeeded/failed events don't carry the command body
+        self._collections = {}
+    
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # getMore carries the cursor id under its command name
+            collection = event.command.get("collection", "")
+        self._collections[event.request_id] = collection
+    
+    def succeeded(self, event):
+        self._observe(event, "success")
+    
+    def failed(self, event):
+        self._observe(event, "error")
+    
+    def _observe(self, event, status):
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_OPERATION_DURATION.labels(event.command_name, collection, status).observe(event.duration_micros / 1e6)
+
+class MongoTracingListener(monitoring.CommandListener):
+    """Open a span for each MongoDB command issued inside a trace.
+    
+    Motor runs driver calls on executor threads with a copy of the caller's
+    context, so the current span here is the one that awaited the operation.
+    """
+    
+    def __init__(self):
+        self._spans = {}
+    
+    def started(self, event):
+        span = begin_span(f"mongo.{event.command_name}", kind=KIND_CLIENT, **{"db.name": event.database_name})
+        if span.trace_id is not None:
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                span.set_attribute("db.collection", collection)
+            self._spans[event.request_id] = span
+    
+    def succeeded(self, event):
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            span.end()
+    
+    def failed(self, event):
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            span.end(error=str(event.failure))
+
+async def ensure_indexes(db):
+    """Create the indexes the API's queries rely on; a no-op for those that already exist"""
+    # The scheduler loads enabled schedules by due time; the API lists them per workflow and owner
+    await db.workflow_schedules.create_index([("enabled", 1), ("next_run_at", 1)])
+    await db.workflow_schedules.create_index([("workflow_id", 1), ("user_id", 1)])
+    # Cached-output lookups take a workflow's newest executions for one user
+    await db.workflow_executions.create_index([("workflow_id", 1), ("user_id", 1), ("started_at", -1)])
+    # Released intermediate outputs expire on their own
+    await db.node_output_cache.create_index("updated_at", expireAfterSeconds=settings.NODE_OUTPUT_CACHE_TTL)
 
 async def get_user_collection(request: Request):
     return request.app.mongodb["users"]
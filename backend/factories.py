@@ -0,0 +1,19 @@
+"""Workflow graph builders shared by the test modules"""
+
+def node(node_id, node_type, **params):
+    return {"id": node_id, "type": node_type, "position": {"x": 0, "y": 0}, "data": {"params": params}}
+
+def edge(source, target, source_handle=None, target_handle=None):
+    return {
+        "id": f"{source}:{source_handle or 'output'}->{target}:{target_handle or 'input'}",
+        "source": source,
+        "target": target,
+        "sourceHandle": source_handle,
+        "targetHandle": target_handle
+    }
+
+def create_workflow(api, nodes, edges, name="w"):
+    """Save a workflow through the API and return its ID"""
+    response = api.post("/api/workflows/", json={"name": name, "nodes": nodes, "edges": edges})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
@@ -5,33 +5,85 @@ from redis import Redis
 from qdrant_client import QdrantClient
 from contextlib import asynccontextmanager
 from config import settings
-from routers import auth, workflows, users, nodes
+from utils.logging_setup import setup_logging, request_id_var
+from utils.metrics import HTTP_REQUEST_DURATION, render_metrics
+from utils.tracing import configure_tracing, shutdown_tracing
+from utils.cassettes import configure_cassettes
+from utils.process_pool import CPU_BOUND_EXECUTORS, start_cpu_pool, shutdown_cpu_pool
+from utils.loop_monitor import start_loop_monitor, stop_loop_monitor
+from utils.admission import configure_admission
+from utils.plans import configure_plan_cache
+from utils.scheduler import start_scheduler, stop_scheduler
+from utils.webhooks import HookTokenFilter, configure_webhook_tokens, redact_hook_path, start_webhook_consumer, stop_webhook_consumer
+from database import MongoMetricsListener, MongoTracingListener, ensure_indexes
+from routers import auth, workflows, users, nodes, hooks
 import uvicorn
 from starlette.middleware.sessions import SessionMiddleware
 import logging
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
+import asyncio
 import time
+import tracemalloc
+import uuid
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("workflow_api.log")
-    ]
+# Configure logging: records are queued and written by a background thread
+log_listener = setup_logging(
+    level=settings.LOG_LEVEL,
+    log_file=settings.LOG_FILE,
+    max_bytes=settings.LOG_MAX_BYTES,
+    backup_count=settings.LOG_BACKUP_COUNT,
+    queue_size=settings.LOG_QUEUE_SIZE,
+    json_format=settings.LOG_JSON,
+    sample_rates=settings.LOG_SAMPLE_RATES
 )
 logger = logging.getLogger("workflow_api")
+request_logger = logging.getLogger("workflow_api.requests")
+logging.getLogger("uvicorn.access").addFilter(HookTokenFilter())
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup operations
     logger.info("Starting Workflow Automation API")
+    configure_tracing(settings.TRACING_ENABLED, settings.TRACE_DIR, settings.TRACE_SAMPLE_RATE, settings.TRACE_MAX_FILES)
+    configure_cassettes(
+        settings.PROVIDER_CASSETTE_MODE,
+        settings.PROVIDER_CASSETTE_PATH,
+        settings.PROVIDER_REPLAY_LATENCY_SCALE
+    )
+    if settings.NODE_ALLOC_TRACKING:
+        tracemalloc.start()
+    configure_plan_cache(settings.PLAN_CACHE_SIZE)
+    configure_webhook_tokens(settings.WEBHOOK_TOKEN_CACHE_TTL)
+    configure_admission(
+        settings.EXECUTION_MAX_IN_FLIGHT,
+        settings.EXECUTION_MAX_PER_USER,
+        settings.EXECUTION_QUEUE_SIZE,
+        settings.EXECUTION_QUEUE_TIMEOUT,
+        settings.EXECUTION_LANE_WEIGHTS,
+        settings.EXECUTION_PLAN_WEIGHTS
+    )
+    if settings.LOOP_MONITOR_ENABLED:
+        start_loop_monitor(settings.LOOP_MONITOR_INTERVAL, settings.LOOP_SLOW_CALLBACK_THRESHOLD)
+    if settings.CPU_POOL_ENABLED and CPU_BOUND_EXECUTORS:
+        await asyncio.to_thread(
+            start_cpu_pool,
+            settings.CPU_POOL_WORKERS,
+            settings.CPU_POOL_TASK_TIMEOUT,
+            settings.CPU_POOL_SHM_THRESHOLD
+        )
     
     # MongoDB connection
-    app.mongodb_client = AsyncIOMotorClient(settings.MONGODB_URL)
+    app.mongodb_client = AsyncIOMotorClient(
+        settings.MONGODB_URL,
+        event_listeners=[MongoMetricsListener(), MongoTracingListener()]
+    )
     app.mongodb = app.mongodb_client[settings.MONGODB_DB_NAME]
+    try:
+        await ensure_indexes(app.mongodb)
+    except Exception as e:
+        # Queries still work without them, only slower
+        logger.error(f"Failed to create MongoDB indexes: {str(e)}")
     
     # Redis connection
     app.redis = Redis(
@@ -47,15 +99,44 @@ async def lifespan(app: FastAPI):
         api_key=settings.QDRANT_API_KEY
     )
     
+    if settings.SCHEDULER_ENABLED:
+        start_scheduler(
+            app.mongodb,
+            app.redis,
+            lambda schedule, scheduled_for: workflows.run_scheduled_execution(app.mongodb, schedule, scheduled_for),
+            settings.SCHEDULER_LEASE_TTL,
+            settings.SCHEDULER_REFRESH_INTERVAL,
+            settings.SCHEDULER_MISFIRE_GRACE,
+            settings.SCHEDULER_MAX_CATCH_UP,
+            settings.SCHEDULER_LEADER_ELECTION
+        )
+    if settings.WEBHOOK_CONSUMER_ENABLED:
+        start_webhook_consumer(
+            app.redis,
+            lambda delivery, delivery_id: workflows.run_webhook_execution(app.mongodb, delivery, delivery_id),
+            settings.WEBHOOK_BATCH_SIZE,
+            settings.WEBHOOK_CONCURRENCY,
+            settings.WEBHOOK_CLAIM_IDLE,
+            settings.WEBHOOK_DEDUP_TTL
+        )
+    
     yield
     
     # Shutdown operations
     logger.info("Shutting down Workflow Automation API")
+    await stop_scheduler()
+    await stop_webhook_consumer()
     
     # Cleanup
     app.mongodb_client.close()
     app.redis.close()
     app.qdrant.close()
+    shutdown_cpu_pool()
+    stop_loop_monitor()
+    
+    # Flush pending traces and queued log records
+    shutdown_tracing()
+    log_listener.stop()
 
 app = FastAPI(title="FlowMind AI API", lifespan=lifespan)
 
@@ -80,7 +161,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["*"]
+    expose_headers=["*", "ETag", "Retry-After"]  # "*" is not honoured for credentialed requests
 )
 
 # Add middleware for request logging and timing
@@ -88,24 +169,47 @@ app.add_middleware(
 async def log_requests(request: Request, call_next):
     start_time = time.time()
     
-    request_id = str(int(time.time() * 1000))
-    logger.info(f"Request {request_id} - {request.method} {request.url.path}")
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    request_logger.info("%s %s", request.method, redact_hook_path(request.url.path))
     
     try:
         response = await call_next(request)
         process_time = time.time() - start_time
-        logger.info(f"Request {request_id} completed in {process_time:.3f}s - Status: {response.status_code}")
+        request_logger.info(
+            "Completed in %.3fs - Status: %s", process_time, response.status_code,
+            extra={"status_code": response.status_code, "duration": process_time}
+        )
+        
+        HTTP_REQUEST_DURATION.labels(
+            request.method, route_template(request), response.status_code
+        ).observe(process_time)
         
-        # Add timing header to response
+        # Add timing and correlation headers to response
         response.headers["X-Process-Time"] = str(process_time)
+        response.headers["X-Request-ID"] = request_id
         return response
     except Exception as e:
         process_time = time.time() - start_time
+        HTTP_REQUEST_DURATION.labels(request.method, route_template(request), 500).observe(process_time)
         logger.error(f"Request {request_id} failed in {process_time:.3f}s: {str(e)}")
         return JSONResponse(
             status_code=500, 
             content={"detail": "Internal Server Error", "error": str(e)}
         )
+    finally:
+        request_id_var.reset(token)
+
+def route_template(request: Request) -> str:
+    """Route path template (e.g. /api/workflows/{workflow_id}) to keep metric label cardinality bounded"""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    # Rebuild the template from the matched path params; route.path alone lacks the router prefix
+    params = {str(value): name for name, value in request.path_params.items()}
+    return "/".join(
+        f"{{{params[segment]}}}" if segment in params else segment
+        for segment in request.url.path.split("/")
+    )
 
 # Add error handler for unhandled exceptions
 @app.exception_handler(Exception)
@@ -121,6 +225,13 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(workflows.router, prefix="/api/workflows", tags=["Workflows"])
 app.include_router(nodes.router, prefix="/api/nodes", tags=["Nodes"])
+# Called by third parties with a per-workflow token instead of a user login
+app.include_router(hooks.router, prefix="/hooks", tags=["Webhooks"])
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
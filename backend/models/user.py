@@ -18,6 +18,7 @@ class UserInDB(UserBase):
 
 class User(UserBase):
     id: str
+    plan: str = "free"  # free, pro or enterprise; sets the user's share of execution slots
 
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -12,6 +12,8 @@ class Edge(BaseModel):
     id: str
     source: str
     target: str
+    sourceHandle: Optional[str] = None  # Output field the edge reads, e.g. a condition's path_1
+    targetHandle: Optional[str] = None  # Input the value is bound to
     data: Optional[Dict[str, Any]] = None
 
 class WorkflowBase(BaseModel):
@@ -31,10 +33,36 @@ class Workflow(WorkflowBase):
     user_id: str
     created_at: datetime
     updated_at: datetime
+    version: int = 0
 
     class Config:
         from_attributes = True
 
+# Delta updates for incremental saves from the editor
+class NodeUpdate(BaseModel):
+    id: str
+    type: Optional[str] = None
+    position: Optional[Dict[str, float]] = None
+    data: Optional[Dict[str, Any]] = None
+
+class EdgeUpdate(BaseModel):
+    id: str
+    source: Optional[str] = None
+    target: Optional[str] = None
+    sourceHandle: Optional[str] = None
+    targetHandle: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+class WorkflowDelta(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    add_nodes: List[Node] = []
+    update_nodes: List[NodeUpdate] = []
+    remove_nodes: List[str] = []
+    add_edges: List[Edge] = []
+    update_edges: List[EdgeUpdate] = []
+    remove_edges: List[str] = []
+
 # New models for workflow execution
 class InputValue(BaseModel):
     value: Any
@@ -43,6 +71,14 @@ class InputValue(BaseModel):
 class WorkflowExecutionRequest(BaseModel):
     inputs: Dict[str, InputValue]
     mode: str = "standard"  # standard, chatbot, or voice
+    # Lazy mode runs only the nodes the output nodes depend on
+    lazy: bool = False
+    outputs: Optional[List[str]] = None  # Output node IDs to compute; implies lazy
+    # Node IDs whose intermediate outputs should be kept in node_results
+    keep_outputs: Optional[List[str]] = None
+    priority: str = "interactive"  # interactive, batch or scheduled; picks the admission lane
+    # Repeats with the same key get the first execution's result; the Idempotency-Key header takes precedence
+    idempotency_key: Optional[str] = None
 
 class NodeResult(BaseModel):
     output: Any
@@ -53,6 +89,16 @@ class NodeResult(BaseModel):
     node_id: Optional[str] = None
     node_name: Optional[str] = None
 
+class ExecutionUsage(BaseModel):
+    """Resources consumed by an execution, summed over its nodes"""
+    cpu_time: float = 0.0
+    wait_time: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    peak_alloc_bytes: Optional[int] = None  # Only with NODE_ALLOC_TRACKING
+
 class WorkflowExecutionResponse(BaseModel):
     outputs: Dict[str, NodeResult]
     execution_time: float
@@ -60,4 +106,38 @@ class WorkflowExecutionResponse(BaseModel):
     error: Optional[str] = None
     execution_path: List[str] = []  # List of node IDs in execution order
     execution_id: Optional[str] = None
-    node_results: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    node_results: Optional[Dict[str, Any]] = None
+    trace_id: Optional[str] = None
+    profile_url: Optional[str] = None
+    pruned_nodes: List[str] = []  # Node IDs skipped by lazy evaluation
+    skipped_nodes: List[str] = []  # Node IDs only reachable through condition branches not taken
+    usage: Optional[ExecutionUsage] = None
+
+class ScheduleCreate(BaseModel):
+    """A cron or interval schedule that runs a workflow with fixed inputs"""
+    cron: Optional[str] = None  # Five-field cron expression, in UTC
+    interval: Optional[int] = None  # Seconds between runs; one of cron or interval
+    inputs: Dict[str, InputValue] = {}
+    jitter: float = 0.0  # Each run starts up to this many seconds after its nominal time
+    misfire: str = "run-once"  # skip, run-once or catch-up: what to do with runs missed while no scheduler was up
+    enabled: bool = True
+
+class Schedule(ScheduleCreate):
+    id: str
+    workflow_id: str
+    next_run_at: datetime
+    last_run_at: Optional[datetime] = None
+    created_at: datetime
+
+class NodeRunResponse(BaseModel):
+    """Result of running a single node and only the subgraph it depends on"""
+    node_id: str
+    output: Any = None
+    status: str = "success"
+    error: Optional[str] = None
+    execution_time: float = 0.0  # Time spent in the target node itself
+    total_time: float = 0.0
+    execution_id: Optional[str] = None
+    executed_nodes: List[str] = []
+    cached_nodes: List[str] = []  # Upstream nodes whose output was reused from an earlier run
+    trace_id: Optional[str] = None
\ No newline at end of file
@@ -92,7 +92,8 @@ async def get_current_user(
         id=str(user["_id"]),
         email=user["email"],
         full_name=user.get("full_name", ""),
-        picture=user.get("picture", "")
+        picture=user.get("picture", ""),
+        plan=user.get("plan", "free")
     )
 
 @router.post("/token")
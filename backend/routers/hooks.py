@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException, Request, status
+from config import settings
+from utils.metrics import WEBHOOK_DELIVERIES
+from utils.webhooks import enqueue_delivery, get_webhook_tokens, token_matches
+import asyncio
+import logging
+
+logger = logging.getLogger("workflow_api")
+
+router = APIRouter()
+
+@router.post("/{workflow_id}/{token}", status_code=status.HTTP_202_ACCEPTED)
+async def receive_webhook(workflow_id: str, token: str, request: Request):
+    """Accept a webhook delivery; the workflow runs in the background.
+
+    An Idempotency-Key header makes redeliveries with the same key run once.
+    """
+    digest, user_id = await get_webhook_tokens().lookup(request.app.mongodb["workflows"], workflow_id)
+    if not token_matches(token, digest):
+        WEBHOOK_DELIVERIES.labels("unauthorized").inc()
+        # The same answer whether or not the workflow exists
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if declared > settings.WEBHOOK_MAX_BYTES:
+        raise payload_too_large()
+    # Content-Length may be absent (chunked) or wrong; stop reading once the limit is passed
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > settings.WEBHOOK_MAX_BYTES:
+            raise payload_too_large()
+    
+    delivery_id = await asyncio.to_thread(
+        enqueue_delivery,
+        request.app.redis,
+        workflow_id,
+        user_id,
+        bytes(body).decode("utf-8", errors="replace"),
+        request.headers.get("content-type", ""),
+        request.headers.get("idempotency-key", ""),
+        settings.WEBHOOK_STREAM_MAX_LENGTH
+    )
+    WEBHOOK_DELIVERIES.labels("accepted").inc()
+    return {"status": "accepted", "delivery_id": delivery_id}
+
+def payload_too_large() -> HTTPException:
+    WEBHOOK_DELIVERIES.labels("too_large").inc()
+    return HTTPException(status_code=413, detail=f"Webhook payloads are limited to {settings.WEBHOOK_MAX_BYTES} bytes")
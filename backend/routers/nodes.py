@@ -5,6 +5,10 @@ from typing import Dict, Any, Optional
 import logging
 import os
 import time
+from utils.metrics import MODEL_REQUEST_DURATION, MODEL_TOKENS
+from utils.tracing import start_span, KIND_CLIENT
+from utils.cassettes import get_cassette
+from utils.accounting import record_tokens
 
 # Initialize router
 router = APIRouter()
@@ -22,6 +26,17 @@ AWS_SECRET_KEY = os.environ.get("AWS_SECRET_KEY", "")
 AZURE_API_KEY = os.environ.get("AZURE_API_KEY", "")
 AZURE_ENDPOINT = os.environ.get("AZURE_ENDPOINT", "")
 
+AVAILABLE_MODELS = {
+    "openai": ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo", "gpt-4o"],
+    "anthropic": ["claude-3-haiku", "claude-3-sonnet", "claude-3-opus"],
+    "gemini": ["gemini-pro", "gemini-pro-vision", "gemini-flash"],
+    "cohere": ["command", "command-light", "command-plus", "command-r"],
+    "perplexity": ["sonar-small", "sonar-medium", "sonar-large"],
+    "xai": ["xai-chat"],
+    "aws": ["amazon-titan", "claude-3-sonnet", "claude-3-haiku"],
+    "azure": ["gpt-35-turbo", "gpt-4", "gpt-4-turbo"]
+}
+
 # Routes for model management
 @router.get("/models", response_model=Dict[str, Any])
 async def list_models(
@@ -29,16 +44,7 @@ async def list_models(
     current_user: User = Depends(get_current_user)
 ):
     """Get a list of available AI models for each provider"""
-    return {
-        "openai": ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo", "gpt-4o"],
-        "anthropic": ["claude-3-haiku", "claude-3-sonnet", "claude-3-opus"],
-        "gemini": ["gemini-pro", "gemini-pro-vision", "gemini-flash"],
-        "cohere": ["command", "command-light", "command-plus", "command-r"],
-        "perplexity": ["sonar-small", "sonar-medium", "sonar-large"],
-        "xai": ["xai-chat"],
-        "aws": ["amazon-titan", "claude-3-sonnet", "claude-3-haiku"],
-        "azure": ["gpt-35-turbo", "gpt-4", "gpt-4-turbo"]
-    }
+    return AVAILABLE_MODELS
 
 @router.post("/query/{provider}", response_model=Dict[str, Any])
 async def query_model(
@@ -55,26 +61,11 @@ async def query_model(
     logger.info(f"Processing {provider} model query: {request_data.get('model', 'unknown')}")
     
     try:
-        # Check provider and call appropriate handler
-        if provider == "openai":
-            response = await handle_openai_query(request_data)
-        elif provider == "anthropic":
-            response = await handle_anthropic_query(request_data)
-        elif provider == "gemini":
-            response = await handle_gemini_query(request_data)
-        elif provider == "cohere":
-            response = await handle_cohere_query(request_data)
-        elif provider == "perplexity":
-            response = await handle_perplexity_query(request_data)
-        elif provider == "xai":
-            response = await handle_xai_query(request_data)
-        elif provider == "aws":
-            response = await handle_aws_query(request_data)
-        elif provider == "azure":
-            response = await handle_azure_query(request_data)
-        else:
+        if provider not in MODEL_HANDLERS:
             raise HTTPException(status_code=400, detail=f"Unsupported provider: {provider}")
         
+        response = await query_provider(provider, request_data)
+        
         processing_time = time.time() - start_time
         
         # Log usage for billing/monitoring (in a real production app)
@@ -495,6 +486,45 @@ async def handle_azure_query(data: Dict[str, Any]) -> Dict[str, Any]:
         # If Azure OpenAI package is not installed, simulate response for testing
         return simulate_ai_response("azure")
 
+# Provider dispatch shared by the query endpoint and the workflow engine
+MODEL_HANDLERS = {
+    "openai": handle_openai_query,
+    "anthropic": handle_anthropic_query,
+    "gemini": handle_gemini_query,
+    "cohere": handle_cohere_query,
+    "perplexity": handle_perplexity_query,
+    "xai": handle_xai_query,
+    "aws": handle_aws_query,
+    "azure": handle_azure_query
+}
+
+async def query_provider(provider: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Call a provider handler (or the active cassette) and record its latency and token usage"""
+    start_time = time.time()
+    model = data.get("model", "unknown")
+    with start_span("provider.call", kind=KIND_CLIENT, **{"provider": provider, "model": model}) as span:
+        cassette = get_cassette()
+        if cassette is not None and cassette.mode == "replay":
+            span.set_attribute("cassette", "replay")
+            response = await cassette.replay(provider, data)
+        else:
+            response = await MODEL_HANDLERS[provider](data)
+            if cassette is not None:
+                await cassette.record(provider, data, response, time.time() - start_time)
+        span.set_attribute("tokens.input", response.get("input_tokens", 0))
+        span.set_attribute("tokens.output", response.get("output_tokens", 0))
+        if "error" in response:
+            span.set_attribute("error", response["error"])
+    record_model_metrics(
+        provider=provider,
+        model=model,
+        input_tokens=response.get("input_tokens", 0),
+        output_tokens=response.get("output_tokens", 0),
+        processing_time=time.time() - start_time
+    )
+    record_tokens(response.get("input_tokens", 0), response.get("output_tokens", 0))
+    return response
+
 # Helper function for testing when packages aren't installed
 def simulate_ai_response(provider: str) -> Dict[str, Any]:
     """Simulate an AI response for testing when the required package is not installed"""
@@ -504,6 +534,22 @@ def simulate_ai_response(provider: str) -> Dict[str, Any]:
         "output_tokens": 15
     }
 
+def record_model_metrics(
+    provider: str,
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    processing_time: float
+):
+    """Update the provider latency histogram and token counters"""
+    # The model comes from the request body; unknown names share one series so callers can't add series at will
+    model = model if model in AVAILABLE_MODELS.get(provider, ()) else "other"
+    MODEL_REQUEST_DURATION.labels(provider, model).observe(processing_time)
+    if input_tokens:
+        MODEL_TOKENS.labels(provider, model, "input").inc(input_tokens)
+    if output_tokens:
+        MODEL_TOKENS.labels(provider, model, "output").inc(output_tokens)
+
 # Logging function
 async def log_model_usage(
     user_id: str,
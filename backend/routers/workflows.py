@@ -1,39 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from models.workflow import Workflow, WorkflowCreate, WorkflowExecutionRequest, WorkflowExecutionResponse, NodeResult
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from models.workflow import Workflow, WorkflowCreate, WorkflowDelta, WorkflowExecutionRequest, WorkflowExecutionResponse, NodeResult, NodeRunResponse, Schedule, ScheduleCreate
 from models.user import User
 from routers.auth import get_current_user
 from database import get_workflow_collection
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import time
 import asyncio
+import heapq
+import json
 import logging
-from routers.nodes import (
-    handle_openai_query, 
-    handle_anthropic_query,
-    handle_gemini_query,
-    handle_cohere_query,
-    handle_perplexity_query,
-    handle_xai_query,
-    handle_aws_query,
-    handle_azure_query
+from routers.nodes import MODEL_HANDLERS, query_provider
+from utils.metrics import NODE_EXECUTION_DURATION, NODE_CPU_SECONDS, NODE_WAIT_SECONDS, NODE_BYTES, NODES_SKIPPED, NODES_CANCELLED, FOR_EACH_ITEMS, SCHEDULED_RUNS, EXECUTIONS_IN_FLIGHT
+from utils.accounting import NodeUsage, track_usage, summarize_usage, record_tokens, record_wait
+from utils.tracing import start_trace, start_span, load_trace, render_waterfall
+from utils.output_store import OutputStore, estimate_size
+from utils.process_pool import CPU_BOUND_EXECUTORS, run_cpu_bound
+from utils.admission import LANES, AdmissionRejected, admit_execution
+from utils.conditions import Condition, branch_handle, resolve_field
+from utils.merge import merge_quorum, merge_values
+from utils.progress import progress_listener, report_progress
+from utils.scheduler import MISFIRE_POLICIES, next_run, notify_scheduler, parse_cron
+from utils.webhooks import get_webhook_tokens, token_digest, webhook_inputs
+from utils.idempotency import MAX_KEY_LENGTH, IdempotencyConflict, claim_key, mark_finished, release_key, wait_for_execution
+from utils.plans import (
+    FOR_EACH_ITEM, PIPELINE, PIPELINE_INPUT, PIPELINE_OUTPUT, ExecutionPlan, compile_plan, compile_template, compute_node_fingerprints,
+    get_plan_cache, inline_pipelines, is_current, render_template
 )
+from utils import node_executors  # noqa: F401  registers the CPU-bound executors
+from utils.profiling import PROFILE_KINDS, ProfileBusy, profile_block, save_profile, load_profile
+from config import settings
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import AsyncExitStack
 import re
+import secrets
 
 logger = logging.getLogger("workflow_api")
+# Per-node and per-input lines are high volume and sampled (see LOG_SAMPLE_RATES)
+engine_logger = logging.getLogger("workflow_api.engine")
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Workflow])
 async def list_workflows(request: Request, current_user: User = Depends(get_current_user)):
     workflow_collection = await get_workflow_collection(request)
-    workflows = await workflow_collection.find({"user_id": str(current_user.id)}).to_list(None)
+    workflows = await workflow_collection.find({"user_id": str(current_user.id)}, {"plan": 0}).to_list(None)
     return [Workflow(**workflow, id=str(workflow["_id"])) for workflow in workflows]
 
 @router.post("/", response_model=Workflow, status_code=status.HTTP_201_CREATED)
 async def create_workflow(
     request: Request,
+    response: Response,
     workflow: WorkflowCreate,
     current_user: User = Depends(get_current_user)
 ):
@@ -42,25 +63,42 @@ async def create_workflow(
         **workflow.dict(),
         "user_id": str(current_user.id),
         "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "updated_at": datetime.utcnow(),
+        "version": 1
     }
-    result = await workflow_collection.insert_one(workflow_data)
-    created_workflow = await workflow_collection.find_one({"_id": result.inserted_id})
-    return Workflow(**created_workflow, id=str(created_workflow["_id"]))
+    workflow_data["plan"] = compile_plan(workflow_data["nodes"], workflow_data["edges"])
+    # insert_one stores the generated _id on workflow_data, so no re-read is needed
+    await workflow_collection.insert_one(workflow_data)
+    response.headers["ETag"] = workflow_etag(workflow_data)
+    return Workflow(**workflow_data, id=str(workflow_data["_id"]))
 
 @router.get("/{workflow_id}", response_model=Workflow)
 async def get_workflow(
     workflow_id: str,
     request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
     workflow_collection = await get_workflow_collection(request)
-    workflow = await workflow_collection.find_one({
+    query = {
         "_id": ObjectId(workflow_id),
         "user_id": str(current_user.id)
-    })
+    }
+    
+    # Conditional GET: compare against the stored version before loading the full graph
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        current = await workflow_collection.find_one(query, {"version": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+        etag = workflow_etag(current)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    workflow = await workflow_collection.find_one(query, {"plan": 0})
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
+    response.headers["ETag"] = workflow_etag(workflow)
     return Workflow(**workflow, id=str(workflow["_id"]))
 
 @router.put("/{workflow_id}", response_model=Workflow)
@@ -68,29 +106,87 @@ async def update_workflow(
     workflow_id: str,
     workflow_update: WorkflowCreate,
     request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
     workflow_collection = await get_workflow_collection(request)
-    workflow = await workflow_collection.find_one({
+    query = {
         "_id": ObjectId(workflow_id),
         "user_id": str(current_user.id)
-    })
-    if not workflow:
-        raise HTTPException(status_code=404, detail="Workflow not found")
+    }
+    expected_version = get_expected_version(request, workflow_id)
+    if expected_version is not None:
+        query.update(version_filter(expected_version))
     
     update_data = {
         **workflow_update.dict(),
         "updated_at": datetime.utcnow()
     }
+    # Written in the same update as the graph, so a stored plan always matches it
+    update_data["plan"] = compile_plan(update_data["nodes"], update_data["edges"])
     
-    await workflow_collection.update_one(
-        {"_id": ObjectId(workflow_id)},
-        {"$set": update_data}
+    updated_workflow = await workflow_collection.find_one_and_update(
+        query,
+        {"$set": update_data, "$inc": {"version": 1}},
+        projection={"plan": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if not updated_workflow:
+        await raise_update_failure(workflow_collection, workflow_id, current_user)
     
-    updated_workflow = await workflow_collection.find_one({"_id": ObjectId(workflow_id)})
+    response.headers["ETag"] = workflow_etag(updated_workflow)
     return Workflow(**updated_workflow, id=str(updated_workflow["_id"]))
 
+@router.patch("/{workflow_id}", response_model=Workflow)
+async def patch_workflow(
+    workflow_id: str,
+    delta: WorkflowDelta,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """Apply node/edge deltas to a workflow instead of re-sending the whole graph.
+
+    The delta is applied to the stored document and written back in a single
+    update guarded on the version that was read, so it lands whole or not at all.
+    """
+    workflow_collection = await get_workflow_collection(request)
+    query = {
+        "_id": ObjectId(workflow_id),
+        "user_id": str(current_user.id)
+    }
+    expected_version = get_expected_version(request, workflow_id)
+    if expected_version is not None:
+        query.update(version_filter(expected_version))
+    
+    for _ in range(PATCH_ATTEMPTS):
+        workflow = await workflow_collection.find_one(query, {"plan": 0})
+        if not workflow:
+            await raise_update_failure(workflow_collection, workflow_id, current_user)
+        changes = apply_delta(workflow, delta)
+        if not changes:
+            # Empty delta: nothing to write, but If-Match was still honoured
+            response.headers["ETag"] = workflow_etag(workflow)
+            return Workflow(**workflow, id=str(workflow["_id"]))
+        
+        changes["updated_at"] = datetime.utcnow()
+        # Written in the same update as the graph, so a stored plan always matches it
+        changes["plan"] = compile_plan(changes.get("nodes", workflow.get("nodes", [])), changes.get("edges", workflow.get("edges", [])))
+        updated_workflow = await workflow_collection.find_one_and_update(
+            {**query, **version_filter(workflow.get("version", 0))},
+            {"$set": changes, "$inc": {"version": 1}},
+            projection={"plan": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated_workflow:
+            response.headers["ETag"] = workflow_etag(updated_workflow)
+            return Workflow(**updated_workflow, id=str(updated_workflow["_id"]))
+        if expected_version is not None:
+            await raise_update_failure(workflow_collection, workflow_id, current_user)
+        # An unconditional patch lost a race with another save; apply it to the new version
+    
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Workflow is being modified concurrently; retry the save")
+
 @router.delete("/{workflow_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_workflow(
     workflow_id: str,
@@ -104,6 +200,11 @@ async def delete_workflow(
     })
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Workflow not found")
+    # Its schedules would only fail from now on
+    schedules = await request.app.mongodb.workflow_schedules.delete_many({"workflow_id": workflow_id})
+    if schedules.deleted_count:
+        notify_scheduler()
+    get_webhook_tokens().invalidate(workflow_id)
 
 @router.post("/{workflow_id}/clone", response_model=Workflow)
 async def clone_workflow(
@@ -124,11 +225,17 @@ async def clone_workflow(
         "_id": ObjectId(),
         "name": f"{workflow['name']} (Copy)",
         "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "updated_at": datetime.utcnow(),
+        "version": 1
     }
+    # A copy gets its own webhook token, if any
+    workflow_data.pop("webhook", None)
+    
+    if not is_current(workflow_data.get("plan")):
+        workflow_data["plan"] = compile_plan(workflow_data.get("nodes", []), workflow_data.get("edges", []))
     
     result = await workflow_collection.insert_one(workflow_data)
-    created_workflow = await workflow_collection.find_one({"_id": result.inserted_id})
+    created_workflow = await workflow_collection.find_one({"_id": result.inserted_id}, {"plan": 0})
     return Workflow(**created_workflow, id=str(created_workflow["_id"]))
 
 @router.get("/{workflow_id}/export")
@@ -138,16 +245,17 @@ async def export_workflow(
     current_user: User = Depends(get_current_user)
 ):
     workflow_collection = await get_workflow_collection(request)
-    workflow = await workflow_collection.find_one({
-        "_id": ObjectId(workflow_id),
-        "user_id": str(current_user.id)
-    })
+    workflow = await workflow_collection.find_one(
+        {"_id": ObjectId(workflow_id), "user_id": str(current_user.id)},
+        {"plan": 0}
+    )
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
     # Remove internal fields before export
     workflow.pop("_id", None)
     workflow.pop("user_id", None)
+    workflow.pop("webhook", None)
     return workflow
 
 @router.post("/{workflow_id}/execute", response_model=WorkflowExecutionResponse)
@@ -155,38 +263,241 @@ async def execute_workflow(
     workflow_id: str,
     execution_request: WorkflowExecutionRequest,
     request: Request,
+    response: Response,
+    profile: Optional[str] = None,
+    stream: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Execute a workflow with the given inputs"""
+    """Execute a workflow with the given inputs; ?profile=cpu|alloc profiles this one run.
+
+    ?stream=true answers with server-sent events: progress events as the run
+    goes, then the execution response as a result event.
+
+    With an Idempotency-Key header (or idempotency_key field), repeats of the
+    request get the first execution's result instead of running again.
+    """
+    if execution_request.priority not in LANES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(LANES)}")
+    if stream and profile is not None:
+        raise HTTPException(status_code=400, detail="stream and profile can't be combined")
+    idempotency_key = request.headers.get("idempotency-key") or execution_request.idempotency_key
+    if idempotency_key and profile is not None:
+        raise HTTPException(status_code=400, detail="profile can't be combined with an Idempotency-Key")
+    if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key is limited to {MAX_KEY_LENGTH} characters")
+    
+    claim = None
+    if idempotency_key:
+        user_id = str(current_user.id)
+        try:
+            execution_id, claimed = await asyncio.to_thread(
+                claim_key, request.app.redis, user_id, workflow_id, idempotency_key,
+                jsonable_encoder(execution_request), settings.IDEMPOTENCY_KEY_TTL
+            )
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not claimed:
+            # A repeat: answer with the first request's execution, however it ended
+            result = await replay_execution(request.app.mongodb, execution_id)
+            response.headers["Idempotent-Replayed"] = "true"
+            if stream:
+                return StreamingResponse(
+                    iter([sse_event("result", result)]),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "Idempotent-Replayed": "true"}
+                )
+            return result
+        claim = (user_id, idempotency_key, execution_id)
+    
+    try:
+        if stream:
+            return await stream_workflow(workflow_id, execution_request, request, current_user, claim)
+        async with admit_execution(str(current_user.id), execution_request.priority, current_user.plan):
+            if profile is not None:
+                return await profile_workflow(workflow_id, execution_request, request, current_user, profile)
+            with start_trace("workflow.execute", **{"workflow.id": workflow_id, "user.id": str(current_user.id)}) as trace_span:
+                return await run_workflow(
+                    workflow_id, execution_request, request.app.mongodb, current_user, trace_span.trace_id,
+                    execution_id=claim[2] if claim else None
+                )
+    except AdmissionRejected as e:
+        if claim:
+            await release_claim(request, workflow_id, claim)
+        raise too_busy(e)
+    except BaseException:
+        # Rejected or failed before running, or the client went away; let a retry run it
+        if claim:
+            await release_claim(request, workflow_id, claim)
+        raise
+
+async def release_claim(request: Request, workflow_id: str, claim: Tuple[str, str, ObjectId]):
+    user_id, idempotency_key, execution_id = claim
+    await asyncio.to_thread(release_key, request.app.redis, user_id, workflow_id, idempotency_key, execution_id)
+    mark_finished(execution_id)
+
+async def replay_execution(db, execution_id: ObjectId) -> WorkflowExecutionResponse:
+    """The response of a finished execution, rebuilt from its record"""
+    execution = await wait_for_execution(db.workflow_executions, execution_id, settings.IDEMPOTENCY_WAIT_TIMEOUT)
+    if execution is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Execution {execution_id} for this Idempotency-Key is still running; retry later"
+        )
+    if execution["status"] == "cancelled":
+        # Its key was released, so a retry runs the workflow afresh
+        raise HTTPException(
+            status_code=409,
+            detail=f"Execution {execution_id} for this Idempotency-Key was cancelled; retry to run it again"
+        )
+    node_results = execution.get("node_results") or {}
+    return WorkflowExecutionResponse(
+        execution_id=str(execution_id),
+        outputs=execution.get("outputs") or {},
+        execution_time=execution.get("execution_time", 0.0),
+        status="success" if execution["status"] == "completed" else "error",
+        error=execution.get("error"),
+        execution_path=execution.get("execution_path", []),
+        node_results=node_results,
+        trace_id=execution.get("trace_id"),
+        pruned_nodes=execution.get("pruned_nodes", []),
+        skipped_nodes=skipped_node_ids(node_results),
+        usage=execution.get("usage")
+    )
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def stream_workflow(
+    workflow_id: str,
+    execution_request: WorkflowExecutionRequest,
+    request: Request,
+    current_user: User,
+    claim: Optional[Tuple[str, str, ObjectId]] = None
+) -> StreamingResponse:
+    """Start an execution in the background and stream its progress as server-sent events.
+
+    The execution slot is taken before responding, so a busy server still
+    answers 429. The execution runs to completion even if the client goes away.
+    """
+    admission = AsyncExitStack()
+    await admission.enter_async_context(
+        admit_execution(str(current_user.id), execution_request.priority, current_user.plan)
+    )
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def execute():
+        try:
+            async with admission:
+                with progress_listener(events.put_nowait):
+                    with start_trace("workflow.execute", **{"workflow.id": workflow_id, "user.id": str(current_user.id)}) as trace_span:
+                        return await run_workflow(
+                            workflow_id, execution_request, request.app.mongodb, current_user, trace_span.trace_id,
+                            execution_id=claim[2] if claim else None
+                        )
+        except BaseException:
+            if claim:
+                await release_claim(request, workflow_id, claim)
+            raise
+
+    task = asyncio.create_task(execute())
+    # Every progress event is queued before the task finishes, so None comes last
+    task.add_done_callback(lambda _: events.put_nowait(None))
+
+    async def event_stream():
+        while (event := await events.get()) is not None:
+            yield sse_event("progress", event)
+        try:
+            yield sse_event("result", task.result())
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Streamed execution of workflow {workflow_id} failed: {str(e)}", exc_info=True)
+            yield sse_event("error", {"status_code": 500, "detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def too_busy(rejection: AdmissionRejected) -> HTTPException:
+    """429 telling the client when to retry"""
+    logger.warning(f"Execution rejected: {rejection.reason}")
+    return HTTPException(
+        status_code=429,
+        detail="Too many executions in progress, retry later",
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+async def profile_workflow(
+    workflow_id: str,
+    execution_request: WorkflowExecutionRequest,
+    request: Request,
+    current_user: User,
+    kind: str
+):
+    """Run one execution under a profiler and store the profile next to its execution record"""
+    if kind not in PROFILE_KINDS:
+        raise HTTPException(status_code=400, detail=f"profile must be one of: {', '.join(PROFILE_KINDS)}")
+    if current_user.email not in settings.PROFILING_ALLOWED_USERS:
+        raise HTTPException(status_code=403, detail="Not allowed to profile executions")
+    
+    try:
+        with profile_block(kind) as profile:
+            with start_trace("workflow.execute", **{"workflow.id": workflow_id, "user.id": str(current_user.id)}) as trace_span:
+                response = await run_workflow(workflow_id, execution_request, request.app.mongodb, current_user, trace_span.trace_id)
+    except ProfileBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    await asyncio.to_thread(save_profile, settings.PROFILE_DIR, response.execution_id, profile)
+    await request.app.mongodb.workflow_executions.update_one(
+        {"_id": ObjectId(response.execution_id)},
+        {"$set": {"profile": {"kind": kind, "duration": profile.duration, **profile.summary}}}
+    )
+    logger.info(f"Stored {kind} profile for execution {response.execution_id}")
+    
+    profile_url = request.url_for("get_execution_profile", workflow_id=workflow_id, execution_id=response.execution_id)
+    response.profile_url = f"{profile_url}?kind={kind}"
+    return response
+
+async def run_workflow(
+    workflow_id: str,
+    execution_request: WorkflowExecutionRequest,
+    db,
+    current_user: User,
+    trace_id: Optional[str] = None,
+    trigger: Optional[Dict[str, Any]] = None,
+    execution_id: Optional[ObjectId] = None
+):
+    """Run a workflow and record the execution; called inside the execution's trace.
+
+    trigger describes what started a run other than an API call, such as a
+    schedule, and is stored on the execution. execution_id is the ID to record
+    it under, when one was reserved for an idempotency key.
+    """
     logger.info(f"Starting workflow execution: {workflow_id}")
     
     # Start execution timer
     start_time = time.time()
     
-    # Find the workflow
-    workflow_collection = await get_workflow_collection(request)
-    workflow = await workflow_collection.find_one({
-        "_id": ObjectId(workflow_id),
-        "user_id": str(current_user.id)
-    })
+    # Load the compiled plan rather than the workflow document
+    plan = await load_execution_plan(db["workflows"], workflow_id, str(current_user.id))
+    output_ids = [node.id for node in plan.nodes if node.type == "output"]
     
-    if not workflow:
-        logger.warning(f"Workflow not found: {workflow_id}")
-        raise HTTPException(status_code=404, detail="Workflow not found")
-    
-    # Extract nodes and edges
-    nodes = workflow.get("nodes", [])
-    edges = workflow.get("edges", [])
+    # In lazy mode, drop every node the requested outputs don't depend on
+    pruned_nodes = []
+    if execution_request.lazy or execution_request.outputs is not None:
+        targets = execution_request.outputs if execution_request.outputs is not None else output_ids
+        unknown = [node_id for node_id in targets if node_id not in output_ids]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Not output nodes of this workflow: {', '.join(unknown)}")
+        plan, pruned_nodes = plan.prune(targets)
+        if pruned_nodes:
+            logger.info(f"Lazy execution pruned {len(pruned_nodes)} of {len(plan.nodes) + len(pruned_nodes)} nodes")
     
     # Log input node types for debugging
-    input_nodes = [node for node in nodes if node.get("type") == "input"]
-    for node in input_nodes:
-        node_id = node.get("id", "unknown")
-        node_type = node.get("data", {}).get("params", {}).get("type", "unknown")
-        logger.info(f"Input node {node_id} has type: {node_type}")
+    for node in plan.nodes:
+        if node.type == "input":
+            engine_logger.debug("Input node %s has type: %s", node.id, node.params.get("type", "unknown"))
         
     # Log incoming input values
-    logger.info(f"Execution inputs: {execution_request.inputs}")
+    engine_logger.debug("Execution inputs: %s", execution_request.inputs)
     
     # Record execution in the database
     execution_log = {
@@ -194,121 +505,42 @@ async def execute_workflow(
         "user_id": str(current_user.id),
         "started_at": datetime.utcnow(),
         "inputs": execution_request.dict(),
-        "status": "in_progress"
+        "status": "in_progress",
+        "trace_id": trace_id,
+        "pruned_nodes": pruned_nodes,
+        "node_fingerprints": compute_node_fingerprints(plan, execution_request.inputs, execution_request.mode)
     }
+    if trigger is not None:
+        execution_log["trigger"] = trigger
+    if execution_id is not None:
+        execution_log["_id"] = execution_id
     
-    executions_collection = request.app.mongodb.workflow_executions
+    executions_collection = db.workflow_executions
     execution_result = await executions_collection.insert_one(execution_log)
     execution_id = str(execution_result.inserted_id)
     logger.info(f"Created execution log: {execution_id}")
     
+    node_results = {}
+    # Released intermediate outputs stay reusable by single-node runs
+    output_cache = ReleasedOutputCache(
+        db.node_output_cache, workflow_id, str(current_user.id), execution_log["node_fingerprints"],
+        settings.NODE_OUTPUT_CACHE_MAX_KB * 1024
+    )
+    EXECUTIONS_IN_FLIGHT.labels().inc()
     try:
-        # Calculate execution order (topological sort)
-        if not nodes:
-            logger.warning("No nodes found in workflow")
-            execution_order = []
-            execution_path = []
-        else:
-            execution_order = calculate_execution_order(nodes, edges)
-            execution_path = [node["id"] for node in execution_order]
-            
-        # If execution_order is empty but we have nodes, add them all in a sensible order
-        if not execution_order and nodes:
-            logger.warning("No execution order determined, falling back to basic order")
-            # Prioritize inputs first, then processing nodes, then outputs
-            input_nodes = [node for node in nodes if node["type"] == "input"]
-            output_nodes = [node for node in nodes if node["type"] == "output"]
-            other_nodes = [node for node in nodes if node["type"] not in ["input", "output"]]
-            
-            execution_order = input_nodes + other_nodes + output_nodes
-            execution_path = [node["id"] for node in execution_order]
-        
-        logger.info(f"Execution order: {execution_path}")
-        
-        # Initialize node outputs, results and detailed execution stats
-        node_outputs = {}
-        results = {}
-        node_results = {}
-        
-        # Process each node in order
-        for i, node in enumerate(execution_order):
-            node_id = node["id"]
-            node_type = node["type"]
-            node_data = node.get("data", {})
-            
-            logger.info(f"Executing node {i+1}/{len(execution_order)}: {node_id} ({node_type})")
-            
-            # Get inputs for this node
-            node_inputs = get_node_inputs(node_id, edges, node_outputs, execution_request.inputs, nodes)
-            
-            # Record node execution start
-            node_start_time = time.time()
-            
-            try:
-                # Execute the node based on its type
-                output = await execute_node(node_type, node_data, node_inputs, execution_request.mode)
-                node_execution_time = time.time() - node_start_time
-                
-                # Store the output and node result
-                node_outputs[node_id] = output
-                node_results[node_id] = {
-                    "status": "success",
-                    "execution_time": node_execution_time,
-                    "output": output
-                }
-                
-                # Log successful node execution
-                logger.info(f"Node {node_id} executed successfully in {node_execution_time:.3f}s")
-                
-                # If this is an output node, add to results
-                if node_type == "output":
-                    output_key = f"output_{node_id.split('-')[1] if '-' in node_id else '0'}"
-                    results[output_key] = NodeResult(
-                        output=output.get("output", ""),
-                        type=node_data.get("params", {}).get("type", "Text"),
-                        execution_time=node_execution_time,
-                        status="success",
-                        node_id=node_id,
-                        node_name=node_data.get("params", {}).get("nodeName", node_type)
-                    )
-            
-            except Exception as e:
-                # Log node execution error
-                node_execution_time = time.time() - node_start_time
-                error_message = str(e)
-                logger.error(f"Error executing node {node_id}: {error_message}")
-                
-                # Record node error
-                node_results[node_id] = {
-                    "status": "error",
-                    "execution_time": node_execution_time,
-                    "error": error_message
-                }
-                
-                # Add error to results if it's an output node
-                if node_type == "output":
-                    output_key = f"output_{node_id.split('-')[1] if '-' in node_id else '0'}"
-                    results[output_key] = NodeResult(
-                        output="",
-                        type=node_data.get("params", {}).get("type", "Text"),
-                        execution_time=node_execution_time,
-                        status="error",
-                        error=error_message,
-                        node_id=node_id,
-                        node_name=node_data.get("params", {}).get("nodeName", node_type)
-                    )
-                
-                # If it's not the last node, we should consider stopping execution
-                if i < len(execution_order) - 1:
-                    # Check if this node's output is required for any downstream nodes
-                    next_nodes = get_dependent_nodes(node_id, edges, execution_order[i+1:])
-                    if next_nodes:
-                        # If there are dependent nodes, we can't continue
-                        logger.warning(f"Stopping execution after node {node_id} due to error")
-                        raise Exception(f"Error in node {node_id}: {error_message}")
+        retained = set(output_ids)
+        retained.update(execution_request.keep_outputs or [])
+        try:
+            execution_path, results = await execute_graph(
+                plan, execution_request.inputs, execution_request.mode, node_results, retained=retained,
+                on_release=output_cache.add
+            )
+        finally:
+            await output_cache.flush()
         
         # Calculate total execution time
         total_execution_time = time.time() - start_time
+        usage = execution_usage(node_results)
         logger.info(f"Workflow executed successfully in {total_execution_time:.3f}s")
         
         # Update execution log in database
@@ -319,7 +551,9 @@ async def execute_workflow(
                 "execution_time": total_execution_time,
                 "status": "completed",
                 "outputs": {k: v.dict() for k, v in results.items()},
-                "node_results": node_results
+                "execution_path": execution_path,
+                "node_results": node_results,
+                "usage": usage
             }}
         )
         
@@ -330,7 +564,11 @@ async def execute_workflow(
             execution_time=total_execution_time,
             status="success",
             execution_path=execution_path,
-            node_results=node_results
+            node_results=node_results,
+            trace_id=trace_id,
+            pruned_nodes=pruned_nodes,
+            skipped_nodes=skipped_node_ids(node_results),
+            usage=usage
         )
         
     except Exception as e:
@@ -338,6 +576,7 @@ async def execute_workflow(
         logger.error(f"Error executing workflow: {str(e)}", exc_info=True)
         
         # Update execution log with error
+        usage = execution_usage(node_results)
         await executions_collection.update_one(
             {"_id": ObjectId(execution_id)},
             {"$set": {
@@ -345,7 +584,8 @@ async def execute_workflow(
                 "execution_time": time.time() - start_time,
                 "status": "error",
                 "error": str(e),
-                "node_results": node_results
+                "node_results": node_results,
+                "usage": usage
             }}
         )
         
@@ -356,9 +596,733 @@ async def execute_workflow(
             execution_time=time.time() - start_time,
             status="error",
             error=str(e),
-            node_results=node_results
+            node_results=node_results,
+            trace_id=trace_id,
+            pruned_nodes=pruned_nodes,
+            skipped_nodes=skipped_node_ids(node_results),
+            usage=usage
+        )
+    except asyncio.CancelledError:
+        # Client gone or shutting down; don't leave the record in_progress for idempotent repeats to wait on.
+        # Shielded so a second cancellation can't interrupt the write
+        logger.warning(f"Execution {execution_id} of workflow {workflow_id} was cancelled")
+        await asyncio.shield(executions_collection.update_one(
+            {"_id": ObjectId(execution_id)},
+            {"$set": {
+                "completed_at": datetime.utcnow(),
+                "execution_time": time.time() - start_time,
+                "status": "cancelled",
+                "error": "Execution was cancelled",
+                "node_results": node_results,
+                "usage": execution_usage(node_results)
+            }}
+        ))
+        raise
+    finally:
+        EXECUTIONS_IN_FLIGHT.labels().dec()
+        mark_finished(execution_id)
+
+async def execute_graph(plan, inputs, mode, node_results, cached_outputs=None, retained=None, on_release=None):
+    """Execute a compiled plan and return (execution_path, output results).
+    
+    Per-node status is recorded into node_results as the run progresses, so the
+    caller still has it when a node failure aborts the run. Nodes found in
+    cached_outputs are not executed; their cached output is passed downstream.
+    
+    Only nodes in retained (default: all) keep their output in node_results;
+    other outputs are released as soon as their last consumer has read them,
+    and passed to on_release(node_id, output) if given.
+    """
+    if plan.error:
+        raise ValueError(plan.error)
+    if not plan.nodes:
+        logger.warning("No nodes found in workflow")
+    execution_path = list(plan.ids)
+    engine_logger.info("Execution order: %s", execution_path)
+
+    # The engine addresses nodes by plan index from here on
+    if retained is None:
+        retained_flags = [True] * len(plan.nodes)
+    else:
+        retained_flags = [node_id in retained for node_id in plan.ids]
+    cached = {}
+    if cached_outputs:
+        cached = {plan.index[node_id]: output for node_id, output in cached_outputs.items() if node_id in plan.index}
+
+    # The plan counts the edges reading each node's output so it can be released after the last one
+    node_outputs = OutputStore(
+        plan.ids, [node.consumers for node in plan.nodes], retained_flags,
+        memory_limit=settings.EXECUTION_MEMORY_LIMIT_MB * 1024 * 1024,
+        spill_dir=settings.EXECUTION_SPILL_DIR,
+        on_release=(lambda index, output: on_release(plan.ids[index], output)) if on_release else None
+    )
+    results = {}
+    try:
+        await run_nodes(plan.nodes, inputs, mode, node_results, cached, retained_flags, node_outputs, results)
+    finally:
+        node_outputs.close()
+    engine_logger.info(
+        "Released %d node outputs, spilled %d, peak %d bytes",
+        len(node_outputs.released), node_outputs.spill_count, node_outputs.peak_bytes
+    )
+    return execution_path, results
+
+# Scheduler states of a plan node during one run
+WAITING, READY, RUNNING, DONE, SKIPPED, FAILED, CANCELLED = range(7)
+
+async def run_nodes(nodes, inputs, mode, node_results, cached_outputs, retained, node_outputs, results):
+    """Run the plan's nodes as their inputs arrive, passing outputs downstream through node_outputs.
+
+    cached_outputs maps plan indices to reusable outputs and retained[i] says
+    whether node i keeps its output in node_results.
+
+    A node starts once every incoming edge has resolved, so independent
+    branches run concurrently, up to EXECUTION_NODE_CONCURRENCY nodes at a
+    time and earlier plan nodes first. A wait-first or quorum merge starts as
+    soon as enough inputs have arrived; upstream nodes that nothing else still
+    needs are then cancelled. A node whose every incoming edge comes from a
+    skipped node or from a condition path that wasn't taken is skipped without
+    running.
+    """
+    count = len(nodes)
+    state = [WAITING] * count
+    # (consumer index, position in its sources) for every edge leaving each node
+    consumers_of = [[] for _ in range(count)]
+    for node in nodes:
+        for position, (source, _, _) in enumerate(node.sources):
+            consumers_of[source].append((node.index, position))
+    # Incoming edges not resolved yet, and outgoing edges whose consumer still wants them
+    remaining = [len(node.sources) for node in nodes]
+    demand = [len(edges) for edges in consumers_of]
+    resolved = [set() for _ in range(count)]
+    # Positions of resolved edges that carry a value, and of those whose value is usable, in arrival order
+    live = [[] for _ in range(count)]
+    arrived = [[] for _ in range(count)]
+    quorum = [merge_quorum(node.params) if node.type == "merge" else None for node in nodes]
+    # Plan index of each condition node run so far -> handle of the path it took, or None
+    branches = {}
+    ready = [node.index for node in nodes if not node.sources]
+    for i in ready:
+        state[i] = READY
+    running: Dict[asyncio.Task, int] = {}
+    tasks: Dict[int, asyncio.Task] = {}
+    failure = None
+
+    def is_dead(source, output_field):
+        return state[source] in (SKIPPED, CANCELLED) or (
+            source in branches and output_field.startswith("path_") and output_field != branches[source]
         )
 
+    def record_output_result(node, status_value, output="", execution_time=0.0, error=None):
+        if node.type == "output":
+            output_key = f"output_{node.id.split('-')[1] if '-' in node.id else '0'}"
+            results[output_key] = NodeResult(
+                output=output,
+                type=node.params.get("type", "Text"),
+                execution_time=execution_time,
+                status=status_value,
+                error=error,
+                node_id=node.id,
+                node_name=node.params.get("nodeName", node.type)
+            )
+
+    def finish(i, output=None):
+        """Resolve node i's outgoing edges and queue consumers that can now start"""
+        for j, position in consumers_of[i]:
+            if state[j] != WAITING:
+                continue
+            remaining[j] -= 1
+            resolved[j].add(position)
+            _, output_field, _ = nodes[j].sources[position]
+            if not is_dead(i, output_field):
+                live[j].append(position)
+                if output is not None and "error" not in output:
+                    arrived[j].append(position)
+            if remaining[j] == 0 or (quorum[j] is not None and len(arrived[j]) >= quorum[j]):
+                state[j] = READY
+                heapq.heappush(ready, j)
+
+    def cancel(i):
+        """Cancel node i, which nothing needs any more, and whatever upstream only it needed"""
+        node = nodes[i]
+        if state[i] == RUNNING:
+            tasks[i].cancel()
+        elif state[i] in (WAITING, READY):
+            for position, (source, _, _) in enumerate(node.sources):
+                node_outputs.consume([source])
+                if position not in resolved[i]:
+                    give_up(source)
+        else:
+            return
+        state[i] = CANCELLED
+        node_results[node.id] = {"status": "cancelled", "execution_time": 0.0}
+        NODES_CANCELLED.labels(metric_node_type(node.type)).inc()
+        engine_logger.info("Cancelled node %s: no longer needed", node.id)
+        record_output_result(node, "cancelled")
+
+    def give_up(source):
+        demand[source] -= 1
+        if demand[source] == 0:
+            cancel(source)
+
+    def is_instant(j):
+        return remaining[j] == 0 and nodes[j].sources and not live[j] or j in cached_outputs
+
+    def start(j):
+        """Start node j; returns the edges it reads, or None when it finished without running"""
+        node = nodes[j]
+        if remaining[j] == 0 and node.sources and not live[j]:
+            state[j] = SKIPPED
+            node_outputs.consume([source for source, _, _ in node.sources])
+            node_results[node.id] = {"status": "skipped", "execution_time": 0.0}
+            NODES_SKIPPED.labels(metric_node_type(node.type)).inc()
+            engine_logger.info("Skipping node %s: only reachable through condition branches not taken", node.id)
+            record_output_result(node, "skipped")
+            finish(j)
+            return None
+
+        if j in cached_outputs:
+            state[j] = DONE
+            node_outputs.put(j, cached_outputs[j])
+            node_results[node.id] = {"status": "cached", "execution_time": 0.0}
+            if retained[j]:
+                node_results[node.id]["output"] = cached_outputs[j]
+            if node.type == "condition":
+                branches[j] = cached_outputs[j].get("path")
+            engine_logger.info("Reusing cached output for node %s", node.id)
+            finish(j, cached_outputs[j])
+            return None
+
+        edges = node.sources
+        if node.type == "merge":
+            # wait-all takes every live input; racing merges take the first arrivals they need
+            taken = live[j] if quorum[j] is None else arrived[j][:quorum[j]]
+            for position, (source, _, _) in enumerate(node.sources):
+                if position in taken:
+                    continue
+                node_outputs.consume([source])
+                if position not in resolved[j]:
+                    give_up(source)
+            edges = [node.sources[position] for position in sorted(taken)]
+
+        engine_logger.info("Executing node %d/%d: %s (%s)", j + 1, count, node.id, node.type)
+        state[j] = RUNNING
+        return edges
+
+    async def run_one(node, edges):
+        """Run one node; returns (output, error, execution time, usage)"""
+        # Get inputs for this node, then let go of upstream outputs nothing else reads
+        sources = [source for source, _, _ in edges]
+        await node_outputs.load(sources)
+        if node.type == "merge":
+            node_inputs = get_merge_inputs(nodes, edges, node_outputs)
+        else:
+            node_inputs = get_node_inputs(node, node_outputs, inputs)
+        node_outputs.consume(sources)
+        usage = NodeUsage()
+        usage.bytes_in = estimate_size(node_inputs)
+        node_start_time = time.time()
+        try:
+            with start_span("node.execute", **{"node.id": node.id, "node.type": node.type}) as node_span, track_usage(usage):
+                output = await execute_node(node.type, node.data, node_inputs, mode)
+                if "error" in output:
+                    node_span.set_attribute("error", output["error"])
+                    # A failed condition can't pick a branch, a stopped loop has no results
+                    # to pass on, a merge short of inputs has nothing to merge and a
+                    # pipeline without a workflow has nothing to run, so these fail outright
+                    if node.type in ("condition", "for-each", "merge", PIPELINE):
+                        raise ValueError(output["error"])
+                if node.type == "condition":
+                    node_span.set_attribute("condition.path", output["path"] or "none")
+            return output, None, time.time() - node_start_time, usage
+        except Exception as e:
+            return None, str(e), time.time() - node_start_time, usage
+
+    def complete(i, result):
+        """Record node i's run; returns the exception that ends the run, if any"""
+        node = nodes[i]
+        output, error_message, node_execution_time, usage = result
+        record_node_usage(node.type, usage)
+
+        if error_message is None:
+            NODE_EXECUTION_DURATION.labels(metric_node_type(node.type), "success").observe(node_execution_time)
+            usage.bytes_out = estimate_size(output)
+            state[i] = DONE
+            if node.type == "condition":
+                branches[i] = output["path"]
+            node_outputs.put(i, output, usage.bytes_out)
+            node_results[node.id] = {
+                "status": "success",
+                "execution_time": node_execution_time,
+                "usage": usage.to_dict()
+            }
+            if retained[i]:
+                node_results[node.id]["output"] = output
+            engine_logger.info("Node %s executed successfully in %.3fs", node.id, node_execution_time)
+            record_output_result(node, "success", output.get("output", ""), node_execution_time)
+            finish(i, output)
+            return None
+
+        NODE_EXECUTION_DURATION.labels(metric_node_type(node.type), "error").observe(node_execution_time)
+        logger.error(f"Error executing node {node.id}: {error_message}")
+        state[i] = FAILED
+        node_results[node.id] = {
+            "status": "error",
+            "execution_time": node_execution_time,
+            "error": error_message,
+            "usage": usage.to_dict()
+        }
+        record_output_result(node, "error", "", node_execution_time, error_message)
+
+        # A failed node's consumers can't run, so a failure with consumers ends the run
+        if node.consumers:
+            logger.warning(f"Stopping execution after node {node.id} due to error")
+            return Exception(f"Error in node {node.id}: {error_message}")
+        return None
+
+    try:
+        while ready or running:
+            while ready:
+                j = ready[0]
+                if state[j] != READY:
+                    heapq.heappop(ready)
+                    continue
+                if len(running) >= settings.EXECUTION_NODE_CONCURRENCY and not is_instant(j):
+                    break
+                heapq.heappop(ready)
+                edges = start(j)
+                if edges is None:
+                    continue
+                if not running and not ready:
+                    # Nothing could run alongside it, so skip the task and await it here
+                    failure = complete(j, await run_one(nodes[j], edges))
+                    if failure is not None:
+                        break
+                    await node_outputs.spill_if_needed()
+                    continue
+                task = asyncio.create_task(run_one(nodes[j], edges))
+                running[task] = j
+                tasks[j] = task
+            if failure is not None:
+                break
+            if not running:
+                continue
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=running.get):
+                i = running.pop(task)
+                if state[i] != CANCELLED:
+                    error = complete(i, task.result())
+                    failure = failure or error
+            if failure is not None:
+                break
+            await node_outputs.spill_if_needed()
+    finally:
+        # Failed or cancelled from outside: stop whatever is still running
+        for task, i in running.items():
+            task.cancel()
+            if state[i] == RUNNING:
+                state[i] = CANCELLED
+                node_results[nodes[i].id] = {"status": "cancelled", "execution_time": 0.0}
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    if failure is not None:
+        raise failure
+
+def get_merge_inputs(nodes, edges, node_outputs) -> Dict[str, Any]:
+    """A merge node's inputs, keyed by the edge's input handle or else the source's name, in edge order"""
+    inputs = {}
+    for source, output_field, input_field in edges:
+        if source not in node_outputs:
+            continue
+        output = node_outputs[source]
+        if output_field == "text" and "output" in output:
+            output_field = "output"
+        if output_field not in output:
+            continue
+        label = input_field
+        if input_field == "input":
+            label = nodes[source].params.get("nodeName") or nodes[source].id
+        if label in inputs:
+            label = f"{label}.{output_field}"
+        inputs[label] = output[output_field]
+    return inputs
+
+def pipeline_output(node_data, inputs) -> Dict[str, Any]:
+    """A pipeline node's output: the embedded workflow's outputs by name, and the first of them as output"""
+    if "outputs" not in node_data:
+        raise ValueError("Pipeline node has no workflow selected")
+    # Outputs skipped inside the embedded workflow are left out
+    outputs = {name: inputs[name] for name in node_data["outputs"] if name in inputs}
+    return {"output": next(iter(outputs.values()), ""), "outputs": outputs}
+
+def for_each_items(inputs: Dict[str, Any], field: str) -> List[Any]:
+    """The list a for-each node iterates: its input, or the field of it named by params.field.
+
+    Text is read as a JSON array if it is one and as non-empty lines otherwise.
+    """
+    value = resolve_field(inputs, field)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, list):
+            return parsed
+        return [line for line in value.splitlines() if line.strip()]
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    raise ValueError(f"For-each input must be a list, got {type(value).__name__}")
+
+async def run_for_each(node_data, inputs, mode):
+    """Run a for-each node's loop body once per element of its input list.
+
+    At most `concurrency` elements run at a time and results are gathered in
+    element order. With stopOnError, the first failed element stops the rest
+    and fails the node; otherwise a failed element gathers None and is listed
+    in errors. Each finished element is reported as an item progress event.
+    """
+    body = node_data.get("body")
+    if body is None:
+        raise ValueError("For-each node has no loop body; connect its item handle")
+    params = node_data.get("params", {})
+    node_id = node_data["node_id"]
+    items = for_each_items(inputs, str(params.get("field") or ""))
+    if len(items) > settings.FOR_EACH_MAX_ITEMS:
+        raise ValueError(f"For-each input has {len(items)} items, more than the limit of {settings.FOR_EACH_MAX_ITEMS}")
+    concurrency = max(1, min(int(params.get("concurrency") or settings.FOR_EACH_CONCURRENCY), settings.FOR_EACH_MAX_CONCURRENCY))
+    stop_on_error = bool(params.get("stopOnError", False))
+
+    # Without a results edge, each element gathers the output of the body's last node
+    result_index, result_field = node_data["result"] or (len(body.nodes) - 1, "output")
+    result_id = body.ids[result_index]
+    retained = [i == result_index for i in range(len(body.nodes))]
+    consumers = [node.consumers for node in body.nodes]
+    # Values the body reads from outside the loop arrive as the node's @k inputs
+    outer = {key: value for key, value in inputs.items() if key.startswith("@")}
+
+    results: List[Any] = [None] * len(items)
+    errors = []
+    usages = []
+    completed = 0
+    pending = iter(enumerate(items))
+
+    async def run_item(index, item, item_results):
+        node_outputs = OutputStore(
+            body.ids, consumers, retained,
+            memory_limit=settings.EXECUTION_MEMORY_LIMIT_MB * 1024 * 1024,
+            spill_dir=settings.EXECUTION_SPILL_DIR
+        )
+        # The item node never runs; its output is the element itself
+        item_output = {"output": item, "item": item, "index": index, **outer}
+        try:
+            await run_nodes(body.nodes, {}, mode, item_results, {node_data["item_index"]: item_output}, retained, node_outputs, {})
+        finally:
+            node_outputs.close()
+        result = item_results.get(result_id, {})
+        if result.get("status") == "error":
+            raise ValueError(f"Error in node {result_id}: {result['error']}")
+        output = result.get("output", {})
+        # Executors report most failures in their output rather than raising
+        if "error" in output:
+            raise ValueError(f"Error in node {result_id}: {output['error']}")
+        return output.get(result_field)
+
+    async def worker():
+        nonlocal completed
+        for index, item in pending:
+            item_results = {}
+            error = None
+            with start_span("for_each.item", **{"node.id": node_id, "item.index": index}):
+                try:
+                    results[index] = await run_item(index, item, item_results)
+                except Exception as e:
+                    error = str(e)
+            usages.extend(result["usage"] for result in item_results.values() if "usage" in result)
+            completed += 1
+            FOR_EACH_ITEMS.labels("error" if error else "success").inc()
+            report_progress(
+                "item", node_id=node_id, index=index, status="error" if error else "success",
+                error=error, completed=completed, total=len(items)
+            )
+            if error is not None:
+                if stop_on_error:
+                    raise ValueError(f"Item {index} failed: {error}")
+                errors.append({"index": index, "error": error})
+
+    engine_logger.info("For-each node %s: %d items, concurrency %d", node_id, len(items), concurrency)
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # On early stop, abandon elements still running; pending ones never start
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # Charge the body's tokens and waits to the for-each node
+        totals = summarize_usage(usages)
+        record_tokens(totals["input_tokens"], totals["output_tokens"])
+        record_wait(totals["wait_time"])
+    return {"output": results, "errors": errors, "count": len(items)}
+
+# Node types execute_node handles besides providers and CPU-bound executors
+BUILTIN_NODE_TYPES = frozenset({
+    "input", "output", "text", "condition", "merge", "for-each", FOR_EACH_ITEM, "document-to-text",
+    PIPELINE, PIPELINE_INPUT, PIPELINE_OUTPUT
+})
+
+def metric_node_type(node_type: str) -> str:
+    """Node type label for metrics; types come from saved workflows, so unknown ones share one series"""
+    if node_type in BUILTIN_NODE_TYPES or node_type in MODEL_HANDLERS or node_type in CPU_BOUND_EXECUTORS:
+        return node_type
+    return "other"
+
+def record_node_usage(node_type: str, usage: NodeUsage):
+    """Export one node's resource usage to the metrics registry"""
+    node_type = metric_node_type(node_type)
+    NODE_CPU_SECONDS.labels(node_type).inc(usage.cpu_time)
+    if usage.wait_time:
+        NODE_WAIT_SECONDS.labels(node_type).inc(usage.wait_time)
+    NODE_BYTES.labels(node_type, "in").inc(usage.bytes_in)
+    NODE_BYTES.labels(node_type, "out").inc(usage.bytes_out)
+
+def skipped_node_ids(node_results) -> List[str]:
+    return [node_id for node_id, result in node_results.items() if result.get("status") == "skipped"]
+
+def execution_usage(node_results) -> Dict[str, Any]:
+    return summarize_usage(result["usage"] for result in node_results.values() if "usage" in result)
+
+@router.post("/{workflow_id}/nodes/{node_id}/run", response_model=NodeRunResponse)
+async def run_node(
+    workflow_id: str,
+    node_id: str,
+    execution_request: WorkflowExecutionRequest,
+    request: Request,
+    refresh: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Run one node and only the nodes it depends on, reusing unchanged upstream outputs from recent runs"""
+    try:
+        # Single-node runs come from the editor, so they always take the interactive lane
+        async with admit_execution(str(current_user.id), "interactive", current_user.plan):
+            with start_trace("workflow.run_node", **{"workflow.id": workflow_id, "node.id": node_id, "user.id": str(current_user.id)}) as trace_span:
+                return await run_to_node(workflow_id, node_id, execution_request, request, current_user, refresh, trace_span.trace_id)
+    except AdmissionRejected as e:
+        raise too_busy(e)
+
+async def run_to_node(
+    workflow_id: str,
+    node_id: str,
+    execution_request: WorkflowExecutionRequest,
+    request: Request,
+    current_user: User,
+    refresh: bool,
+    trace_id: Optional[str] = None
+):
+    start_time = time.time()
+    workflow_collection = await get_workflow_collection(request)
+    plan = await load_execution_plan(workflow_collection, workflow_id, str(current_user.id))
+    if node_id not in plan.index:
+        raise HTTPException(status_code=404, detail="Node not found")
+    
+    plan, _ = plan.prune([node_id])
+    fingerprints = compute_node_fingerprints(plan, execution_request.inputs, execution_request.mode)
+    
+    executions_collection = request.app.mongodb.workflow_executions
+    cached_outputs = {}
+    if not refresh:
+        upstream_ids = [other_id for other_id in plan.ids if other_id != node_id]
+        cached_outputs = await find_cached_outputs(executions_collection, workflow_id, str(current_user.id), upstream_ids, fingerprints)
+    
+    execution_result = await executions_collection.insert_one({
+        "workflow_id": workflow_id,
+        "user_id": str(current_user.id),
+        "started_at": datetime.utcnow(),
+        "inputs": execution_request.dict(),
+        "status": "in_progress",
+        "trace_id": trace_id,
+        "target_node": node_id,
+        "node_fingerprints": fingerprints
+    })
+    execution_id = str(execution_result.inserted_id)
+    logger.info(f"Running node {node_id} of workflow {workflow_id}: {len(plan.nodes)} nodes needed, {len(cached_outputs)} cached")
+    
+    node_results = {}
+    error = None
+    EXECUTIONS_IN_FLIGHT.labels().inc()
+    try:
+        await execute_graph(plan, execution_request.inputs, execution_request.mode, node_results, cached_outputs)
+    except Exception as e:
+        logger.error(f"Error running node {node_id}: {str(e)}", exc_info=True)
+        error = str(e)
+    finally:
+        EXECUTIONS_IN_FLIGHT.labels().dec()
+    
+    total_time = time.time() - start_time
+    target_result = node_results.get(node_id, {})
+    status_value = target_result.get("status") or "error"
+    await executions_collection.update_one(
+        {"_id": ObjectId(execution_id)},
+        {"$set": {
+            "completed_at": datetime.utcnow(),
+            "execution_time": total_time,
+            "status": "completed" if status_value in ("success", "skipped") else "error",
+            "error": target_result.get("error") or error,
+            "node_results": node_results
+        }}
+    )
+    
+    output = target_result.get("output", {})
+    return NodeRunResponse(
+        node_id=node_id,
+        output=output.get("output", output) if isinstance(output, dict) else output,
+        status=status_value,
+        error=target_result.get("error") or error,
+        execution_time=target_result.get("execution_time", 0.0),
+        total_time=total_time,
+        execution_id=execution_id,
+        executed_nodes=[other_id for other_id, result in node_results.items() if result.get("status") in ("success", "error")],
+        cached_nodes=list(cached_outputs),
+        trace_id=trace_id
+    )
+
+class ReleasedOutputCache:
+    """Stores the intermediate outputs a full execution releases, for single-node runs to reuse.
+    
+    node_results only keeps retained outputs, so without this a full run could
+    seed the single-node cache only for output nodes. Each workflow node keeps
+    one entry for its latest fingerprint; outputs larger than max_bytes, or that
+    report an error, are not stored, and entries expire after NODE_OUTPUT_CACHE_TTL.
+    """
+    
+    def __init__(self, collection, workflow_id: str, user_id: str, fingerprints: Dict[str, str], max_bytes: int):
+        self.collection = collection
+        self.workflow_id = workflow_id
+        self.user_id = user_id
+        self.fingerprints = fingerprints
+        self.max_bytes = max_bytes
+        self._writes: List[asyncio.Task] = []
+    
+    def add(self, node_id: str, output: Any):
+        fingerprint = self.fingerprints.get(node_id)
+        if not self.max_bytes or fingerprint is None or not isinstance(output, dict) or "error" in output:
+            return
+        if estimate_size(output) > self.max_bytes:
+            return
+        # Written in the background so the released output isn't held until the run ends
+        self._writes.append(asyncio.create_task(self.collection.replace_one(
+            {"_id": output_cache_key(self.workflow_id, self.user_id, node_id)},
+            {
+                "workflow_id": self.workflow_id,
+                "user_id": self.user_id,
+                "node_id": node_id,
+                "fingerprint": fingerprint,
+                "output": output,
+                "updated_at": datetime.utcnow()
+            },
+            upsert=True
+        )))
+    
+    async def flush(self):
+        results = await asyncio.gather(*self._writes, return_exceptions=True)
+        self._writes = []
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed:
+            logger.warning(f"Could not cache {len(failed)} released node outputs: {failed[0]}")
+
+def output_cache_key(workflow_id: str, user_id: str, node_id: str) -> str:
+    return f"{workflow_id}:{user_id}:{node_id}"
+
+async def find_cached_outputs(executions_collection, workflow_id, user_id, node_ids, fingerprints, lookback=10):
+    """Find reusable outputs for node_ids among the most recent executions of a workflow.
+    
+    A node's output is reused only if it succeeded and its fingerprint (params,
+    inputs and upstream fingerprints) matches the current one. Nodes not found
+    in those executions' results are looked up among released outputs.
+    """
+    if not node_ids:
+        return {}
+    projection = {"node_fingerprints": 1}
+    for node_id in node_ids:
+        projection[f"node_results.{node_id}"] = 1
+    cursor = executions_collection.find(
+        {"workflow_id": workflow_id, "user_id": user_id, "node_fingerprints": {"$exists": True}},
+        projection
+    ).sort("started_at", -1).limit(lookback)
+    
+    cached = {}
+    async for execution in cursor:
+        stored_fingerprints = execution.get("node_fingerprints", {})
+        stored_results = execution.get("node_results", {})
+        for node_id in node_ids:
+            if node_id in cached or stored_fingerprints.get(node_id) != fingerprints.get(node_id):
+                continue
+            result = stored_results.get(node_id)
+            if result and result.get("status") in ("success", "cached") and "output" in result:
+                cached[node_id] = result["output"]
+        if len(cached) == len(node_ids):
+            break
+    
+    missing = [node_id for node_id in node_ids if node_id not in cached and node_id in fingerprints]
+    if missing:
+        released = executions_collection.database.node_output_cache.find(
+            {"_id": {"$in": [output_cache_key(workflow_id, user_id, node_id) for node_id in missing]}},
+            {"node_id": 1, "fingerprint": 1, "output": 1}
+        )
+        async for entry in released:
+            if entry.get("fingerprint") == fingerprints.get(entry.get("node_id")):
+                cached[entry["node_id"]] = entry["output"]
+    return cached
+
+@router.get("/{workflow_id}/executions/{execution_id}/trace")
+async def get_execution_trace(
+    workflow_id: str,
+    execution_id: str,
+    request: Request,
+    format: str = "otlp",
+    current_user: User = Depends(get_current_user)
+):
+    """Return the exported trace of an execution as OTLP/JSON or a text waterfall"""
+    execution = await request.app.mongodb.workflow_executions.find_one(
+        {"_id": ObjectId(execution_id), "workflow_id": workflow_id, "user_id": str(current_user.id)},
+        {"trace_id": 1}
+    )
+    if not execution or not execution.get("trace_id"):
+        raise HTTPException(status_code=404, detail="Trace not found")
+    
+    trace = await asyncio.to_thread(load_trace, execution["trace_id"])
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    
+    if format == "waterfall":
+        return PlainTextResponse(render_waterfall(trace))
+    return trace
+
+@router.get("/{workflow_id}/executions/{execution_id}/profile")
+async def get_execution_profile(
+    workflow_id: str,
+    execution_id: str,
+    request: Request,
+    kind: str = "cpu",
+    current_user: User = Depends(get_current_user)
+):
+    """Return a stored execution profile as folded stacks (flamegraph.pl / speedscope input)"""
+    if current_user.email not in settings.PROFILING_ALLOWED_USERS:
+        raise HTTPException(status_code=403, detail="Not allowed to read execution profiles")
+    execution = await request.app.mongodb.workflow_executions.find_one(
+        {"_id": ObjectId(execution_id), "workflow_id": workflow_id, "user_id": str(current_user.id)},
+        {"profile": 1}
+    )
+    if not execution or execution.get("profile", {}).get("kind") != kind:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    folded = await asyncio.to_thread(load_profile, settings.PROFILE_DIR, execution_id, kind)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(folded)
+
 @router.post("/{workflow_id}/fix_input_types")
 async def fix_input_types(
     workflow_id: str,
@@ -419,7 +1383,11 @@ async def fix_input_types(
     if updated:
         await workflow_collection.update_one(
             {"_id": ObjectId(workflow_id)},
-            {"$set": {"nodes": nodes, "updated_at": datetime.utcnow()}}
+            {"$set": {
+                "nodes": nodes,
+                "plan": compile_plan(nodes, workflow.get("edges", [])),
+                "updated_at": datetime.utcnow()
+            }, "$inc": {"version": 1}}
         )
         logger.info(f"Fixed {fixed_nodes} input nodes in workflow {workflow_id}")
         return {"message": f"Fixed {fixed_nodes} input node types", "updated": True, "fixed_count": fixed_nodes}
@@ -427,82 +1395,314 @@ async def fix_input_types(
     logger.info(f"No input node fixes needed for workflow {workflow_id}")
     return {"message": "No updates needed", "updated": False, "fixed_count": 0}
 
-# Helper functions for workflow execution
+@router.post("/{workflow_id}/schedules", response_model=Schedule, status_code=status.HTTP_201_CREATED)
+async def create_schedule(
+    workflow_id: str,
+    schedule: ScheduleCreate,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Run a workflow on a cron expression or a fixed interval, in the scheduled lane"""
+    workflow_collection = await get_workflow_collection(request)
+    if not await workflow_collection.find_one({"_id": ObjectId(workflow_id), "user_id": str(current_user.id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    if (schedule.cron is None) == (schedule.interval is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of cron or interval")
+    if schedule.cron is not None:
+        try:
+            parse_cron(schedule.cron)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if schedule.interval is not None and schedule.interval < settings.SCHEDULER_MIN_INTERVAL:
+        raise HTTPException(status_code=400, detail=f"interval must be at least {settings.SCHEDULER_MIN_INTERVAL} seconds")
+    if schedule.misfire not in MISFIRE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"misfire must be one of: {', '.join(MISFIRE_POLICIES)}")
+    if schedule.jitter < 0:
+        raise HTTPException(status_code=400, detail="jitter can't be negative")
+    
+    now = datetime.utcnow()
+    document = {
+        **schedule.dict(),
+        "workflow_id": workflow_id,
+        "user_id": str(current_user.id),
+        "anchor": now,
+        "created_at": now,
+        "last_run_at": None
+    }
+    document["next_run_at"] = next_run(document, now)
+    result = await request.app.mongodb.workflow_schedules.insert_one(document)
+    notify_scheduler()
+    logger.info(f"Created schedule {result.inserted_id} for workflow {workflow_id}")
+    return Schedule(**document, id=str(result.inserted_id))
 
-def calculate_execution_order(nodes, edges):
-    """Calculate the topological sort of nodes for execution order"""
-    # Create a graph representation
-    graph = {node["id"]: [] for node in nodes}
-    
-    # Add edges to the graph
-    for edge in edges:
-        source = edge["source"]
-        target = edge["target"]
-        if source in graph:
-            graph[source].append(target)
-    
-    # Perform topological sort
-    visited = set()
-    temp_visited = set()
-    order = []
-    
-    def visit(node_id):
-        if node_id in temp_visited:
-            raise ValueError(f"Circular dependency detected at node {node_id}")
-        if node_id in visited:
-            return
-        
-        temp_visited.add(node_id)
-        
-        # Visit neighbors
-        for neighbor in graph.get(node_id, []):
-            visit(neighbor)
+@router.get("/{workflow_id}/schedules", response_model=List[Schedule])
+async def list_schedules(
+    workflow_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    schedules = await request.app.mongodb.workflow_schedules.find(
+        {"workflow_id": workflow_id, "user_id": str(current_user.id)}
+    ).to_list(None)
+    return [Schedule(**schedule, id=str(schedule["_id"])) for schedule in schedules]
+
+@router.delete("/{workflow_id}/schedules/{schedule_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_schedule(
+    workflow_id: str,
+    schedule_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    result = await request.app.mongodb.workflow_schedules.delete_one({
+        "_id": ObjectId(schedule_id),
+        "workflow_id": workflow_id,
+        "user_id": str(current_user.id)
+    })
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    notify_scheduler()
+
+@router.post("/{workflow_id}/webhook")
+async def create_webhook_token(
+    workflow_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Issue the workflow's webhook token, replacing any earlier one; the token is only shown here"""
+    token = secrets.token_urlsafe(32)
+    workflow_collection = await get_workflow_collection(request)
+    result = await workflow_collection.update_one(
+        {"_id": ObjectId(workflow_id), "user_id": str(current_user.id)},
+        {"$set": {"webhook": {"token_hash": token_digest(token), "created_at": datetime.utcnow()}}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    get_webhook_tokens().invalidate(workflow_id)
+    logger.info(f"Issued webhook token for workflow {workflow_id}")
+    return {"url": f"/hooks/{workflow_id}/{token}", "token": token}
+
+@router.delete("/{workflow_id}/webhook", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_webhook_token(
+    workflow_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Revoke the workflow's webhook token; other processes stop accepting it within WEBHOOK_TOKEN_CACHE_TTL"""
+    workflow_collection = await get_workflow_collection(request)
+    result = await workflow_collection.update_one(
+        {"_id": ObjectId(workflow_id), "user_id": str(current_user.id)},
+        {"$unset": {"webhook": ""}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    get_webhook_tokens().invalidate(workflow_id)
+
+async def load_trigger_user(db, user_id: str) -> User:
+    """The owner of a schedule or webhook, who background executions run as"""
+    user = await db["users"].find_one({"_id": ObjectId(user_id)})
+    if user is None:
+        raise ValueError(f"User {user_id} no longer exists")
+    return User(
+        id=str(user["_id"]),
+        email=user["email"],
+        full_name=user.get("full_name", ""),
+        plan=user.get("plan", "free")
+    )
+
+async def run_scheduled_execution(db, schedule: Dict[str, Any], scheduled_for: datetime):
+    """Run one scheduled execution as the schedule's owner, in the scheduled admission lane"""
+    current_user = await load_trigger_user(db, schedule["user_id"])
+    workflow_id = schedule["workflow_id"]
+    execution_request = WorkflowExecutionRequest(inputs=schedule.get("inputs") or {}, priority="scheduled")
+    trigger = {"type": "schedule", "schedule_id": str(schedule["_id"]), "scheduled_for": scheduled_for}
+    try:
+        async with admit_execution(current_user.id, "scheduled", current_user.plan):
+            SCHEDULED_RUNS.labels("started").inc()
+            with start_trace("workflow.execute", **{"workflow.id": workflow_id, "user.id": current_user.id}) as trace_span:
+                await run_workflow(workflow_id, execution_request, db, current_user, trace_span.trace_id, trigger)
+    except AdmissionRejected as e:
+        SCHEDULED_RUNS.labels("rejected").inc()
+        logger.warning(f"Scheduled run of workflow {workflow_id} for {scheduled_for.isoformat()} rejected: {e.reason}")
+
+async def run_webhook_execution(db, delivery: Dict[str, str], delivery_id: str):
+    """Run the execution for one webhook delivery in the batch admission lane.
+
+    AdmissionRejected propagates, so the delivery is retried later.
+    """
+    current_user = await load_trigger_user(db, delivery["user_id"])
+    workflow_id = delivery["workflow_id"]
+    execution_request = WorkflowExecutionRequest(
+        inputs=webhook_inputs(delivery["payload"], delivery["content_type"]),
+        priority="batch"
+    )
+    trigger = {"type": "webhook", "delivery_id": delivery_id, "idempotency_key": delivery["idempotency_key"] or None}
+    async with admit_execution(current_user.id, "batch", current_user.plan):
+        with start_trace("workflow.execute", **{"workflow.id": workflow_id, "user.id": current_user.id}) as trace_span:
+            await run_workflow(workflow_id, execution_request, db, current_user, trace_span.trace_id, trigger)
+
+# Helper functions for versioning and delta updates
+
+# Re-reads an unconditional PATCH makes when other saves keep landing first
+PATCH_ATTEMPTS = 5
+
+def workflow_etag(workflow) -> str:
+    """Build the ETag for a workflow document from its id and version counter"""
+    return f'"{workflow["_id"]}-{workflow.get("version", 0)}"'
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against the current ETag"""
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def get_expected_version(request: Request, workflow_id: str) -> Optional[int]:
+    """Return the version an If-Match header expects, or None for an unconditional write"""
+    if_match = request.headers.get("if-match")
+    if not if_match or if_match.strip() == "*":
+        return None
+    
+    for tag in if_match.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        tag_id, _, tag_version = tag.rpartition("-")
+        if tag_id == workflow_id and tag_version.isdigit():
+            return int(tag_version)
+    
+    raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Workflow has been modified")
+
+def version_filter(version: int) -> Dict[str, Any]:
+    """Query fragment matching a version; documents saved before versioning count as 0"""
+    if version == 0:
+        return {"version": {"$in": [0, None]}}
+    return {"version": version}
+
+async def raise_update_failure(workflow_collection, workflow_id: str, current_user: User):
+    """Tell a missing workflow apart from a failed If-Match after a conditional write matched nothing"""
+    exists = await workflow_collection.count_documents(
+        {"_id": ObjectId(workflow_id), "user_id": str(current_user.id)}, limit=1
+    )
+    if not exists:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Workflow has been modified")
+
+def apply_delta(workflow: Dict[str, Any], delta: WorkflowDelta) -> Dict[str, Any]:
+    """The fields a delta changes, computed against a stored workflow document.
+
+    Removals go first, then in-place updates, then additions, for nodes and
+    edges alike. Removing an ID that is already gone is a no-op, but updating
+    one raises 409: the client's edit was made against a node or edge that
+    someone else has since deleted.
+    """
+    changes = {key: value for key, value in (("name", delta.name), ("description", delta.description)) if value is not None}
+    
+    for array, removed, updated, added in (
+        ("nodes", delta.remove_nodes, delta.update_nodes, delta.add_nodes),
+        ("edges", delta.remove_edges, delta.update_edges, delta.add_edges),
+    ):
+        if not (removed or updated or added):
+            continue
+        items = [dict(item) for item in workflow.get(array, [])]
+        if removed:
+            removed_ids = set(removed)
+            items = [item for item in items if item.get("id") not in removed_ids]
         
-        temp_visited.remove(node_id)
-        visited.add(node_id)
+        by_id = {item.get("id"): item for item in items}
+        for update in updated:
+            item = by_id.get(update.id)
+            if item is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Cannot update {array[:-1]} {update.id}: it no longer exists"
+                )
+            item.update(update.dict(exclude_unset=True, exclude={"id"}))
         
-        # Get the node and add to order
-        node = next((n for n in nodes if n["id"] == node_id), None)
-        if node:
-            order.append(node)
-    
-    # Start with input nodes or nodes with no incoming edges
-    start_nodes = [
-        node["id"] for node in nodes 
-        if node["type"] == "input" or not any(edge["target"] == node["id"] for edge in edges)
-    ]
-    
-    # If no start nodes, start with any node
-    if not start_nodes and nodes:
-        start_nodes = [nodes[0]["id"]]
-    
-    # Visit all nodes
-    for node_id in start_nodes:
-        if node_id not in visited:
-            visit(node_id)
-    
-    # Make sure all nodes are visited
-    remaining = [node for node in nodes if node["id"] not in visited]
-    order.extend(remaining)
-    
-    # Reverse the order to get the correct execution flow (input first, output last)
-    return list(reversed(order))
-
-def get_node_inputs(node_id, edges, node_outputs, initial_inputs, nodes):
-    """Get the inputs for a node from connected nodes"""
-    inputs = {}
+        items.extend(item.dict() for item in added)
+        changes[array] = items
+    
+    return changes
+
+# Helper functions for workflow execution
+
+async def store_plan(workflow_collection, workflow) -> Dict[str, Any]:
+    """Compile and store the plan for a workflow document, unless it has changed since it was read"""
+    plan = compile_plan(workflow.get("nodes", []), workflow.get("edges", []))
+    await workflow_collection.update_one(
+        {"_id": workflow["_id"], **version_filter(workflow.get("version", 0))},
+        {"$set": {"plan": plan}}
+    )
+    return plan
+
+async def load_execution_plan(workflow_collection, workflow_id: str, user_id: str, embedding: Tuple[str, ...] = ()) -> ExecutionPlan:
+    """Load a workflow's plan with the workflows its pipeline nodes embed inlined.
     
-    # Find all edges that target this node
-    incoming_edges = [edge for edge in edges if edge["target"] == node_id]
+    Embedded plans come from the plan cache like any other, and the inlined
+    plan is kept with the workflow's cached plan until the version of any
+    workflow it was built from changes. embedding lists the workflows already
+    being inlined, so a workflow that ends up embedding itself is an error.
+    """
+    plan, version = await load_compiled_plan(workflow_collection, workflow_id, user_id)
+    if not plan.pipelines:
+        return plan
     
-    # Process each incoming edge
-    for edge in incoming_edges:
-        source_id = edge["source"]
-        if source_id in node_outputs:
-            output = node_outputs[source_id]
-            # Get the right output field based on the edge
-            output_field = edge.get("sourceHandle", "output")
-            input_field = edge.get("targetHandle", "input")
+    embedding = embedding + (workflow_id,)
+    children = {}
+    dependencies = {workflow_id: version}
+    for node_id, child_id in plan.pipelines.items():
+        if child_id in embedding:
+            return ExecutionPlan(plan.nodes, f"Pipeline node {node_id} embeds workflow {child_id}, which embeds this one")
+        try:
+            child = await load_execution_plan(workflow_collection, child_id, user_id, embedding)
+        except (HTTPException, InvalidId):
+            return ExecutionPlan(plan.nodes, f"Pipeline node {node_id} embeds workflow {child_id}, which was not found")
+        children[node_id] = child
+        dependencies.update(child.dependencies)
+    
+    key = tuple(sorted(dependencies.items()))
+    if plan.inlined is not None and plan.inlined[0] == key:
+        return plan.inlined[1]
+    inlined = inline_pipelines(plan, children)
+    inlined.dependencies = dependencies
+    if not inlined.error:
+        plan.inlined = (key, inlined)
+    logger.info(f"Inlined {len(children)} pipeline(s) into workflow {workflow_id}: {len(inlined.nodes)} nodes")
+    return inlined
+
+async def load_compiled_plan(workflow_collection, workflow_id: str, user_id: str) -> Tuple[ExecutionPlan, int]:
+    """Load a workflow's compiled plan and version, from the in-process cache when its version is current.
+    
+    Workflows saved before plans existed are compiled on first run and the plan is stored.
+    """
+    query = {"_id": ObjectId(workflow_id), "user_id": user_id}
+    current = await workflow_collection.find_one(query, {"version": 1})
+    if not current:
+        logger.warning(f"Workflow not found: {workflow_id}")
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    cache = get_plan_cache()
+    plan = cache.get(workflow_id, current.get("version", 0))
+    if plan is not None:
+        return plan, current.get("version", 0)
+    
+    workflow = await workflow_collection.find_one(query, {"version": 1, "plan": 1})
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    document = workflow.get("plan")
+    if not is_current(document):
+        workflow = await workflow_collection.find_one(query, {"version": 1, "nodes": 1, "edges": 1})
+        if not workflow:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+        document = await store_plan(workflow_collection, workflow)
+        logger.info(f"Compiled execution plan for workflow {workflow_id}")
+    plan = ExecutionPlan.from_document(document)
+    plan.dependencies = {workflow_id: workflow.get("version", 0)}
+    cache.put(workflow_id, workflow.get("version", 0), plan)
+    return plan, workflow.get("version", 0)
+
+def get_node_inputs(node, node_outputs, initial_inputs):
+    """Get the inputs for a plan node from the outputs of its sources"""
+    inputs = {}
+    
+    # Each binding is (source index, output field, input field)
+    for source, output_field, input_field in node.sources:
+        if source in node_outputs:
+            output = node_outputs[source]
             
             # Handle special case where .text is used instead of .output
             if output_field == "text" and "output" in output:
@@ -512,21 +1712,15 @@ def get_node_inputs(node_id, edges, node_outputs, initial_inputs, nodes):
                 inputs[input_field] = output[output_field]
     
     # For input nodes, use the initial inputs
-    if not inputs and node_id.startswith("input"):
-        # Extract the node index from the id (input_0, input_1, etc.)
-        node_parts = node_id.split('-')
-        node_index = node_parts[1] if len(node_parts) > 1 else '0'
-        
-        # Create a unique input key based on node ID
-        input_key = f"input_{node_index}"
-        
+    input_key = node.input_key
+    if not inputs and input_key:
         # Only use the input if it specifically exists in the initial inputs
         if input_key in initial_inputs:
             # Ensure we're getting the value correctly
             input_value = initial_inputs[input_key]
             
             # Log the input being used
-            print(f"Using input value for {node_id}: {input_key}")
+            engine_logger.debug("Using input value for %s: %s", node.id, input_key)
             
             # Handle the InputValue model or direct value
             if hasattr(input_value, 'value'):
@@ -535,16 +1729,23 @@ def get_node_inputs(node_id, edges, node_outputs, initial_inputs, nodes):
                 inputs["input"] = input_value
                 
             # Add type information that might be needed by the node
-            node_info = next((n for n in nodes if n["id"] == node_id), None)
-            if node_info:
-                input_type = node_info.get("data", {}).get("params", {}).get("type", "Text")
-                inputs["type"] = input_type
+            inputs["type"] = node.params.get("type", "Text")
     
     return inputs
 
+def render_prompt(template, inputs: Dict[str, Any]) -> str:
+    """Substitute {{key}} placeholders in a prompt, given as text or as a compiled template"""
+    segments = compile_template(template) if isinstance(template, str) else template
+    with start_span("template.render", **{"template.length": sum(len(segment) for segment in segments)}):
+        return render_template(segments, inputs)
+
 async def execute_node(node_type, node_data, inputs, mode):
     """Execute a node based on its type"""
     try:
+        # CPU-bound executors run in the process pool so they don't stall the event loop
+        if node_type in CPU_BOUND_EXECUTORS:
+            return await run_cpu_bound(node_type, node_data.get("params", {}), inputs)
+        
         # Default implementation that can be expanded based on node types
         if node_type == "input":
             return {
@@ -558,6 +1759,25 @@ async def execute_node(node_type, node_data, inputs, mode):
             return {
                 "output": node_data.get("params", {}).get("text", "Sample text")
             }
+        elif node_type in (PIPELINE_INPUT, PIPELINE_OUTPUT):
+            return {
+                "output": inputs.get("input", "")
+            }
+        elif node_type == PIPELINE:
+            return pipeline_output(node_data, inputs)
+        elif node_type == "merge":
+            return merge_values(node_data.get("params", {}), inputs)
+        elif node_type == "for-each":
+            return await run_for_each(node_data, inputs, mode)
+        elif node_type == "condition":
+            # Plans compile the condition once; a bare node's paths are compiled here
+            condition = node_data.get("condition") or Condition(node_data.get("params", {}).get("paths") or [])
+            taken = condition.evaluate(inputs)
+            value = inputs.get("input", "")
+            if taken is None:
+                return {"output": value, "path": None}
+            # Edges on the taken path's handle read the input through it
+            return {"output": value, "path": branch_handle(taken), branch_handle(taken): value}
         elif node_type == "document-to-text":
             # Simulate document processing
             await asyncio.sleep(0.5)
@@ -575,9 +1795,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             api_key = params.get("apiKey", "")
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Special handling for {{nodeName.text}} format - replace with correct {{nodeName.output}} format
             # This pattern might be used by users for input nodes, but we store everything in "output" property
@@ -613,7 +1831,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_openai_query(request_data)
+            result = await query_provider("openai", request_data)
             
             # Check for errors
             if "error" in result:
@@ -637,9 +1855,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             max_tokens = int(params.get("max_tokens", 1000))
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the Anthropic handler
             messages = [
@@ -654,7 +1870,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_anthropic_query(request_data)
+            result = await query_provider("anthropic", request_data)
             
             # Return formatted response
             return {
@@ -670,9 +1886,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             temperature = float(params.get("temperature", 0.7))
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the Gemini handler
             messages = [
@@ -686,7 +1900,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_gemini_query(request_data)
+            result = await query_provider("gemini", request_data)
             
             # Return formatted response
             return {
@@ -703,9 +1917,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             max_tokens = int(params.get("max_tokens", 1000))
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the Cohere handler
             messages = [
@@ -720,7 +1932,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_cohere_query(request_data)
+            result = await query_provider("cohere", request_data)
             
             # Return formatted response
             return {
@@ -735,9 +1947,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             prompt = params.get("prompt", "")
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the Perplexity handler
             messages = [
@@ -750,7 +1960,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_perplexity_query(request_data)
+            result = await query_provider("perplexity", request_data)
             
             # Return formatted response
             return {
@@ -764,9 +1974,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             prompt = params.get("prompt", "")
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the XAI handler
             messages = [
@@ -778,7 +1986,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_xai_query(request_data)
+            result = await query_provider("xai", request_data)
             
             # Return formatted response
             return {
@@ -793,9 +2001,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             prompt = params.get("prompt", "")
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the AWS handler
             messages = [
@@ -808,7 +2014,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_aws_query(request_data)
+            result = await query_provider("aws", request_data)
             
             # Return formatted response
             return {
@@ -826,9 +2032,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             max_tokens = int(params.get("max_tokens", 1000))
             
             # Replace variables in prompt
-            for key, value in inputs.items():
-                placeholder = f"{{{{{key}}}}}"
-                prompt = prompt.replace(placeholder, str(value))
+            prompt = render_prompt(node_data.get("templates", {}).get("prompt", prompt), inputs)
             
             # Prepare the request for the Azure handler
             messages = [
@@ -844,7 +2048,7 @@ async def execute_node(node_type, node_data, inputs, mode):
             }
             
             # Call the handler
-            result = await handle_azure_query(request_data)
+            result = await query_provider("azure", request_data)
             
             # Return formatted response
             return {
@@ -868,17 +2072,3 @@ async def execute_node(node_type, node_data, inputs, mode):
             "error": str(e),
             "output": f"Error: {str(e)}"  # Include in output for compatibility
         }
-
-# Helper function to find nodes that depend on the output of a given node
-def get_dependent_nodes(node_id, edges, remaining_nodes):
-    """Find nodes that directly or indirectly depend on the output of a given node"""
-    # Get direct dependent nodes
-    direct_dependents = [edge["target"] for edge in edges if edge["source"] == node_id]
-    
-    # Filter only nodes that are in the remaining execution order
-    dependent_nodes = [
-        node for node in remaining_nodes 
-        if node["id"] in direct_dependents
-    ]
-    
-    return dependent_nodes
\ No newline at end of file
@@ -0,0 +1,187 @@
+import asyncio
+
+import pytest
+
+from utils.admission import AdmissionController, AdmissionRejected, DeficitRoundRobin
+
+def picks(drr, count, eligible=lambda key: True):
+    return [drr.select(eligible) for _ in range(count)]
+
+def test_drr_serves_keys_in_proportion_to_weight():
+    drr = DeficitRoundRobin()
+    drr.activate("a", 3)
+    drr.activate("b", 1)
+    order = picks(drr, 40)
+    assert order.count("a") == 30
+    assert order.count("b") == 10
+    # Interleaved rounds, not a long run of one key
+    assert "aaaa" not in "".join(order)
+
+def test_drr_equal_weights_alternate():
+    drr = DeficitRoundRobin()
+    for key in "abc":
+        drr.activate(key, 1)
+    order = "".join(picks(drr, 9))
+    assert sorted(order[:3]) == ["a", "b", "c"]
+    assert order[:3] * 3 == order
+
+def test_drr_skips_ineligible_keys():
+    drr = DeficitRoundRobin()
+    drr.activate("a", 5)
+    drr.activate("b", 1)
+    assert picks(drr, 3, lambda key: key == "b") == ["b", "b", "b"]
+    assert drr.select(lambda key: False) is None
+
+def test_drr_deactivate_drops_key():
+    drr = DeficitRoundRobin()
+    drr.activate("a", 1)
+    drr.activate("b", 1)
+    drr.deactivate("a")
+    drr.deactivate("missing")
+    assert picks(drr, 3) == ["b", "b", "b"]
+    drr.deactivate("b")
+    assert not drr
+    assert drr.select(lambda key: True) is None
+
+def test_drr_weight_is_at_least_one():
+    drr = DeficitRoundRobin()
+    drr.activate("a", 0)
+    assert drr.select(lambda key: True) == "a"
+
+async def admission_order(controller, requests, hold=0.01):
+    """Fill the controller with a blocker, queue `requests` (user, lane, plan) in order, return the order they ran in"""
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with controller.admit("blocker"):
+            await release.wait()
+
+    async def request(user_id, lane, plan):
+        async with controller.admit(user_id, lane, plan):
+            order.append(user_id)
+            await asyncio.sleep(hold)
+
+    blocking = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = []
+    for user_id, lane, plan in requests:
+        tasks.append(asyncio.create_task(request(user_id, lane, plan)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocking, *tasks)
+    return order
+
+def controller(**kwargs):
+    options = {"max_in_flight": 1, "max_per_user": 10, "queue_size": 100, "queue_timeout": 5.0}
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+def test_backlogged_user_does_not_starve_others():
+    requests = [("heavy", "interactive", "free")] * 6 + [("light", "interactive", "free")]
+    order = asyncio.run(admission_order(controller(), requests))
+    assert order.index("light") <= 1
+    assert order.count("heavy") == 6
+
+def test_plan_weights_share_a_lane():
+    requests = [("pro", "interactive", "pro")] * 8 + [("free", "interactive", "free")] * 8
+    order = asyncio.run(admission_order(controller(plan_weights={"pro": 3, "free": 1}), requests))
+    assert order[:8].count("pro") == 6
+
+def test_lane_weights_share_slots():
+    requests = [("batch", "batch", "free")] * 8 + [("live", "interactive", "free")] * 8
+    order = asyncio.run(admission_order(controller(lane_weights={"interactive": 3, "batch": 1}), requests))
+    assert order[:8].count("live") == 6
+
+def test_users_at_their_limit_are_skipped():
+    async def scenario():
+        admission = controller(max_in_flight=2, max_per_user=1)
+        order = []
+        release = asyncio.Event()
+
+        async def holder():
+            async with admission.admit("a"):
+                await release.wait()
+
+        async def request(user_id):
+            async with admission.admit(user_id):
+                order.append(user_id)
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        # "a" is at its limit, so its second request waits while "b" runs
+        second = asyncio.create_task(request("a"))
+        await asyncio.sleep(0)
+        await request("b")
+        assert order == ["b"]
+        release.set()
+        await asyncio.gather(holding, second)
+        return order
+    assert asyncio.run(scenario()) == ["b", "a"]
+
+def test_full_queue_rejects():
+    async def scenario():
+        admission = controller(queue_size=1)
+        release = asyncio.Event()
+
+        async def hold(user_id):
+            async with admission.admit(user_id):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold("a")), asyncio.create_task(hold("b"))]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with admission.admit("c"):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value
+    rejected = asyncio.run(scenario())
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after >= 1
+
+def test_queue_timeout_rejects_and_leaves_the_queue():
+    async def scenario():
+        admission = controller(queue_timeout=0.02)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.admit("a"):
+                await release.wait()
+
+        holding = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected, match="timeout"):
+            async with admission.admit("b"):
+                pass
+        assert admission._queued == 0
+        release.set()
+        await holding
+        return admission
+    admission = asyncio.run(scenario())
+    assert admission._in_flight == 0
+    assert admission._per_user == {}
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        admission = controller()
+        release = asyncio.Event()
+
+        async def hold(user_id):
+            async with admission.admit(user_id):
+                await release.wait()
+
+        holding = asyncio.create_task(hold("a"))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(hold("b"))
+        await asyncio.sleep(0)
+        assert admission._queued == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert admission._queued == 0
+        release.set()
+        await holding
+        return admission
+    admission = asyncio.run(scenario())
+    assert admission._in_flight == 0
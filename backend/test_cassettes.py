@@ -0,0 +1,23 @@
+import asyncio
+
+from utils.cassettes import CassetteStore
+
+def test_concurrent_records_stay_one_per_line(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    store = CassetteStore(path, "record")
+
+    async def record_all():
+        await asyncio.gather(*(
+            store.record("openai", {"model": "gpt-4o", "prompt": str(k)}, {"content": str(k) * 20000}, 0.1)
+            for k in range(50)
+        ))
+    asyncio.run(record_all())
+
+    replay = CassetteStore(path, "replay", latency_scale=0)
+    assert sum(len(entries) for entries in replay._entries.values()) == 50
+    response = asyncio.run(replay.replay("openai", {"model": "gpt-4o", "prompt": "7", "apiKey": "x"}))
+    assert response["content"] == "7" * 20000
+
+def test_replay_miss_reports_an_error(tmp_path):
+    replay = CassetteStore(str(tmp_path / "missing.jsonl"), "replay")
+    assert asyncio.run(replay.replay("openai", {"model": "gpt-4o"}))["error"] == "cassette_miss"
@@ -0,0 +1,98 @@
+import pytest
+
+from utils.conditions import Condition, branch_handle, compile_clause, compile_expression, resolve_field
+
+def test_expression_uses_inputs_and_whitelisted_functions():
+    expression = compile_expression("len(value) > 2 and max(a, b) * 2 == 10")
+    assert expression({"value": "abc", "a": 5, "b": 1}) is True
+    assert expression({"value": "ab", "a": 5, "b": 1}) is False
+
+@pytest.mark.parametrize("source", [
+    "value.__class__",
+    "__import__('os')",
+    "open('x')",
+    "[x for x in value]",
+    "lambda: 1",
+    "value ** 2",
+    "value << 2",
+])
+def test_expression_rejects_syntax_outside_whitelist(source):
+    with pytest.raises(ValueError):
+        compile_expression(source)
+
+def test_expression_reports_syntax_errors():
+    with pytest.raises(ValueError, match="Invalid expression"):
+        compile_expression("value ==")
+
+@pytest.mark.parametrize("source", [
+    "'a' * 1000000000",
+    "1000000000 * 'a'",
+    "[0] * 1000000000",
+    "(0,) * 1000000000",
+    "value == 'x' * 10",
+])
+def test_expression_rejects_literal_sequence_repetition(source):
+    with pytest.raises(ValueError, match="repeat"):
+        compile_expression(source)
+
+@pytest.mark.parametrize("value", ["a", [0], (0,), b"a"])
+def test_expression_rejects_sequence_repetition_of_inputs(value):
+    expression = compile_expression("len(value * 1000000000) > 0")
+    with pytest.raises(ValueError, match="repeat"):
+        expression({"value": value})
+
+def test_expression_still_multiplies_numbers():
+    assert compile_expression("value * 3 - 1")({"value": 2}) == 5
+    assert compile_expression("2.5 * value")({"value": 2}) == 5.0
+
+def test_expression_reports_unknown_names():
+    with pytest.raises(ValueError, match="missing"):
+        compile_expression("missing > 1")({})
+
+def test_resolve_field_paths():
+    inputs = {"input": '{"user": {"tags": ["a", "b"]}}', "other": {"n": 3}}
+    assert resolve_field(inputs, "") == inputs["input"]
+    assert resolve_field(inputs, "user.tags.1") == "b"
+    assert resolve_field(inputs, "{{ other.n }}") == 3
+    assert resolve_field(inputs, "user.missing") is None
+
+@pytest.mark.parametrize("operator, value, actual, expected", [
+    ("contains", "ell", "hello", True),
+    ("contains", "b", '["a", "b"]', True),
+    ("begins_with", "he", "hello", True),
+    ("length_gt", "3", "hello", True),
+    ("is_empty", "", "  ", True),
+    ("equals", "2", "2.0", True),
+    ("not_equals", "a", "a", False),
+    ("greater_than", "1", "1.5", True),
+    ("less_equal", "1", "x", False),
+    ("is_true", "", "yes", True),
+    ("has_key", "k", '{"k": 1}', True),
+])
+def test_clause_operators(operator, value, actual, expected):
+    clause = compile_clause({"inputField": "", "operator": operator, "value": value})
+    assert clause({"input": actual}) is expected
+
+def test_numeric_operator_needs_number():
+    with pytest.raises(ValueError, match="needs a number"):
+        compile_clause({"operator": "greater_than", "value": "many"})
+
+def test_condition_takes_first_matching_path_and_else():
+    condition = Condition([
+        {"clauses": [{"operator": "equals", "value": "a"}]},
+        {"clauses": [{"operator": "contains", "value": "b"}, {"operator": "contains", "value": "c"}], "logicalOperator": "OR"},
+        {"clauses": []},
+    ])
+    assert condition.evaluate({"input": "a"}) == 0
+    assert condition.evaluate({"input": "xc"}) == 1
+    assert condition.evaluate({"input": "z"}) == 2
+    assert branch_handle(2) == "path_2"
+
+def test_condition_with_single_path_can_match_nothing():
+    assert Condition([{"clauses": [{"operator": "equals", "value": "a"}]}]).evaluate({"input": "b"}) is None
+
+def test_invalid_condition_fails_when_evaluated():
+    condition = Condition([{"clauses": [{"operator": "nope", "value": "a"}]}, {}])
+    assert "nope" in condition.error
+    with pytest.raises(ValueError):
+        condition.evaluate({"input": "a"})
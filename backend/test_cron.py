@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+
+from utils.cron import CronExpression
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("* * * * *", datetime(2024, 1, 1, 12, 0, 30), datetime(2024, 1, 1, 12, 1)),
+    ("*/15 * * * *", datetime(2024, 1, 1, 12, 50), datetime(2024, 1, 1, 13, 0)),
+    ("10-50/20 * * * *", datetime(2024, 1, 1, 12, 31), datetime(2024, 1, 1, 12, 50)),
+    ("5/15 * * * *", datetime(2024, 1, 1, 12, 6), datetime(2024, 1, 1, 12, 20)),
+    ("0 9 * * mon-fri", datetime(2024, 1, 5, 9, 0), datetime(2024, 1, 8, 9, 0)),
+    ("0 0 1 jan *", datetime(2024, 6, 1), datetime(2025, 1, 1)),
+    ("30 23 31 * *", datetime(2024, 4, 1), datetime(2024, 5, 31, 23, 30)),
+    ("0 0 29 feb *", datetime(2024, 3, 1), datetime(2028, 2, 29)),
+    ("0 12 * * 7", datetime(2024, 1, 1), datetime(2024, 1, 7, 12, 0)),
+    ("0,30 8 * * *", datetime(2024, 1, 1, 8, 0), datetime(2024, 1, 1, 8, 30)),
+])
+def test_next_after(expression, after, expected):
+    assert CronExpression(expression).next_after(after) == expected
+
+def test_next_after_is_strictly_after():
+    assert CronExpression("0 12 * * *").next_after(datetime(2024, 1, 1, 12, 0)) == datetime(2024, 1, 2, 12, 0)
+
+def test_restricted_day_fields_match_either():
+    # The 13th, or any Friday
+    cron = CronExpression("0 0 13 * fri")
+    assert cron.next_after(datetime(2024, 1, 1)) == datetime(2024, 1, 5)
+    assert cron.next_after(datetime(2024, 1, 12)) == datetime(2024, 1, 13)
+
+@pytest.mark.parametrize("day_field", ["*", "*/1", "1-31"])
+def test_full_range_day_of_month_is_unrestricted(day_field):
+    # Only Mondays, not "every day or Monday"
+    cron = CronExpression(f"0 0 {day_field} * mon")
+    assert cron.next_after(datetime(2024, 1, 1)) == datetime(2024, 1, 8)
+
+@pytest.mark.parametrize("weekday_field", ["*", "*/1", "0-6", "0-7"])
+def test_full_range_day_of_week_is_unrestricted(weekday_field):
+    cron = CronExpression(f"0 0 15 * {weekday_field}")
+    assert cron.next_after(datetime(2024, 1, 1)) == datetime(2024, 1, 15)
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "60 * * * *",
+    "* 24 * * *",
+    "* * 0 * *",
+    "* * * 13 *",
+    "* * * * 8",
+    "*/0 * * * *",
+    "5-1 * * * *",
+    "x * * * *",
+    "0 0 31 feb *",
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
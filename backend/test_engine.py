@@ -0,0 +1,196 @@
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from factories import edge, node
+from routers import workflows
+from utils.plans import ExecutionPlan, compile_plan
+
+class FakeTasks:
+    """Stands in for execute_node on "task" nodes: sleeps `delay`, then returns `value`.
+
+    fail="raise" makes the node fail; fail="output" returns an error output,
+    the way provider nodes report failed calls.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.started = []
+        self.finished = []
+        self.cancelled = []
+        self.execute_node = workflows.execute_node
+
+    async def __call__(self, node_type, node_data, inputs, mode):
+        if node_type != "task":
+            return await self.execute_node(node_type, node_data, inputs, mode)
+        params = node_data["params"]
+        self.started.append(params["value"])
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(params.get("delay", 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(params["value"])
+            raise
+        finally:
+            self.running -= 1
+        self.finished.append(params["value"])
+        if params.get("fail") == "raise":
+            raise RuntimeError(f"{params['value']} failed")
+        if params.get("fail") == "output":
+            return {"output": "", "error": f"{params['value']} failed"}
+        return {"output": params["value"]}
+
+@pytest.fixture
+def tasks(monkeypatch):
+    fake = FakeTasks()
+    monkeypatch.setattr(workflows, "execute_node", fake)
+    return fake
+
+def merge_workflow(merge_params, branches, extra_nodes=(), extra_edges=()):
+    """input-0 fans out to one task per branch, all feeding merge-0 -> output-0"""
+    nodes = [node("input-0", "input"), node("merge-0", "merge", **merge_params), node("output-0", "output")]
+    edges = [edge("merge-0", "output-0")]
+    for k, branch in enumerate(branches):
+        nodes.append(node(f"task-{k}", "task", nodeName=f"t{k}", **branch))
+        edges += [edge("input-0", f"task-{k}"), edge(f"task-{k}", "merge-0")]
+    return nodes + list(extra_nodes), edges + list(extra_edges)
+
+def run(nodes, edges):
+    plan = ExecutionPlan.from_document(compile_plan(nodes, edges))
+    node_results = {}
+
+    async def execute():
+        return await workflows.execute_graph(plan, {"input_0": {"value": "in", "type": "Text"}}, "standard", node_results)
+    started = time.perf_counter()
+    path, results = asyncio.run(execute())
+    return path, results, node_results, time.perf_counter() - started
+
+def statuses(node_results):
+    return {node_id: result["status"] for node_id, result in node_results.items()}
+
+def test_wait_all_combines_every_input_in_edge_order(tasks):
+    nodes, edges = merge_workflow({"mode": "wait-all"}, [
+        {"value": "a", "delay": 0.03}, {"value": "b", "delay": 0.02}, {"value": "c", "delay": 0.01}
+    ])
+    path, results, node_results, _ = run(nodes, edges)
+    assert results["output_0"].output == "a\nb\nc"
+    assert tasks.finished == ["c", "b", "a"]
+    assert set(statuses(node_results).values()) == {"success"}
+    assert path.index("merge-0") > max(path.index(f"task-{k}") for k in range(3))
+    assert path.index("output-0") == len(path) - 1
+
+@pytest.mark.parametrize("combine, expected", [
+    ("list", ["a", "b"]),
+    ("keyed", {"t0": "a", "t1": "b"}),
+])
+def test_wait_all_combine_modes(tasks, combine, expected):
+    nodes, edges = merge_workflow({"mode": "wait-all", "combine": combine}, [
+        {"value": "a", "delay": 0.02}, {"value": "b"}
+    ])
+    _, results, _, _ = run(nodes, edges)
+    assert results["output_0"].output == expected
+
+def test_wait_first_takes_the_first_arrival_and_cancels_the_rest(tasks):
+    nodes, edges = merge_workflow({"mode": "wait-first"}, [
+        {"value": "slow", "delay": 2.0}, {"value": "fast", "delay": 0.01}
+    ])
+    _, results, node_results, elapsed = run(nodes, edges)
+    assert results["output_0"].output == "fast"
+    assert tasks.cancelled == ["slow"]
+    assert statuses(node_results)["task-0"] == "cancelled"
+    assert statuses(node_results)["merge-0"] == "success"
+    assert elapsed < 1.0
+
+def test_quorum_runs_with_the_first_arrivals_in_edge_order(tasks):
+    nodes, edges = merge_workflow({"mode": "quorum", "quorum": 2, "combine": "list"}, [
+        {"value": "slow", "delay": 2.0}, {"value": "second", "delay": 0.03}, {"value": "first", "delay": 0.01}
+    ])
+    _, results, node_results, elapsed = run(nodes, edges)
+    assert results["output_0"].output == ["second", "first"]
+    assert tasks.cancelled == ["slow"]
+    assert statuses(node_results)["task-0"] == "cancelled"
+    assert elapsed < 1.0
+
+def test_losing_branch_still_needed_elsewhere_is_not_cancelled(tasks):
+    nodes, edges = merge_workflow(
+        {"mode": "wait-first"},
+        [{"value": "slow", "delay": 0.05}, {"value": "fast"}],
+        [node("output-1", "output")],
+        [edge("task-0", "output-1")]
+    )
+    _, results, node_results, _ = run(nodes, edges)
+    assert results["output_0"].output == "fast"
+    assert results["output_1"].output == "slow"
+    assert tasks.cancelled == []
+    assert "cancelled" not in statuses(node_results).values()
+
+def test_cancelling_a_branch_cancels_upstream_only_it_needed(tasks):
+    nodes, edges = merge_workflow({"mode": "wait-first"}, [{"value": "fast"}])
+    nodes += [node("task-8", "task", value="feeder", delay=2.0), node("task-9", "task", value="loser")]
+    edges += [edge("input-0", "task-8"), edge("task-8", "task-9"), edge("task-9", "merge-0")]
+    _, results, node_results, elapsed = run(nodes, edges)
+    assert results["output_0"].output == "fast"
+    assert statuses(node_results)["task-8"] == "cancelled"
+    assert statuses(node_results)["task-9"] == "cancelled"
+    assert "loser" not in tasks.started
+    assert elapsed < 1.0
+
+@pytest.mark.parametrize("merge_params", [
+    {"mode": "wait-all"},
+    {"mode": "wait-first"},
+    {"mode": "quorum", "quorum": 2},
+])
+def test_failing_upstream_node_stops_the_run(tasks, merge_params):
+    nodes, edges = merge_workflow(merge_params, [
+        {"value": "slow", "delay": 2.0}, {"value": "broken", "fail": "raise"}
+    ])
+    with pytest.raises(Exception, match="Error in node task-1"):
+        run(nodes, edges)
+    assert tasks.cancelled == ["slow"]
+
+def test_wait_all_passes_error_outputs_through(tasks):
+    nodes, edges = merge_workflow({"mode": "wait-all", "combine": "keyed"}, [
+        {"value": "a"}, {"value": "b", "fail": "output"}
+    ])
+    _, results, node_results, _ = run(nodes, edges)
+    assert results["output_0"].output == {"t0": "a", "t1": ""}
+    assert statuses(node_results)["merge-0"] == "success"
+
+def test_wait_first_skips_error_outputs(tasks):
+    nodes, edges = merge_workflow({"mode": "wait-first"}, [
+        {"value": "good", "delay": 0.03}, {"value": "bad", "fail": "output"}
+    ])
+    _, results, _, _ = run(nodes, edges)
+    assert results["output_0"].output == "good"
+
+def test_quorum_short_of_usable_inputs_fails_the_merge(tasks):
+    nodes, edges = merge_workflow({"mode": "quorum", "quorum": 2}, [
+        {"value": "good"}, {"value": "bad", "fail": "output"}
+    ])
+    with pytest.raises(Exception, match="Merge needed 2 input"):
+        run(nodes, edges)
+
+def test_node_concurrency_is_bounded(tasks, monkeypatch):
+    monkeypatch.setattr(settings, "EXECUTION_NODE_CONCURRENCY", 2)
+    nodes = [node("input-0", "input")]
+    edges = []
+    for k in range(6):
+        nodes += [node(f"task-{k}", "task", value=str(k), delay=0.02), node(f"output-{k}", "output")]
+        edges += [edge("input-0", f"task-{k}"), edge(f"task-{k}", f"output-{k}")]
+    path, results, node_results, _ = run(nodes, edges)
+    assert tasks.peak == 2
+    # Earlier plan nodes start first
+    assert tasks.started == [node_id.split("-")[1] for node_id in path if node_id.startswith("task-")]
+    assert {key: result.output for key, result in results.items()} == {f"output_{k}": str(k) for k in range(6)}
+    assert set(statuses(node_results).values()) == {"success"}
+
+def test_independent_branches_run_concurrently(tasks, monkeypatch):
+    monkeypatch.setattr(settings, "EXECUTION_NODE_CONCURRENCY", 8)
+    nodes, edges = merge_workflow({"mode": "wait-all"}, [{"value": str(k), "delay": 0.1} for k in range(4)])
+    _, _, _, elapsed = run(nodes, edges)
+    assert tasks.peak == 4
+    assert elapsed < 0.35
@@ -0,0 +1,242 @@
+import json
+
+from factories import create_workflow, edge, node
+
+INPUTS = {"inputs": {"input_0": {"value": "hello"}}}
+
+def chain(api):
+    """input-0 -> text-0 -> text-1 -> output-0"""
+    return create_workflow(
+        api,
+        [node("input-0", "input"), node("text-0", "text", text="a"), node("text-1", "text", text="b"), node("output-0", "output")],
+        [edge("input-0", "text-0"), edge("text-0", "text-1"), edge("text-1", "output-0")]
+    )
+
+def test_node_run_reuses_intermediate_outputs_of_a_full_run(api):
+    workflow_id = chain(api)
+    execution = api.post(f"/api/workflows/{workflow_id}/execute", json=INPUTS).json()
+    assert execution["status"] == "success"
+    # Intermediate outputs are released, not kept in node_results
+    assert "output" not in execution["node_results"]["text-0"]
+
+    run = api.post(f"/api/workflows/{workflow_id}/nodes/text-1/run", json=INPUTS).json()
+    assert run["status"] == "success"
+    assert set(run["cached_nodes"]) == {"input-0", "text-0"}
+    assert run["executed_nodes"] == ["text-1"]
+
+def test_released_outputs_are_only_reused_for_matching_fingerprints(api):
+    workflow_id = chain(api)
+    api.post(f"/api/workflows/{workflow_id}/execute", json=INPUTS)
+    run = api.post(f"/api/workflows/{workflow_id}/nodes/text-1/run", json={"inputs": {"input_0": {"value": "other"}}}).json()
+    assert run["cached_nodes"] == []
+
+def test_released_outputs_over_the_size_cap_are_not_stored(api, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "NODE_OUTPUT_CACHE_MAX_KB", 1)
+    workflow_id = create_workflow(
+        api,
+        [node("input-0", "input"), node("text-0", "text", text="x" * 2000), node("text-1", "text", text="b"), node("output-0", "output")],
+        [edge("input-0", "text-0"), edge("text-0", "text-1"), edge("text-1", "output-0")]
+    )
+    api.post(f"/api/workflows/{workflow_id}/execute", json=INPUTS)
+    run = api.post(f"/api/workflows/{workflow_id}/nodes/text-1/run", json=INPUTS).json()
+    assert run["cached_nodes"] == ["input-0"]
+
+def two_outputs(api):
+    """input-0 -> text-0 -> output-0 and input-0 -> text-1 -> output-1, plus text-2 feeding nothing"""
+    return create_workflow(
+        api,
+        [
+            node("input-0", "input"), node("text-0", "text", text="a"), node("output-0", "output"),
+            node("text-1", "text", text="b"), node("output-1", "output"), node("text-2", "text", text="c"),
+        ],
+        [edge("input-0", "text-0"), edge("text-0", "output-0"), edge("input-0", "text-1"), edge("text-1", "output-1"), edge("input-0", "text-2")]
+    )
+
+def test_full_run_executes_every_node(api):
+    execution = api.post(f"/api/workflows/{two_outputs(api)}/execute", json=INPUTS).json()
+    assert execution["pruned_nodes"] == []
+    assert set(execution["node_results"]) == {"input-0", "text-0", "output-0", "text-1", "output-1", "text-2"}
+
+def test_lazy_run_prunes_nodes_feeding_no_output(api):
+    execution = api.post(f"/api/workflows/{two_outputs(api)}/execute", json={**INPUTS, "lazy": True}).json()
+    assert execution["status"] == "success"
+    assert execution["pruned_nodes"] == ["text-2"]
+    assert "text-2" not in execution["node_results"]
+    assert {key: result["output"] for key, result in execution["outputs"].items()} == {"output_0": "a", "output_1": "b"}
+
+def test_requested_outputs_run_only_their_dependencies(api):
+    execution = api.post(f"/api/workflows/{two_outputs(api)}/execute", json={**INPUTS, "outputs": ["output-1"]}).json()
+    assert execution["status"] == "success"
+    assert set(execution["pruned_nodes"]) == {"text-0", "output-0", "text-2"}
+    assert set(execution["node_results"]) == {"input-0", "text-1", "output-1"}
+    assert list(execution["outputs"]) == ["output_1"]
+
+def test_requested_outputs_must_be_output_nodes(api):
+    response = api.post(f"/api/workflows/{two_outputs(api)}/execute", json={**INPUTS, "outputs": ["text-1", "output-9"]})
+    assert response.status_code == 400
+    assert "text-1, output-9" in response.json()["detail"]
+
+def test_node_run_executes_only_the_node_and_its_dependencies(api):
+    run = api.post(f"/api/workflows/{two_outputs(api)}/nodes/text-1/run", json=INPUTS).json()
+    assert run["status"] == "success"
+    assert run["output"] == "b"
+    assert run["executed_nodes"] == ["input-0", "text-1"]
+    assert run["cached_nodes"] == []
+
+def test_node_run_reuses_outputs_of_an_earlier_node_run(api):
+    workflow_id = chain(api)
+    api.post(f"/api/workflows/{workflow_id}/nodes/text-1/run", json=INPUTS)
+    run = api.post(f"/api/workflows/{workflow_id}/nodes/output-0/run", json=INPUTS).json()
+    assert set(run["cached_nodes"]) == {"input-0", "text-0", "text-1"}
+    assert run["executed_nodes"] == ["output-0"]
+    assert run["output"] == "b"
+
+def test_node_run_refresh_ignores_the_cache(api):
+    workflow_id = chain(api)
+    api.post(f"/api/workflows/{workflow_id}/nodes/text-1/run", json=INPUTS)
+    run = api.post(f"/api/workflows/{workflow_id}/nodes/text-1/run?refresh=true", json=INPUTS).json()
+    assert run["cached_nodes"] == []
+    assert run["executed_nodes"] == ["input-0", "text-0", "text-1"]
+
+def test_editing_a_node_invalidates_it_and_everything_downstream(api):
+    workflow_id = chain(api)
+    api.post(f"/api/workflows/{workflow_id}/nodes/output-0/run", json=INPUTS)
+    patched = api.patch(f"/api/workflows/{workflow_id}", json={"update_nodes": [{"id": "text-0", "data": {"params": {"text": "z"}}}]})
+    assert patched.status_code == 200
+    run = api.post(f"/api/workflows/{workflow_id}/nodes/output-0/run", json=INPUTS).json()
+    assert run["cached_nodes"] == ["input-0"]
+    assert run["executed_nodes"] == ["text-0", "text-1", "output-0"]
+
+def test_node_run_unknown_node(api):
+    response = api.post(f"/api/workflows/{chain(api)}/nodes/text-9/run", json=INPUTS)
+    assert response.status_code == 404
+
+def for_each(api, **params):
+    """input-0 -> for-each-0, whose body reads each element's name, -> output-0"""
+    return create_workflow(
+        api,
+        [node("input-0", "input"), node("for-each-0", "for-each", **params), node("json-0", "json-handler", keys=["name"]), node("output-0", "output")],
+        [edge("input-0", "for-each-0"), edge("for-each-0", "json-0", "item"), edge("json-0", "for-each-0", None, "results"), edge("for-each-0", "output-0")]
+    )
+
+def items(*values):
+    return {"inputs": {"input_0": {"value": list(values)}}, "keep_outputs": ["for-each-0"]}
+
+def test_for_each_gathers_results_in_element_order(api):
+    execution = api.post(f"/api/workflows/{for_each(api, concurrency=3)}/execute", json=items(*({"name": str(k)} for k in range(7)))).json()
+    assert execution["status"] == "success"
+    assert execution["outputs"]["output_0"]["output"] == [str(k) for k in range(7)]
+    output = execution["node_results"]["for-each-0"]["output"]
+    assert (output["count"], output["errors"]) == (7, [])
+    # The body runs per element and never shows up as nodes of the run
+    assert execution["execution_path"] == ["input-0", "for-each-0", "output-0"]
+
+def test_for_each_reads_json_text_and_lines(api):
+    workflow_id = for_each(api)
+    as_json = api.post(f"/api/workflows/{workflow_id}/execute", json={"inputs": {"input_0": {"value": '[{"name": "a"}]'}}}).json()
+    assert as_json["outputs"]["output_0"]["output"] == ["a"]
+    as_lines = api.post(f"/api/workflows/{workflow_id}/execute", json={"inputs": {"input_0": {"value": '{"name": "x"}\n\n{"name": "y"}'}}}).json()
+    assert as_lines["outputs"]["output_0"]["output"] == ["x", "y"]
+
+def test_for_each_failed_element_gathers_none(api):
+    execution = api.post(f"/api/workflows/{for_each(api)}/execute", json=items({"name": "a"}, "not json", {"name": "c"})).json()
+    assert execution["status"] == "success"
+    assert execution["outputs"]["output_0"]["output"] == ["a", None, "c"]
+    errors = execution["node_results"]["for-each-0"]["output"]["errors"]
+    assert [error["index"] for error in errors] == [1]
+
+def test_for_each_stop_on_error_fails_the_node(api):
+    execution = api.post(f"/api/workflows/{for_each(api, stopOnError=True, concurrency=1)}/execute", json=items({"name": "a"}, "not json", {"name": "c"})).json()
+    assert execution["status"] == "error"
+    assert "Item 1 failed" in execution["error"]
+    assert execution["node_results"]["for-each-0"]["status"] == "error"
+
+def test_for_each_item_limit(api, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "FOR_EACH_MAX_ITEMS", 2)
+    execution = api.post(f"/api/workflows/{for_each(api)}/execute", json=items({"name": "a"}, {"name": "b"}, {"name": "c"})).json()
+    assert execution["status"] == "error"
+    assert "more than the limit of 2" in execution["error"]
+
+def server_sent_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_for_each_streams_item_progress(api):
+    response = api.post(f"/api/workflows/{for_each(api, concurrency=1)}/execute?stream=true", json=items({"name": "a"}, "not json"))
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = server_sent_events(response.text)
+    assert [name for name, _ in events] == ["progress", "progress", "result"]
+    progress = [data for _, data in events[:2]]
+    assert [(data["index"], data["status"], data["completed"], data["total"]) for data in progress] == [(0, "success", 1, 2), (1, "error", 2, 2)]
+    assert events[-1][1]["outputs"]["output_0"]["output"] == ["a", None]
+
+def pipeline_parent(api, child_id, edges_in=None, extra_nodes=()):
+    """input-0 -> pipeline-0 (embedding child_id) -> output-0"""
+    return create_workflow(
+        api,
+        [node("input-0", "input"), node("pipeline-0", "pipeline", pipeline=child_id), node("output-0", "output"), *extra_nodes],
+        (edges_in or [edge("input-0", "pipeline-0")]) + [edge("pipeline-0", "output-0")]
+    )
+
+def test_pipeline_runs_the_embedded_workflow_inline(api):
+    child_id = create_workflow(
+        api,
+        [node("input-0", "input"), node("text-0", "text", text="child"), node("output-0", "output", nodeName="echo"), node("output-1", "output", nodeName="text")],
+        [edge("input-0", "output-0"), edge("input-0", "text-0"), edge("text-0", "output-1")]
+    )
+    execution = api.post(f"/api/workflows/{pipeline_parent(api, child_id)}/execute", json={**INPUTS, "keep_outputs": ["pipeline-0"]}).json()
+    assert execution["status"] == "success"
+    # Outputs by name; the first by name is the pipeline's output
+    assert execution["node_results"]["pipeline-0"]["output"]["outputs"] == {"echo": "hello", "text": "child"}
+    assert execution["outputs"]["output_0"]["output"] == "hello"
+    assert list(execution["outputs"]) == ["output_0"]
+    assert {"pipeline-0/input-0", "pipeline-0/text-0", "pipeline-0/output-0"} <= set(execution["execution_path"])
+    assert execution["execution_path"].index("pipeline-0/output-1") < execution["execution_path"].index("pipeline-0")
+
+def test_pipeline_edges_feed_inputs_by_name(api):
+    child_id = create_workflow(
+        api,
+        [node("input-0", "input", nodeName="first"), node("input-1", "input", nodeName="second"),
+         node("merge-0", "merge", combine="list"), node("output-0", "output")],
+        [edge("input-0", "merge-0"), edge("input-1", "merge-0"), edge("merge-0", "output-0")]
+    )
+    parent_id = pipeline_parent(
+        api, child_id,
+        [edge("input-0", "pipeline-0", None, "second"), edge("text-0", "pipeline-0", None, "first")],
+        [node("text-0", "text", text="from text")]
+    )
+    execution = api.post(f"/api/workflows/{parent_id}/execute", json=INPUTS).json()
+    assert execution["outputs"]["output_0"]["output"] == ["from text", "hello"]
+
+def test_pipeline_picks_up_a_saved_embedded_workflow(api):
+    child_id = create_workflow(api, [node("text-0", "text", text="v1"), node("output-0", "output")], [edge("text-0", "output-0")])
+    parent_id = pipeline_parent(api, child_id)
+    assert api.post(f"/api/workflows/{parent_id}/execute", json=INPUTS).json()["outputs"]["output_0"]["output"] == "v1"
+    api.patch(f"/api/workflows/{child_id}", json={"update_nodes": [{"id": "text-0", "data": {"params": {"text": "v2"}}}]})
+    assert api.post(f"/api/workflows/{parent_id}/execute", json=INPUTS).json()["outputs"]["output_0"]["output"] == "v2"
+
+def test_pipeline_cycle_fails_the_run(api):
+    first_id = create_workflow(api, [node("input-0", "input"), node("output-0", "output")], [edge("input-0", "output-0")])
+    second_id = pipeline_parent(api, first_id)
+    # first now embeds second, which embeds first
+    api.patch(f"/api/workflows/{first_id}", json={"add_nodes": [node("pipeline-0", "pipeline", pipeline=second_id)]})
+    execution = api.post(f"/api/workflows/{second_id}/execute", json=INPUTS).json()
+    assert execution["status"] == "error"
+    assert "which embeds this one" in execution["error"]
+
+def test_pipeline_self_embedding_fails_the_run(api):
+    workflow_id = create_workflow(api, [node("input-0", "input"), node("output-0", "output")], [edge("input-0", "output-0")])
+    api.patch(f"/api/workflows/{workflow_id}", json={"add_nodes": [node("pipeline-0", "pipeline", pipeline=workflow_id)]})
+    execution = api.post(f"/api/workflows/{workflow_id}/execute", json=INPUTS).json()
+    assert execution["status"] == "error"
+    assert "which embeds this one" in execution["error"]
+
+def test_pipeline_of_a_missing_workflow_fails_the_run(api):
+    execution = api.post(f"/api/workflows/{pipeline_parent(api, '65f0000000000000000000ff')}/execute", json=INPUTS).json()
+    assert execution["status"] == "error"
+    assert "was not found" in execution["error"]
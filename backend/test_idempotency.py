@@ -0,0 +1,112 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from conftest import USER
+from factories import create_workflow, edge, node
+from models.workflow import WorkflowExecutionRequest
+from routers import workflows
+from utils.admission import AdmissionRejected
+from utils.idempotency import KEY_PREFIX, request_digest
+
+INPUTS = {"inputs": {"input_0": {"value": "hello"}}}
+
+def echo(api):
+    return create_workflow(api, [node("input-0", "input"), node("output-0", "output")], [edge("input-0", "output-0")])
+
+def execute(api, workflow_id, body=INPUTS, key="k1", **params):
+    return api.post(f"/api/workflows/{workflow_id}/execute", json=body, params=params, headers={"Idempotency-Key": key})
+
+def executions(api):
+    return asyncio.run(api.app.mongodb.workflow_executions.find({}).to_list(None))
+
+def hold_key(api, workflow_id, status):
+    """Claim k1 for an execution recorded with status, as an earlier request would have"""
+    execution_id = ObjectId()
+    asyncio.run(api.app.mongodb.workflow_executions.insert_one({
+        "_id": execution_id, "workflow_id": workflow_id, "user_id": USER.id,
+        "status": status, "started_at": datetime.utcnow()
+    }))
+    digest = request_digest(jsonable_encoder(WorkflowExecutionRequest(**INPUTS)))
+    api.app.redis.set(f"{KEY_PREFIX}{USER.id}:{workflow_id}:k1", f"{execution_id} {digest}")
+    return execution_id
+
+def test_repeat_replays_the_first_execution(api):
+    workflow_id = echo(api)
+    first = execute(api, workflow_id)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    repeat = execute(api, workflow_id, body={**INPUTS, "priority": "batch"})
+    assert repeat.status_code == 200
+    assert repeat.headers["Idempotent-Replayed"] == "true"
+    assert repeat.json()["execution_id"] == first.json()["execution_id"]
+    assert repeat.json()["outputs"] == first.json()["outputs"]
+    assert len(executions(api)) == 1
+
+def test_keys_are_scoped_to_the_workflow(api):
+    first, second = echo(api), echo(api)
+    assert execute(api, first).json()["execution_id"] != execute(api, second).json()["execution_id"]
+    assert len(executions(api)) == 2
+
+def test_key_reused_for_a_different_request_is_rejected(api):
+    workflow_id = echo(api)
+    execute(api, workflow_id)
+    response = execute(api, workflow_id, body={"inputs": {"input_0": {"value": "other"}}})
+    assert response.status_code == 422
+    assert len(executions(api)) == 1
+
+def test_repeat_of_a_running_execution_times_out(api, monkeypatch):
+    monkeypatch.setattr(workflows.settings, "IDEMPOTENCY_WAIT_TIMEOUT", 0.1)
+    workflow_id = echo(api)
+    execution_id = hold_key(api, workflow_id, "in_progress")
+    response = execute(api, workflow_id)
+    assert response.status_code == 409
+    assert str(execution_id) in response.json()["detail"]
+    assert len(executions(api)) == 1
+
+def test_repeat_of_a_cancelled_execution_conflicts(api):
+    workflow_id = echo(api)
+    hold_key(api, workflow_id, "cancelled")
+    response = execute(api, workflow_id)
+    assert response.status_code == 409
+    assert "cancelled" in response.json()["detail"]
+
+def test_key_is_released_when_admission_rejects(api, monkeypatch):
+    @asynccontextmanager
+    async def full(user_id, lane="interactive", plan="free"):
+        raise AdmissionRejected("queue_full", 3)
+        yield
+    workflow_id = echo(api)
+    with monkeypatch.context() as patch:
+        patch.setattr(workflows, "admit_execution", full)
+        rejected = execute(api, workflow_id)
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "3"
+    assert api.app.redis.keys(f"{KEY_PREFIX}*") == []
+
+    retry = execute(api, workflow_id)
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    assert [execution["status"] for execution in executions(api)] == ["completed"]
+
+def test_key_is_released_when_the_run_is_cancelled(api, monkeypatch):
+    async def cancelled(*args, **kwargs):
+        raise asyncio.CancelledError()
+    workflow_id = echo(api)
+    with monkeypatch.context() as patch:
+        patch.setattr(workflows, "run_workflow", cancelled)
+        # The request middleware answers 500 for a request that ends without a response
+        assert execute(api, workflow_id).status_code == 500
+    assert api.app.redis.keys(f"{KEY_PREFIX}*") == []
+    assert execute(api, workflow_id).status_code == 200
+
+def test_key_is_checked_before_running(api):
+    workflow_id = echo(api)
+    assert execute(api, workflow_id, profile="cpu").status_code == 400
+    assert execute(api, workflow_id, key="k" * 256).status_code == 400
+    assert executions(api) == []
+    assert api.app.redis.keys(f"{KEY_PREFIX}*") == []
@@ -0,0 +1,68 @@
+import pytest
+
+from utils.merge import join_mode, merge_quorum, merge_values
+
+VALUES = {"a": "first", "b": {"n": 1}, "c": 3}
+
+@pytest.mark.parametrize("params, expected", [
+    ({}, "wait-all"),
+    ({"mode": "quorum"}, "quorum"),
+    ({"function": "Pick First"}, "wait-first"),
+    ({"function": "Join All"}, "wait-all"),
+    ({"mode": "wait-all", "function": "Pick First"}, "wait-all"),
+])
+def test_join_mode(params, expected):
+    assert join_mode(params) == expected
+
+@pytest.mark.parametrize("params, expected", [
+    ({"mode": "wait-all"}, None),
+    ({"mode": "wait-first"}, 1),
+    ({"mode": "quorum", "quorum": 3}, 3),
+    ({"mode": "quorum", "quorum": "2"}, 2),
+    ({"mode": "quorum", "quorum": 0}, 1),
+    ({"mode": "quorum", "quorum": -1}, 1),
+    ({"mode": "quorum"}, 1),
+    ({"mode": "quorum", "quorum": "many"}, None),
+])
+def test_merge_quorum(params, expected):
+    assert merge_quorum(params) == expected
+
+def test_concat_joins_text_and_serialises_the_rest():
+    assert merge_values({}, VALUES) == {"output": 'first\n{"n": 1}\n3', "sources": ["a", "b", "c"]}
+
+def test_concat_uses_separator():
+    assert merge_values({"separator": " | "}, {"a": "x", "b": "y"})["output"] == "x | y"
+
+def test_list_keeps_edge_order():
+    assert merge_values({"combine": "list"}, VALUES)["output"] == ["first", {"n": 1}, 3]
+
+def test_keyed_maps_input_names():
+    assert merge_values({"combine": "keyed"}, VALUES)["output"] == VALUES
+
+def test_wait_all_with_no_inputs_combines_nothing():
+    assert merge_values({"combine": "list"}, {}) == {"output": [], "sources": []}
+
+def test_wait_first_passes_first_input_on():
+    assert merge_values({"mode": "wait-first"}, VALUES) == {"output": "first", "winner": "a", "sources": ["a"]}
+
+@pytest.mark.parametrize("quorum", [0, -1, "-3"])
+def test_quorum_below_one_runs_on_one_input(quorum):
+    params = {"mode": "quorum", "quorum": quorum, "combine": "list"}
+    assert merge_quorum(params) == 1
+    assert merge_values(params, {"a": 1})["output"] == [1]
+    with pytest.raises(ValueError, match="needed 1 input"):
+        merge_values(params, {})
+
+def test_quorum_combines_the_arrivals():
+    assert merge_values({"mode": "quorum", "quorum": 2, "combine": "keyed"}, {"b": 1, "c": 2})["output"] == {"b": 1, "c": 2}
+
+@pytest.mark.parametrize("params, values, message", [
+    ({"mode": "wait-first"}, {}, "needed 1 input"),
+    ({"mode": "quorum", "quorum": 3}, {"a": 1, "b": 2}, "needed 3 input"),
+    ({"mode": "quorum", "quorum": "many"}, {"a": 1}, "must be a number"),
+    ({"mode": "race"}, {"a": 1}, "Unknown merge mode"),
+    ({"combine": "zip"}, {"a": 1}, "Unknown merge combine mode"),
+])
+def test_merge_errors(params, values, message):
+    with pytest.raises(ValueError, match=message):
+        merge_values(params, values)
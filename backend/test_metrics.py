@@ -0,0 +1,127 @@
+import threading
+
+import pytest
+
+from routers.nodes import record_model_metrics
+from utils import metrics
+from utils.metrics import Counter, Gauge, Histogram, Summary, render_metrics
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # Metrics built here stay out of the app's /metrics output
+    monkeypatch.setattr(metrics, "_registry", [])
+
+def test_counter_renders_help_type_and_samples():
+    counter = Counter("test_requests_total", "Requests seen", ["route"])
+    counter.labels("/a").inc()
+    counter.labels("/a").inc(2)
+    counter.labels("/b").inc(0.5)
+    assert counter.render() == [
+        "# HELP test_requests_total Requests seen",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{route="/a"} 3',
+        'test_requests_total{route="/b"} 0.5',
+    ]
+
+def test_unlabelled_metric_renders_without_braces():
+    counter = Counter("test_plain_total", "Plain")
+    assert counter.render()[-1] == "test_plain_total 0"
+
+def test_gauge_goes_up_and_down():
+    gauge = Gauge("test_depth", "Depth", ["lane"])
+    gauge.labels("x").inc(3)
+    gauge.labels("x").dec()
+    assert gauge.render()[1:] == ["# TYPE test_depth gauge", 'test_depth{lane="x"} 2']
+
+def test_label_values_are_escaped():
+    counter = Counter("test_escape_total", "Escaping", ["value"])
+    counter.labels('back\\slash "quoted"\nnext').inc()
+    assert counter.render()[-1] == 'test_escape_total{value="back\\\\slash \\"quoted\\"\\nnext"} 1'
+
+def test_wrong_label_count_is_rejected():
+    counter = Counter("test_labels_total", "Labels", ["a", "b"])
+    with pytest.raises(ValueError):
+        counter.labels("only-one")
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    histogram = Histogram("test_seconds", "Latency", ["op"], buckets=(1.0, 0.1))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.labels("read").observe(value)
+    assert histogram.render() == [
+        "# HELP test_seconds Latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{op="read",le="0.1"} 2',
+        'test_seconds_bucket{op="read",le="1"} 3',
+        'test_seconds_bucket{op="read",le="+Inf"} 4',
+        'test_seconds_sum{op="read"} 3.65',
+        'test_seconds_count{op="read"} 4',
+    ]
+
+def test_histogram_counts_observations_from_every_thread():
+    histogram = Histogram("test_threads_seconds", "Threads", buckets=(1.0,))
+    threads = [threading.Thread(target=lambda: [histogram.labels().observe(0.5) for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    lines = histogram.render()
+    assert 'test_threads_seconds_bucket{le="+Inf"} 400' in lines
+    assert "test_threads_seconds_count 400" in lines
+    assert "test_threads_seconds_sum 200" in lines
+
+def test_summary_quantiles_sum_and_count():
+    summary = Summary("test_lag_seconds", "Lag", quantiles=(0.5, 0.9), window=10)
+    for value in range(1, 21):
+        summary.labels().observe(float(value))
+    # Quantiles cover the last 10 observations, count and sum all 20
+    assert summary.render()[2:] == [
+        'test_lag_seconds{quantile="0.5"} 16',
+        'test_lag_seconds{quantile="0.9"} 20',
+        "test_lag_seconds_sum 210",
+        "test_lag_seconds_count 20",
+    ]
+
+def test_empty_summary_reports_nan():
+    summary = Summary("test_empty_seconds", "Empty", quantiles=(0.5,))
+    assert summary.render()[2] == 'test_empty_seconds{quantile="0.5"} NaN'
+
+def test_infinite_values_render():
+    gauge = Gauge("test_inf", "Infinite")
+    gauge.labels().inc(float("inf"))
+    assert gauge.render()[-1] == "test_inf +Inf"
+
+def test_render_metrics_joins_registered_metrics():
+    Counter("test_one_total", "One").labels().inc()
+    Counter("test_two_total", "Two")
+    assert render_metrics() == (
+        "# HELP test_one_total One\n# TYPE test_one_total counter\ntest_one_total 1\n"
+        "# HELP test_two_total Two\n# TYPE test_two_total counter\ntest_two_total 0\n"
+    )
+
+def test_unknown_models_share_one_series(monkeypatch):
+    from routers import nodes
+    duration = Histogram("test_model_seconds", "Model", ["provider", "model"])
+    tokens = Counter("test_model_tokens_total", "Tokens", ["provider", "model", "direction"])
+    monkeypatch.setattr(nodes, "MODEL_REQUEST_DURATION", duration)
+    monkeypatch.setattr(nodes, "MODEL_TOKENS", tokens)
+    record_model_metrics("openai", "gpt-4o", 3, 4, 0.2)
+    record_model_metrics("openai", "made-up-1", 3, 0, 0.2)
+    record_model_metrics("openai", "made-up-2", 0, 0, 0.2)
+    record_model_metrics("anthropic", "gpt-4o", 0, 0, 0.2)
+    assert set(duration._children) == {("openai", "gpt-4o"), ("openai", "other"), ("anthropic", "other")}
+    assert set(tokens._children) == {("openai", "gpt-4o", "input"), ("openai", "gpt-4o", "output"), ("openai", "other", "input")}
+    assert 'test_model_seconds_count{provider="openai",model="other"} 2' in duration.render()
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("test_base", "Base")
+
+def test_unknown_node_types_share_one_series(monkeypatch):
+    from routers import workflows
+    from utils.accounting import NodeUsage
+    cpu = Counter("test_node_cpu_seconds_total", "CPU", ["node_type"])
+    monkeypatch.setattr(workflows, "NODE_CPU_SECONDS", cpu)
+    for node_type in ("openai", "condition", "document-to-text", "made-up-1", "made-up-2"):
+        workflows.record_node_usage(node_type, NodeUsage())
+    assert set(cpu._children) == {("openai",), ("condition",), ("document-to-text",), ("other",)}
+    assert workflows.metric_node_type("for-each-item") == "for-each-item"
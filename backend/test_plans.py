@@ -0,0 +1,115 @@
+from factories import edge, node
+from utils.plans import (
+    PLAN_FORMAT, ExecutionPlan, PlanCache, compile_plan, compile_template, compute_node_fingerprints,
+    is_current, render_template
+)
+
+def diamond():
+    """input-0 -> a, b -> c -> output-0, plus an unrelated x -> output-1"""
+    nodes = [
+        node("output-0", "output"), node("c", "text", prompt="{{a}} and {{b}}"), node("b", "text"),
+        node("a", "text"), node("input-0", "input"), node("x", "text"), node("output-1", "output"),
+    ]
+    edges = [
+        edge("input-0", "a"), edge("input-0", "b"), edge("a", "c", target_handle="a"),
+        edge("b", "c", target_handle="b"), edge("c", "output-0"), edge("x", "output-1"),
+    ]
+    return nodes, edges
+
+def test_compile_orders_nodes_after_their_sources():
+    plan = compile_plan(*diamond())
+    ids = [plan_node["id"] for plan_node in plan["nodes"]]
+    for source, target in [("input-0", "a"), ("input-0", "b"), ("a", "c"), ("b", "c"), ("c", "output-0"), ("x", "output-1")]:
+        assert ids.index(source) < ids.index(target)
+    assert plan["format"] == PLAN_FORMAT
+    assert "error" not in plan
+
+def test_compile_binds_sources_by_index_and_counts_consumers():
+    plan = compile_plan(*diamond())
+    ids = [plan_node["id"] for plan_node in plan["nodes"]]
+    by_id = {plan_node["id"]: plan_node for plan_node in plan["nodes"]}
+    assert sorted(by_id["c"]["sources"]) == sorted([[ids.index("a"), "output", "a"], [ids.index("b"), "output", "b"]])
+    assert by_id["output-0"]["sources"] == [[ids.index("c"), "output", "input"]]
+    assert by_id["input-0"]["consumers"] == 2
+    assert by_id["output-0"]["consumers"] == 0
+    assert by_id["input-0"]["input_key"] == "input_0"
+    assert by_id["c"]["input_key"] is None
+    assert by_id["c"]["templates"] == {"prompt": ["", "a", " and ", "b", ""]}
+
+def test_compile_keeps_cycles_as_a_plan_error():
+    nodes = [node("a", "text"), node("b", "text")]
+    plan = compile_plan(nodes, [edge("a", "b"), edge("b", "a")])
+    assert "Circular dependency" in plan["error"]
+    assert [plan_node["id"] for plan_node in plan["nodes"]] == ["a", "b"]
+    assert ExecutionPlan.from_document(plan).error == plan["error"]
+
+def test_templates_render_known_keys_and_keep_unknown_ones():
+    segments = compile_template("{{a}} + {{missing}} = {{{b}}}")
+    assert render_template(segments, {"a": 1, "b": 2}) == "1 + {{missing}} = {2}"
+
+def test_from_document_indexes_nodes():
+    plan = ExecutionPlan.from_document(compile_plan(*diamond()))
+    assert plan.ids == [plan_node.id for plan_node in plan.nodes]
+    assert all(plan.index[plan_node.id] == plan_node.index for plan_node in plan.nodes)
+    assert plan.error is None
+
+def test_prune_keeps_targets_and_their_dependencies():
+    plan = ExecutionPlan.from_document(compile_plan(*diamond()))
+    pruned_plan, pruned = plan.prune(["c"])
+    assert set(pruned_plan.ids) == {"input-0", "a", "b", "c"}
+    assert set(pruned) == {"output-0", "x", "output-1"}
+    # Kept nodes keep their relative order and are re-indexed
+    assert pruned_plan.ids == [node_id for node_id in plan.ids if node_id in pruned_plan.index]
+    c = pruned_plan.nodes[pruned_plan.index["c"]]
+    assert {pruned_plan.ids[source] for source, _, _ in c.sources} == {"a", "b"}
+    assert c.consumers == 0
+    assert pruned_plan.nodes[pruned_plan.index["input-0"]].consumers == 2
+
+def test_prune_ignores_unknown_targets():
+    plan = ExecutionPlan.from_document(compile_plan(*diamond()))
+    pruned_plan, pruned = plan.prune(["nope", "output-1"])
+    assert pruned_plan.ids == [node_id for node_id in plan.ids if node_id in ("x", "output-1")]
+    assert len(pruned) == 5
+
+def fingerprints(nodes, edges, inputs=None, mode="standard"):
+    plan = ExecutionPlan.from_document(compile_plan(nodes, edges))
+    return compute_node_fingerprints(plan, inputs or {"input_0": "hello"}, mode)
+
+def test_fingerprints_are_stable():
+    assert fingerprints(*diamond()) == fingerprints(*diamond())
+    assert set(fingerprints(*diamond())) == {"input-0", "a", "b", "c", "output-0", "x", "output-1"}
+
+def test_fingerprint_changes_propagate_downstream_only():
+    before = fingerprints(*diamond())
+    nodes, edges = diamond()
+    nodes[3] = node("a", "text", prompt="changed")
+    after = fingerprints(nodes, edges)
+    changed = {node_id for node_id in before if before[node_id] != after[node_id]}
+    assert changed == {"a", "c", "output-0"}
+
+def test_fingerprints_depend_on_inputs_and_mode():
+    before = fingerprints(*diamond())
+    other_input = fingerprints(*diamond(), inputs={"input_0": "bye"})
+    assert {node_id for node_id in before if before[node_id] != other_input[node_id]} == {"input-0", "a", "b", "c", "output-0"}
+    assert fingerprints(*diamond(), mode="fast")["x"] != before["x"]
+
+def test_fingerprints_skip_cycles():
+    nodes = [node("input-0", "input"), node("a", "text"), node("b", "text")]
+    edges = [edge("input-0", "a"), edge("a", "b"), edge("b", "a")]
+    assert set(fingerprints(nodes, edges)) == {"input-0"}
+
+def test_is_current():
+    assert is_current(compile_plan(*diamond()))
+    assert not is_current({"format": PLAN_FORMAT - 1, "nodes": []})
+    assert not is_current(None)
+
+def test_plan_cache_evicts_least_recently_used():
+    cache = PlanCache(max_size=2)
+    plans = [ExecutionPlan([]) for _ in range(3)]
+    cache.put("w", 1, plans[0])
+    cache.put("w", 2, plans[1])
+    assert cache.get("w", 1) is plans[0]
+    cache.put("w", 3, plans[2])
+    assert cache.get("w", 2) is None
+    assert cache.get("w", 1) is plans[0]
+    assert cache.get("w", 3) is plans[2]
@@ -0,0 +1,47 @@
+import asyncio
+import glob
+import time
+
+import pytest
+
+from utils.process_pool import CPUPool
+
+def slow_upper(params, inputs):
+    time.sleep(params.get("delay", 0))
+    return {"output": inputs["input"].upper(), "copy": inputs["input"]}
+
+def output_segments():
+    return set(glob.glob("/dev/shm/wfo_*"))
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = CPUPool(workers=2, task_timeout=5.0, shm_threshold=1024)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+def test_large_values_round_trip_through_shared_memory(pool):
+    before = output_segments()
+    output = asyncio.run(pool.run(slow_upper, {}, {"input": "x" * 4096}))
+    assert output == {"output": "X" * 4096, "copy": "x" * 4096}
+    assert output_segments() == before
+
+def test_cancelled_task_leaves_no_output_segments(pool):
+    before = output_segments()
+
+    async def cancel_while_running():
+        task = asyncio.create_task(pool.run(slow_upper, {"delay": 0.3}, {"input": "x" * 4096}))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(cancel_while_running())
+    # The worker finishes after the cancel and creates its outputs then
+    time.sleep(0.6)
+    assert output_segments() == before
+
+def test_timed_out_task_fails_and_pool_recovers(pool):
+    from utils.process_pool import CPUTaskTimeout
+    with pytest.raises(CPUTaskTimeout):
+        asyncio.run(pool.run(slow_upper, {"delay": 1.0}, {"input": "x"}, timeout=0.2))
+    assert asyncio.run(pool.run(slow_upper, {}, {"input": "y"}))["output"] == "Y"
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+
+import pytest
+from bson import ObjectId
+
+from conftest import USER
+from factories import create_workflow, edge, node
+from routers.workflows import run_webhook_execution
+from utils.admission import AdmissionRejected
+from utils.webhooks import GROUP, STREAM, HookTokenFilter, WebhookConsumer, redact_hook_path, webhook_inputs
+
+@pytest.fixture
+def hook(api):
+    """(workflow ID, hook URL) of an echo workflow owned by USER"""
+    asyncio.run(api.app.mongodb.users.insert_one({"_id": ObjectId(USER.id), "email": USER.email, "full_name": USER.full_name}))
+    workflow_id = create_workflow(api, [node("input-0", "input"), node("output-0", "output")], [edge("input-0", "output-0")])
+    response = api.post(f"/api/workflows/{workflow_id}/webhook")
+    assert response.status_code == 200
+    return workflow_id, response.json()["url"]
+
+def pending(redis):
+    return redis.xpending(STREAM, GROUP)["pending"]
+
+def consume(api, run=None, deliveries=1):
+    """Run a consumer until `deliveries` have been handed to run and nothing is left unacknowledged"""
+    db, redis = api.app.mongodb, api.app.redis
+    handed = []
+
+    async def run_delivery(fields, entry_id):
+        handed.append(entry_id)
+        await (run or (lambda fields, entry_id: run_webhook_execution(db, fields, entry_id)))(fields, entry_id)
+
+    async def scenario():
+        consumer = WebhookConsumer(redis, run_delivery, claim_idle=60.0)
+        consumer.start()
+        try:
+            for _ in range(300):
+                await asyncio.sleep(0.01)
+                if len(handed) >= deliveries and not consumer._running:
+                    break
+        finally:
+            await consumer.stop()
+    asyncio.run(scenario())
+    return handed
+
+def executions(api):
+    return asyncio.run(api.app.mongodb.workflow_executions.find({}).to_list(None))
+
+def test_delivery_is_queued_and_run_as_the_owner(api, hook):
+    workflow_id, url = hook
+    response = api.post(url, json={"inputs": {"input_0": "from hook"}})
+    assert response.status_code == 202
+    delivery_id = response.json()["delivery_id"]
+    assert api.app.redis.xlen(STREAM) == 1
+
+    assert consume(api) == [delivery_id]
+    [execution] = executions(api)
+    assert execution["status"] == "completed"
+    assert execution["user_id"] == USER.id
+    assert execution["trigger"] == {"type": "webhook", "delivery_id": delivery_id, "idempotency_key": None}
+    assert execution["outputs"]["output_0"]["output"] == "from hook"
+    assert pending(api.app.redis) == 0
+
+def test_redeliveries_with_an_idempotency_key_run_once(api, hook):
+    _, url = hook
+    for _ in range(3):
+        assert api.post(url, content="same", headers={"Idempotency-Key": "k1"}).status_code == 202
+    api.post(url, content="other", headers={"Idempotency-Key": "k2"})
+    assert len(consume(api, deliveries=2)) == 2
+    assert sorted(execution["inputs"]["inputs"]["input_0"]["value"] for execution in executions(api)) == ["other", "same"]
+    assert pending(api.app.redis) == 0
+
+def test_rejected_delivery_stays_pending(api, hook):
+    _, url = hook
+    api.post(url, content="later")
+
+    async def busy(fields, entry_id):
+        raise AdmissionRejected("queue_full", 1)
+    consume(api, busy)
+    assert pending(api.app.redis) == 1
+    assert executions(api) == []
+
+def test_failed_delivery_is_acknowledged(api, hook):
+    _, url = hook
+    api.post(url, content="boom")
+
+    async def broken(fields, entry_id):
+        raise RuntimeError("boom")
+    consume(api, broken)
+    assert pending(api.app.redis) == 0
+
+def test_wrong_or_revoked_token_is_not_found(api, hook):
+    workflow_id, url = hook
+    assert api.post(f"/hooks/{workflow_id}/wrong", content="x").status_code == 404
+    assert api.post(f"/hooks/{ObjectId()}/wrong", content="x").status_code == 404
+    assert api.delete(f"/api/workflows/{workflow_id}/webhook").status_code == 204
+    assert api.post(url, content="x").status_code == 404
+    assert api.app.redis.exists(STREAM) == 0
+
+def test_new_token_replaces_the_old_one(api, hook):
+    workflow_id, url = hook
+    new_url = api.post(f"/api/workflows/{workflow_id}/webhook").json()["url"]
+    assert api.post(url, content="x").status_code == 404
+    assert api.post(new_url, content="x").status_code == 202
+
+def test_oversized_bodies_are_rejected(api, hook, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_BYTES", 100)
+    _, url = hook
+    assert api.post(url, content="x" * 100).status_code == 202
+    assert api.post(url, content="x" * 101).status_code == 413
+    # Chunked, so no Content-Length to check up front
+    assert api.post(url, content=iter([b"x" * 60, b"x" * 60])).status_code == 413
+    assert api.app.redis.xlen(STREAM) == 1
+
+def test_invalid_content_length_is_a_bad_request(api, hook):
+    _, url = hook
+    assert api.post(url, content=iter([b"x"]), headers={"Content-Length": "lots"}).status_code == 400
+
+@pytest.mark.parametrize("payload, content_type, expected", [
+    ('{"inputs": {"input_0": "a", "input_1": {"value": 2, "type": "Number"}}}', "application/json",
+     {"input_0": {"value": "a"}, "input_1": {"value": 2, "type": "Number"}}),
+    ('{"event": "push"}', "application/json", {"input_0": {"value": {"event": "push"}, "type": "Text"}}),
+    ("not json", "application/json", {"input_0": {"value": "not json", "type": "Text"}}),
+    ('{"inputs": {}}', "text/plain", {"input_0": {"value": '{"inputs": {}}', "type": "Text"}}),
+])
+def test_webhook_inputs(payload, content_type, expected):
+    assert webhook_inputs(payload, content_type) == expected
+
+def test_hook_tokens_are_redacted_from_logs():
+    assert redact_hook_path("/hooks/abc/s3cret") == "/hooks/abc/***"
+    assert redact_hook_path("/api/workflows/abc") == "/api/workflows/abc"
+    record = logging.LogRecord("uvicorn.access", logging.INFO, "", 0, '%s - "%s %s HTTP/%s" %d', ("1.2.3.4", "POST", "/hooks/abc/s3cret?x=1", "1.1", 202), None)
+    HookTokenFilter().filter(record)
+    assert "s3cret" not in record.getMessage()
@@ -0,0 +1,99 @@
+import asyncio
+
+from bson import ObjectId
+
+def workflow_body():
+    return {
+        "name": "w",
+        "nodes": [
+            {"id": "input-0", "type": "input", "position": {"x": 0, "y": 0}, "data": {"params": {"nodeName": "in"}}},
+            {"id": "text-0", "type": "text", "position": {"x": 1, "y": 0}, "data": {"params": {"text": "a"}}},
+            {"id": "output-0", "type": "output", "position": {"x": 2, "y": 0}, "data": {}},
+        ],
+        "edges": [
+            {"id": "e1", "source": "input-0", "target": "text-0"},
+            {"id": "e2", "source": "text-0", "target": "output-0"},
+        ],
+    }
+
+def create(api):
+    response = api.post("/api/workflows/", json=workflow_body())
+    assert response.status_code == 201
+    return response.json()["id"], response.headers["etag"]
+
+def stored(api, workflow_id):
+    return asyncio.run(api.app.mongodb.workflows.find_one({"_id": ObjectId(workflow_id)}))
+
+def test_patch_applies_the_delta_and_recompiles_the_plan(api):
+    workflow_id, etag = create(api)
+    response = api.patch(f"/api/workflows/{workflow_id}", headers={"If-Match": etag}, json={
+        "name": "renamed",
+        "remove_edges": ["e2"],
+        "update_nodes": [{"id": "text-0", "position": {"x": 5, "y": 5}}],
+        "add_nodes": [{"id": "output-1", "type": "output", "position": {"x": 3, "y": 0}, "data": {}}],
+        "add_edges": [{"id": "e3", "source": "text-0", "target": "output-1"}],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["name"] == "renamed"
+    assert body["version"] == 2
+    assert response.headers["etag"] != etag
+    assert [node["id"] for node in body["nodes"]] == ["input-0", "text-0", "output-0", "output-1"]
+    assert body["nodes"][1]["position"] == {"x": 5, "y": 5}
+    assert body["nodes"][1]["data"] == {"params": {"text": "a"}}
+    assert [edge["id"] for edge in body["edges"]] == ["e1", "e3"]
+    plan_ids = {node["id"] for node in stored(api, workflow_id)["plan"]["nodes"]}
+    assert plan_ids == {"input-0", "text-0", "output-0", "output-1"}
+
+def test_patch_with_stale_etag_changes_nothing(api):
+    workflow_id, etag = create(api)
+    assert api.patch(f"/api/workflows/{workflow_id}", headers={"If-Match": etag}, json={"name": "first"}).status_code == 200
+    before = stored(api, workflow_id)
+    response = api.patch(f"/api/workflows/{workflow_id}", headers={"If-Match": etag}, json={
+        "name": "second", "remove_nodes": ["text-0"], "add_edges": [{"id": "e9", "source": "input-0", "target": "output-0"}]
+    })
+    assert response.status_code == 412
+    assert stored(api, workflow_id) == before
+
+def test_partially_conflicting_delta_is_not_applied(api):
+    workflow_id, etag = create(api)
+    # Another editor deleted text-0 since this client loaded the workflow
+    assert api.patch(f"/api/workflows/{workflow_id}", json={"remove_nodes": ["text-0"]}).status_code == 200
+    before = stored(api, workflow_id)
+    response = api.patch(f"/api/workflows/{workflow_id}", json={
+        "name": "renamed",
+        "remove_edges": ["e1"],
+        "update_nodes": [{"id": "text-0", "data": {"params": {"text": "b"}}}],
+        "add_nodes": [{"id": "text-1", "type": "text", "position": {"x": 0, "y": 1}, "data": {}}],
+    })
+    assert response.status_code == 409
+    assert "text-0" in response.json()["detail"]
+    assert stored(api, workflow_id) == before
+
+def test_unconditional_patch_reapplies_after_losing_a_race(api, monkeypatch):
+    workflow_id, _ = create(api)
+    collection = api.app.mongodb.workflows
+    find_one_and_update = collection.find_one_and_update
+    raced = []
+
+    async def save_in_between(query, update, **kwargs):
+        if not raced:
+            # Another save lands between this patch's read and its write
+            raced.append(True)
+            await collection.update_one({"_id": ObjectId(workflow_id)}, {"$set": {"description": "theirs"}, "$inc": {"version": 1}})
+        return await find_one_and_update(query, update, **kwargs)
+    monkeypatch.setattr(type(collection), "find_one_and_update", lambda self, *args, **kwargs: save_in_between(*args, **kwargs))
+
+    response = api.patch(f"/api/workflows/{workflow_id}", json={"name": "mine"})
+    assert response.status_code == 200
+    assert response.json()["version"] == 3
+    assert (response.json()["name"], response.json()["description"]) == ("mine", "theirs")
+
+def test_patch_missing_workflow(api):
+    response = api.patch(f"/api/workflows/{ObjectId()}", json={"name": "x"})
+    assert response.status_code == 404
+
+def test_empty_patch_checks_if_match(api):
+    workflow_id, etag = create(api)
+    assert api.patch(f"/api/workflows/{workflow_id}", headers={"If-Match": etag}, json={}).status_code == 200
+    assert api.patch(f"/api/workflows/{workflow_id}", headers={"If-Match": f'"{workflow_id}-7"'}, json={}).status_code == 412
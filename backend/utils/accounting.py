@@ -0,0 +1,72 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Optional
+
+class NodeUsage:
+    """Resources one node execution consumed"""
+
+    __slots__ = ("cpu_time", "wait_time", "bytes_in", "bytes_out", "input_tokens", "output_tokens", "peak_alloc_bytes")
+
+    def __init__(self):
+        self.cpu_time = 0.0
+        self.wait_time = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.peak_alloc_bytes: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+_current_usage: ContextVar[Optional[NodeUsage]] = ContextVar("current_usage", default=None)
+
+@contextmanager
+def track_usage(usage: NodeUsage):
+    """Attribute CPU time, allocations and anything recorded below to usage.
+
+    CPU time is the event loop thread's, so other requests interleaving on the
+    loop while this node awaits can add to it. Peak allocation is only measured
+    while tracemalloc is tracing (NODE_ALLOC_TRACKING).
+    """
+    token = _current_usage.set(usage)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        alloc_start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    cpu_start = time.thread_time()
+    try:
+        yield usage
+    finally:
+        usage.cpu_time += time.thread_time() - cpu_start
+        if tracing and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            usage.peak_alloc_bytes = max(0, peak - alloc_start)
+        _current_usage.reset(token)
+
+def record_wait(seconds: float):
+    """Charge time spent queued on a limiter or pool to the running node"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.wait_time += seconds
+
+def record_tokens(input_tokens: int, output_tokens: int):
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.input_tokens += input_tokens or 0
+        usage.output_tokens += output_tokens or 0
+
+def summarize_usage(node_usages: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum per-node usage dicts into execution totals; peak allocation is the largest node peak"""
+    totals = NodeUsage().to_dict()
+    for usage in node_usages:
+        for key, value in usage.items():
+            if value is None:
+                continue
+            if key == "peak_alloc_bytes":
+                totals[key] = max(totals[key] or 0, value)
+            else:
+                totals[key] += value
+    return totals
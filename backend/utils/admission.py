@@ -0,0 +1,231 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from utils.metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED
+
+LANES = ("interactive", "scheduled", "batch")
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class DeficitRoundRobin:
+    """Deficit round robin over active keys.
+
+    Each key earns `weight` credits when its turn comes round and spends one
+    per selection, so over time keys are served in proportion to their weights.
+    Credit is capped at one round's worth and dropped when a key goes idle.
+    """
+
+    def __init__(self):
+        self._weights: "OrderedDict[str, int]" = OrderedDict()
+        self._deficit: Dict[str, float] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._weights)
+
+    def __iter__(self):
+        return iter(self._weights)
+
+    def activate(self, key: str, weight: int):
+        if key not in self._weights:
+            self._weights[key] = max(1, weight)
+            self._deficit[key] = 0
+
+    def deactivate(self, key: str):
+        if key not in self._weights:
+            return
+        was_head = key == next(iter(self._weights))
+        del self._weights[key]
+        del self._deficit[key]
+        if was_head and self._weights:
+            self._grant()
+
+    def _grant(self):
+        head = next(iter(self._weights))
+        self._deficit[head] = min(self._deficit[head] + self._weights[head], self._weights[head])
+
+    def select(self, eligible: Callable[[str], bool]) -> Optional[str]:
+        """Next key to serve among those eligible right now, or None"""
+        # Weights are at least 1, so two passes give every key a turn with credit
+        for _ in range(2 * len(self._weights)):
+            key = next(iter(self._weights))
+            if self._deficit[key] >= 1 and eligible(key):
+                self._deficit[key] -= 1
+                return key
+            self._weights.move_to_end(key)
+            self._grant()
+        return None
+
+class _Waiter:
+    __slots__ = ("user_id", "lane", "plan", "future", "queued_at")
+
+    def __init__(self, user_id: str, lane: str, plan: str, future: asyncio.Future):
+        self.user_id = user_id
+        self.lane = lane
+        self.plan = plan
+        self.future = future
+        self.queued_at = time.monotonic()
+
+class AdmissionController:
+    """Cap in-flight executions globally and per user, with a short bounded wait queue.
+
+    Waiters queue per user within a priority lane. When a slot frees up, a lane
+    is picked by deficit round robin over lane weights, then a user within it
+    by deficit round robin over plan weights, so a user with a deep backlog
+    gets their share without starving anyone else. Users already at their own
+    in-flight limit are skipped.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_per_user: int,
+        queue_size: int,
+        queue_timeout: float,
+        lane_weights: Optional[Dict[str, int]] = None,
+        plan_weights: Optional[Dict[str, int]] = None
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lane_weights = lane_weights or {}
+        self.plan_weights = plan_weights or {}
+        self._in_flight = 0
+        self._per_user: Dict[str, int] = {}
+        self._queues: Dict[Tuple[str, str], Deque[_Waiter]] = {}
+        self._queued = 0
+        self._lanes = DeficitRoundRobin()
+        self._users: Dict[str, DeficitRoundRobin] = {lane: DeficitRoundRobin() for lane in LANES}
+        # Moving average of execution time, used for Retry-After
+        self._avg_duration = 1.0
+
+    def _can_start(self, user_id: str) -> bool:
+        return self._in_flight < self.max_in_flight and self._under_user_limit(user_id)
+
+    def _under_user_limit(self, user_id: str) -> bool:
+        return self._per_user.get(user_id, 0) < self.max_per_user
+
+    def _acquire(self, user_id: str):
+        self._in_flight += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+
+    def _release(self, user_id: str):
+        self._in_flight -= 1
+        remaining = self._per_user.get(user_id, 0) - 1
+        if remaining > 0:
+            self._per_user[user_id] = remaining
+        else:
+            self._per_user.pop(user_id, None)
+        self._wake()
+
+    def _enqueue(self, waiter: _Waiter):
+        self._queues.setdefault((waiter.lane, waiter.user_id), deque()).append(waiter)
+        self._queued += 1
+        self._users[waiter.lane].activate(waiter.user_id, self.plan_weights.get(waiter.plan, 1))
+        self._lanes.activate(waiter.lane, self.lane_weights.get(waiter.lane, 1))
+        ADMISSION_QUEUE_DEPTH.labels(waiter.lane, waiter.plan).inc()
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get((waiter.lane, waiter.user_id))
+        try:
+            queue.remove(waiter)
+        except (AttributeError, ValueError):
+            return
+        self._queued -= 1
+        ADMISSION_QUEUE_DEPTH.labels(waiter.lane, waiter.plan).dec()
+        if not queue:
+            del self._queues[(waiter.lane, waiter.user_id)]
+            self._users[waiter.lane].deactivate(waiter.user_id)
+            if not self._users[waiter.lane]:
+                self._lanes.deactivate(waiter.lane)
+
+    def _lane_has_eligible(self, lane: str) -> bool:
+        return any(self._under_user_limit(user_id) for user_id in self._users[lane])
+
+    def _wake(self):
+        while self._in_flight < self.max_in_flight and self._queued:
+            lane = self._lanes.select(self._lane_has_eligible)
+            if lane is None:
+                # Everyone waiting is at their own per-user limit
+                return
+            user_id = self._users[lane].select(self._under_user_limit)
+            waiter = self._queues[(lane, user_id)][0]
+            self._remove(waiter)
+            self._acquire(user_id)
+            waiter.future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, judging by recent execution times"""
+        return max(1, math.ceil(self._avg_duration * (self._queued + 1) / self.max_in_flight))
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTED.labels(reason).inc()
+        raise AdmissionRejected(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, lane: str = "interactive", plan: str = "free"):
+        """Hold an execution slot for the duration of the block, or raise AdmissionRejected"""
+        queued_at = time.monotonic()
+        # _wake runs on every release, so queued waiters are only ever blocked by
+        # their own per-user limit and never need to go ahead of this request
+        if self._can_start(user_id):
+            self._acquire(user_id)
+        else:
+            if self._queued >= self.queue_size:
+                self._reject("queue_full")
+            waiter = _Waiter(user_id, lane, plan, asyncio.get_running_loop().create_future())
+            self._enqueue(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                # cancel() fails if a slot was granted just as the wait timed out
+                if waiter.future.cancel():
+                    self._remove(waiter)
+                    ADMISSION_QUEUE_WAIT.labels(lane, plan, "timeout").observe(time.monotonic() - queued_at)
+                    self._reject("timeout")
+            except asyncio.CancelledError:
+                if not waiter.future.cancel():
+                    self._release(user_id)
+                self._remove(waiter)
+                raise
+        ADMISSION_QUEUE_WAIT.labels(lane, plan, "admitted").observe(time.monotonic() - queued_at)
+
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_duration = 0.9 * self._avg_duration + 0.1 * (time.monotonic() - started_at)
+            self._release(user_id)
+
+_controller: Optional[AdmissionController] = None
+
+def configure_admission(
+    max_in_flight: int,
+    max_per_user: int,
+    queue_size: int,
+    queue_timeout: float,
+    lane_weights: Optional[Dict[str, int]] = None,
+    plan_weights: Optional[Dict[str, int]] = None
+):
+    """Enable admission control; a non-positive max_in_flight disables it"""
+    global _controller
+    _controller = AdmissionController(
+        max_in_flight, max_per_user, queue_size, queue_timeout, lane_weights, plan_weights
+    ) if max_in_flight > 0 else None
+
+@asynccontextmanager
+async def admit_execution(user_id: str, lane: str = "interactive", plan: str = "free"):
+    """Wait for an execution slot; passes straight through when admission control is off"""
+    if _controller is None:
+        yield
+        return
+    async with _controller.admit(user_id, lane, plan):
+        yield
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("workflow_api")
+
+# Request fields that never take part in the cassette key
+_IGNORED_FIELDS = {"apiKey", "api_key"}
+
+def request_key(provider: str, data: Dict[str, Any]) -> str:
+    """Stable key for a provider request: canonical JSON without credentials, hashed"""
+    normalized = {k: v for k, v in data.items() if k not in _IGNORED_FIELDS}
+    canonical = json.dumps([provider, normalized], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+class CassetteStore:
+    """Record provider responses to, or replay them from, an append-only JSONL file.
+
+    Each line holds one interaction: key, provider, model, latency and the response.
+    A key recorded several times is replayed round-robin so latency variance survives.
+    """
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, Any] = {}
+        # Recorded lines come from concurrent to_thread calls; one writer at a time keeps them whole
+        self._write_lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.warning(f"Cassette file {self.path} not found; every provider call will miss")
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        self._cursors = {key: itertools.cycle(entries) for key, entries in self._entries.items()}
+        logger.info(f"Loaded {sum(len(e) for e in self._entries.values())} interactions from {self.path}")
+
+    async def record(self, provider: str, data: Dict[str, Any], response: Dict[str, Any], latency: float):
+        entry = {
+            "key": request_key(provider, data),
+            "provider": provider,
+            "model": data.get("model", "unknown"),
+            "latency": round(latency, 4),
+            "response": response
+        }
+        line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+        await asyncio.to_thread(self._append, line)
+
+    def _append(self, line: str):
+        with self._write_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def replay(self, provider: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        key = request_key(provider, data)
+        cursor = self._cursors.get(key)
+        if cursor is None:
+            logger.warning(f"Cassette miss for {provider} request {key}")
+            return {
+                "content": f"⚠️ No recorded {provider} response for this request.",
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "error": "cassette_miss"
+            }
+        entry = next(cursor)
+        if self.latency_scale > 0:
+            await asyncio.sleep(entry["latency"] * self.latency_scale)
+        return dict(entry["response"])
+
+_store: Optional[CassetteStore] = None
+
+def configure_cassettes(mode: Optional[str], path: str, latency_scale: float = 1.0):
+    """Enable record or replay mode for provider calls; a falsy mode disables cassettes"""
+    global _store
+    _store = CassetteStore(path, mode, latency_scale) if mode else None
+
+def get_cassette() -> Optional[CassetteStore]:
+    return _store
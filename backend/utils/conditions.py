@@ -0,0 +1,285 @@
+"""Condition node evaluation.
+
+A condition node holds an ordered list of paths, as built by the editor's
+ConditionNode: each path has clauses {inputField, operator, value} joined by
+AND or OR, and when there is more than one path the last is the ELSE branch.
+The first path whose clauses hold is taken, and its outgoing edges use the
+source handle path_<index>.
+
+Paths are compiled once per loaded plan into plain Python closures; an
+invalid path (unknown operator, non-numeric comparison value, bad expression)
+makes the node fail when it runs rather than when the workflow is saved.
+"""
+import ast
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+# Callables an evaluates_to expression may use
+_EXPRESSION_FUNCTIONS = {
+    "len": len, "str": str, "int": int, "float": float, "bool": bool,
+    "abs": abs, "min": min, "max": max, "round": round
+}
+
+# No attribute access, lambdas or comprehensions, so an expression can't reach
+# anything but its inputs and the functions above
+_EXPRESSION_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.IfExp, ast.Call, ast.Name, ast.Load, ast.Constant, ast.Subscript, ast.Slice,
+    ast.List, ast.Tuple, ast.Dict
+)
+
+_SEQUENCE_LITERALS = (ast.List, ast.Tuple)
+
+def _multiply(left: Any, right: Any) -> Any:
+    """`*` for expressions: numbers only, since repeating text or a list can exhaust memory"""
+    if isinstance(left, (str, bytes, list, tuple)) or isinstance(right, (str, bytes, list, tuple)):
+        raise ValueError("Expressions can't repeat text or lists with *")
+    return left * right
+
+class _CheckedMultiply(ast.NodeTransformer):
+    """Route every `a * b` through _multiply, so operands are checked at run time"""
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Mult):
+            return node
+        return ast.copy_location(
+            ast.Call(func=ast.Name(id="__multiply", ctx=ast.Load()), args=[node.left, node.right], keywords=[]),
+            node
+        )
+
+def _is_sequence_literal(node: ast.AST) -> bool:
+    return isinstance(node, _SEQUENCE_LITERALS) or (isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)))
+
+def branch_handle(index: int) -> str:
+    """Source handle of a condition node's index-th path"""
+    return f"path_{index}"
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _structured(value: Any) -> Any:
+    """Parse JSON text so fields and keys can be looked up in it"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def _truth(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    text = _text(value).strip().lower()
+    if text in ("true", "yes", "1"):
+        return True
+    if text in ("false", "no", "0"):
+        return False
+    return None
+
+def _lookup(value: Any, parts: List[str]) -> Any:
+    for part in parts:
+        value = _structured(value)
+        if isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return None
+    return value
+
+def resolve_field(inputs: Dict[str, Any], field: str) -> Any:
+    """Value of a clause's inputField.
+
+    An empty field means the node's main input. A field naming an input is
+    that input; otherwise it is a dotted path, starting at a named input when
+    the first part is one and at the main input when not.
+    """
+    field = field.strip()
+    if field.startswith("{{") and field.endswith("}}"):
+        field = field[2:-2].strip()
+    if not field:
+        return inputs.get("input")
+    if field in inputs:
+        return inputs[field]
+    parts = field.split(".")
+    if parts[0] in inputs:
+        return _lookup(inputs[parts[0]], parts[1:])
+    return _lookup(inputs.get("input"), parts)
+
+def compile_expression(source: str) -> Callable[[Dict[str, Any]], Any]:
+    """Compile an evaluates_to expression; names refer to the node's inputs"""
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression {source!r}: {e.msg}")
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES):
+            raise ValueError(f"Unsupported syntax in expression {source!r}: {type(node).__name__}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in _EXPRESSION_FUNCTIONS):
+            raise ValueError(f"Only {', '.join(_EXPRESSION_FUNCTIONS)} can be called in expression {source!r}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult) and (
+            _is_sequence_literal(node.left) or _is_sequence_literal(node.right)
+        ):
+            raise ValueError(f"Expressions can't repeat text or lists with *: {source!r}")
+    # Inputs are only known at run time, so repetition of those is caught by _multiply
+    tree = ast.fix_missing_locations(_CheckedMultiply().visit(tree))
+    code = compile(tree, "<condition>", "eval")
+    functions = {"__builtins__": {}, **_EXPRESSION_FUNCTIONS, "__multiply": _multiply}
+
+    def evaluate(names: Dict[str, Any]) -> Any:
+        try:
+            return eval(code, functions, names)
+        except NameError as e:
+            raise ValueError(f"Expression {source!r}: {e}")
+    return evaluate
+
+def _compile_numeric(operator: str, expected: str, compare: Callable[[float, float], bool]) -> Callable[[Any], bool]:
+    bound = _number(expected)
+    if bound is None:
+        raise ValueError(f"Operator {operator} needs a number, got {expected!r}")
+
+    def check(actual: Any) -> bool:
+        number = _number(actual)
+        return number is not None and compare(number, bound)
+    return check
+
+def _length(value: Any) -> int:
+    value = _structured(value)
+    return len(value) if isinstance(value, (str, list, dict)) else len(_text(value))
+
+def _contains(actual: Any, expected: str) -> bool:
+    actual = _structured(actual)
+    if isinstance(actual, list):
+        return any(_text(item) == expected for item in actual)
+    return expected in _text(actual)
+
+def _equals(actual: Any, expected: str) -> bool:
+    actual_number, expected_number = _number(actual), _number(expected)
+    if actual_number is not None and expected_number is not None:
+        return actual_number == expected_number
+    return _text(actual) == expected
+
+def _is_empty(actual: Any) -> bool:
+    actual = _structured(actual)
+    if isinstance(actual, (list, dict)):
+        return not actual
+    return not _text(actual).strip()
+
+def _has_key(actual: Any, key: str) -> bool:
+    actual = _structured(actual)
+    return isinstance(actual, dict) and key in actual
+
+def _compile_test(operator: str, expected: str) -> Callable[[Any], bool]:
+    """Compile one operator and its value into a test of the field's value"""
+    if operator == "contains":
+        return lambda actual: _contains(actual, expected)
+    if operator == "not_contains":
+        return lambda actual: not _contains(actual, expected)
+    if operator == "begins_with":
+        return lambda actual: _text(actual).startswith(expected)
+    if operator == "not_begins_with":
+        return lambda actual: not _text(actual).startswith(expected)
+    if operator == "ends_with":
+        return lambda actual: _text(actual).endswith(expected)
+    if operator == "not_ends_with":
+        return lambda actual: not _text(actual).endswith(expected)
+    if operator == "length_gt":
+        check = _compile_numeric(operator, expected, lambda a, b: a > b)
+        return lambda actual: check(_length(actual))
+    if operator == "length_lt":
+        check = _compile_numeric(operator, expected, lambda a, b: a < b)
+        return lambda actual: check(_length(actual))
+    if operator == "is_empty":
+        return _is_empty
+    if operator == "is_not_empty":
+        return lambda actual: not _is_empty(actual)
+    if operator == "equals":
+        return lambda actual: _equals(actual, expected)
+    if operator == "not_equals":
+        return lambda actual: not _equals(actual, expected)
+    if operator == "greater_than":
+        return _compile_numeric(operator, expected, lambda a, b: a > b)
+    if operator == "less_than":
+        return _compile_numeric(operator, expected, lambda a, b: a < b)
+    if operator == "greater_equal":
+        return _compile_numeric(operator, expected, lambda a, b: a >= b)
+    if operator == "less_equal":
+        return _compile_numeric(operator, expected, lambda a, b: a <= b)
+    if operator == "is_true":
+        return lambda actual: _truth(actual) is True
+    if operator == "is_false":
+        return lambda actual: _truth(actual) is False
+    if operator == "has_key":
+        return lambda actual: _has_key(actual, expected)
+    if operator == "not_has_key":
+        return lambda actual: not _has_key(actual, expected)
+    raise ValueError(f"Unknown condition operator: {operator}")
+
+def compile_clause(clause: Dict[str, Any]) -> Predicate:
+    field = str(clause.get("inputField") or "")
+    operator = clause.get("operator")
+    expected = _text(clause.get("value"))
+
+    if operator == "evaluates_to":
+        # The field's value is available to the expression as `value`
+        expression = compile_expression(expected)
+        return lambda inputs: bool(expression({**inputs, "value": resolve_field(inputs, field)}))
+
+    test = _compile_test(operator, expected)
+    return lambda inputs: test(resolve_field(inputs, field))
+
+class Condition:
+    """Compiled paths of one condition node"""
+
+    __slots__ = ("paths", "error")
+
+    def __init__(self, paths: List[Dict[str, Any]]):
+        self.paths: List[Predicate] = []
+        self.error: Optional[str] = None
+        try:
+            for index, path in enumerate(paths):
+                self.paths.append(self._compile_path(path, is_else=len(paths) > 1 and index == len(paths) - 1))
+        except ValueError as e:
+            self.error = str(e)
+
+    @staticmethod
+    def _compile_path(path: Dict[str, Any], is_else: bool) -> Predicate:
+        if is_else:
+            return lambda inputs: True
+        # The editor adds blank clauses until the user fills them in
+        clauses = [compile_clause(clause) for clause in path.get("clauses", []) if clause.get("operator")]
+        if not clauses:
+            return lambda inputs: False
+        if path.get("logicalOperator") == "OR":
+            return lambda inputs: any(clause(inputs) for clause in clauses)
+        return lambda inputs: all(clause(inputs) for clause in clauses)
+
+    def evaluate(self, inputs: Dict[str, Any]) -> Optional[int]:
+        """Index of the first path that holds, or None when no path does"""
+        if self.error:
+            raise ValueError(self.error)
+        for index, path in enumerate(self.paths):
+            if path(inputs):
+                return index
+        return None
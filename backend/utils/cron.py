@@ -0,0 +1,110 @@
+"""Five-field cron expressions: minute hour day-of-month month day-of-week.
+
+Fields take *, numbers, names (jan-dec, sun-sat), ranges (1-5), steps (*/15,
+10-50/10) and comma lists. Day-of-week runs 0-6 from Sunday; 7 is Sunday too.
+As in cron, when both day fields are restricted a day matching either one
+matches; a field covering its whole range counts as unrestricted. Times are
+UTC.
+"""
+import bisect
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_DAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+
+# (low, high, names) per field; names[i] stands for low + i
+_FIELDS = [
+    (0, 59, None),
+    (0, 23, None),
+    (1, 31, None),
+    (1, 12, _MONTHS),
+    (0, 7, _DAYS),
+]
+
+# Far enough ahead for the rarest matches (a Feb 29 can be 8 years away)
+_SEARCH_YEARS = 30
+
+def _value(text: str, low: int, names: Optional[Sequence[str]]) -> int:
+    if names and text.lower() in names:
+        return low + names.index(text.lower())
+    if not text.isdigit():
+        raise ValueError(f"Invalid cron value: {text!r}")
+    return int(text)
+
+def _parse_field(field: str, low: int, high: int, names: Optional[Sequence[str]]) -> List[int]:
+    values = set()
+    for part in field.split(","):
+        spec, _, step_text = part.partition("/")
+        step = 1
+        if step_text:
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f"Invalid cron step: {part!r}")
+            step = int(step_text)
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start_text, _, end_text = spec.partition("-")
+            start, end = _value(start_text, low, names), _value(end_text, low, names)
+        else:
+            start = _value(spec, low, names)
+            # "5/15" means from 5 to the end of the range in steps of 15
+            end = high if step_text else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field {part!r} is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+class CronExpression:
+    """A parsed cron expression; next_after finds the next matching minute"""
+
+    __slots__ = ("expression", "minutes", "hours", "days", "months", "weekdays", "_any_day", "_any_weekday")
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {len(fields)}: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, *spec) for field, spec in zip(fields, _FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        # A field is unrestricted when it covers its whole range, however it is written (*, */1, 1-31)
+        self._any_day = len(self.days) == 31
+        self._any_weekday = len(self.weekdays) == 7
+        if self.next_after(datetime(2000, 1, 1)) is None:
+            raise ValueError(f"Cron expression never matches: {expression!r}")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # datetime counts weekdays from Monday, cron from Sunday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> Optional[datetime]:
+        """The first matching minute strictly after moment, or None if there is none"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate.replace(year=candidate.year + _SEARCH_YEARS, month=1, day=1)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                # First day of the next month
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                i = bisect.bisect_left(self.hours, candidate.hour)
+                if i == len(self.hours):
+                    candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                else:
+                    candidate = candidate.replace(hour=self.hours[i], minute=0)
+                continue
+            i = bisect.bisect_left(self.minutes, candidate.minute)
+            if i == len(self.minutes):
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            return candidate.replace(minute=self.minutes[i])
+        return None
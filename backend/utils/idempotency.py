@@ -0,0 +1,100 @@
+"""Idempotency keys for execution requests.
+
+The first request with a key claims it in Redis with SET NX, storing the ID
+its execution will be recorded under and a digest of the request. A repeat
+of that request within the key's TTL starts nothing: it waits for the
+recorded execution to finish and answers with its result. Keys are scoped to
+a user and workflow.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from bson import ObjectId
+from redis.exceptions import WatchError
+
+KEY_PREFIX = "idempotency:"
+MAX_KEY_LENGTH = 255
+
+# Executions of this process that have finished, so local waiters needn't poll
+_finished: Dict[str, asyncio.Event] = {}
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+def request_digest(request: Dict[str, Any]) -> str:
+    """Digest of the parts of a request that change what it computes"""
+    significant = {name: value for name, value in request.items() if name not in ("priority", "idempotency_key")}
+    return hashlib.sha256(json.dumps(significant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def claim_key(redis, user_id: str, workflow_id: str, key: str, request: Dict[str, Any], ttl: int) -> Tuple[ObjectId, bool]:
+    """(execution ID, whether this request claimed the key).
+
+    When another request holds the key, its execution ID is returned instead.
+    Raises IdempotencyConflict when that request differed from this one.
+    """
+    redis_key = f"{KEY_PREFIX}{user_id}:{workflow_id}:{key}"
+    execution_id = ObjectId()
+    digest = request_digest(request)
+    if redis.set(redis_key, f"{execution_id} {digest}", nx=True, ex=ttl):
+        return execution_id, True
+    held = redis.get(redis_key)
+    if held is None:
+        # Released or expired in between; try once more
+        if redis.set(redis_key, f"{execution_id} {digest}", nx=True, ex=ttl):
+            return execution_id, True
+        held = redis.get(redis_key) or ""
+    held_id, _, held_digest = held.partition(" ")
+    if held_digest != digest:
+        raise IdempotencyConflict(f"Idempotency-Key {key!r} was already used for a different request")
+    return ObjectId(held_id), False
+
+def release_key(redis, user_id: str, workflow_id: str, key: str, execution_id: ObjectId):
+    """Give up a claim whose execution never ran, so a retry can run it.
+
+    Only deletes the key while it still names this execution.
+    """
+    redis_key = f"{KEY_PREFIX}{user_id}:{workflow_id}:{key}"
+    with redis.pipeline() as pipe:
+        try:
+            pipe.watch(redis_key)
+            if (pipe.get(redis_key) or "").partition(" ")[0] == str(execution_id):
+                pipe.multi()
+                pipe.delete(redis_key)
+                pipe.execute()
+        except WatchError:
+            pass
+
+def mark_finished(execution_id: ObjectId):
+    """Wake this process's requests waiting on the execution"""
+    event = _finished.pop(str(execution_id), None)
+    if event is not None:
+        event.set()
+
+async def wait_for_execution(executions_collection, execution_id: ObjectId, timeout: float) -> Optional[Dict[str, Any]]:
+    """The execution document once it has finished, or None if it is still running after timeout.
+
+    Executions of other processes are polled, backing off to once a second.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = 0.05
+    try:
+        while True:
+            # A fresh event once an earlier one has fired
+            event = _finished.setdefault(str(execution_id), asyncio.Event())
+            execution = await executions_collection.find_one({"_id": execution_id})
+            if execution is not None and execution.get("status") != "in_progress":
+                return execution
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(event.wait(), min(interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+            interval = min(interval * 2, 1.0)
+    finally:
+        # Drops the event; other waiters just check again early
+        mark_finished(execution_id)
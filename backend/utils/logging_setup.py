@@ -0,0 +1,134 @@
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Request ID of the request being handled, set by the request middleware in main.py
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_STANDARD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+class RequestContextFilter(logging.Filter):
+    """Stamp each record with the current request ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep 1 in N records below WARNING for configured logger prefixes.
+
+    Rates are matched on the longest logger-name prefix, so "workflow_api.engine"
+    covers "workflow_api.engine.nodes" as well. Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = sorted(
+            ((name, max(1, round(1 / rate)) if rate > 0 else 0) for name, rate in rates.items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+        # itertools.count is advanced atomically under the GIL, so no lock is needed
+        self.counters = {name: itertools.count() for name, _ in self.rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for name, every in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                if every == 0:
+                    return False
+                return next(self.counters[name]) % every == 0
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as a single JSON line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and defers formatting to the writer thread"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Losing a log line is preferable to stalling the event loop
+            NonBlockingQueueHandler.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only do the work that must happen on the calling thread: merge the message
+        # arguments and render the traceback while its frames are still alive.
+        # JSON/text formatting happens in the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_traceback_formatter = logging.Formatter()
+
+def setup_logging(
+    level: str = "INFO",
+    log_file: str = "workflow_api.log",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    queue_size: int = 10000,
+    json_format: bool = True,
+    sample_rates: Optional[Dict[str, float]] = None
+) -> logging.handlers.QueueListener:
+    """Route the root logger through a bounded queue drained by a background writer thread.
+
+    Returns the started listener; call stop() on shutdown to flush pending records.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(
+        JsonFormatter() if json_format
+        else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    return listener
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from utils.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger("workflow_api.loop")
+
+class LoopMonitor:
+    """Measure event loop lag and catch callbacks that block the loop.
+
+    A probe task sleeps for `interval` and records how late it woke up. A
+    watchdog thread checks the probe's heartbeat; when the loop has not come
+    back for longer than `threshold`, it logs the loop thread's current stack,
+    which is the stack of the blocking callback.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._probe: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._probe = self._loop.create_task(self._run_probe())
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._probe is not None:
+            self._probe.cancel()
+        self._watchdog.join(timeout=1)
+
+    async def _run_probe(self):
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            EVENT_LOOP_LAG.labels().observe(max(0.0, now - due))
+
+    def _watch(self):
+        stalled = False
+        while not self._stop.wait(self.threshold / 2):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            if blocked_for <= self.threshold:
+                stalled = False
+                continue
+            if stalled:
+                # Already reported this stall
+                continue
+            stalled = True
+            EVENT_LOOP_STALLS.labels().inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>"
+            logger.warning(
+                "Event loop blocked for more than %.3fs; loop thread stack:\n%s",
+                blocked_for, stack
+            )
+
+_monitor: Optional[LoopMonitor] = None
+
+def start_loop_monitor(interval: float, threshold: float):
+    """Start monitoring the running event loop; call from inside the loop"""
+    global _monitor
+    _monitor = LoopMonitor(interval, threshold)
+    _monitor.start()
+
+def stop_loop_monitor():
+    global _monitor
+    if _monitor is not None:
+        _monitor.stop()
+        _monitor = None
@@ -0,0 +1,70 @@
+"""Merge node join semantics.
+
+A merge node joins the branches feeding it. The scheduler decides when it
+runs (merge_quorum) and which inputs it gets; merge_values combines them.
+
+- wait-all runs once every incoming edge has resolved and combines every
+  input that carries a value: concatenated text, a list, or a dict keyed by
+  input name (params.combine: concat, list or keyed).
+- wait-first runs as soon as one input arrives without an error and passes it
+  on; upstream branches that nothing else needs are cancelled.
+- quorum runs once params.quorum inputs have arrived and combines those.
+
+The editor's "Pick First" and "Join All" functions map to wait-first and
+wait-all.
+"""
+import json
+from typing import Any, Dict, Optional
+
+JOIN_MODES = ("wait-all", "wait-first", "quorum")
+COMBINE_MODES = ("concat", "list", "keyed")
+
+_EDITOR_FUNCTIONS = {"Pick First": "wait-first", "Join All": "wait-all"}
+
+def join_mode(params: Dict[str, Any]) -> str:
+    return params.get("mode") or _EDITOR_FUNCTIONS.get(params.get("function"), "wait-all")
+
+def merge_quorum(params: Dict[str, Any]) -> Optional[int]:
+    """Arrived inputs a merge waits for, or None when it waits for every edge to resolve"""
+    mode = join_mode(params)
+    if mode == "wait-first":
+        return 1
+    if mode == "quorum":
+        try:
+            return max(1, int(params.get("quorum") or 1))
+        except (TypeError, ValueError):
+            # merge_values reports the bad value when the node runs
+            return None
+    return None
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+def merge_values(params: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+    """Combine a merge node's inputs, given in edge order and keyed by input name"""
+    mode = join_mode(params)
+    if mode not in JOIN_MODES:
+        raise ValueError(f"Unknown merge mode: {mode}")
+    # The same threshold the scheduler fired the node on
+    required = merge_quorum(params)
+    if required is None:
+        if mode == "quorum":
+            raise ValueError(f"Merge quorum must be a number, got {params.get('quorum')!r}")
+        required = 0
+    if len(values) < required:
+        raise ValueError(f"Merge needed {required} input(s) but {len(values)} arrived")
+
+    if mode == "wait-first":
+        name, value = next(iter(values.items()))
+        return {"output": value, "winner": name, "sources": [name]}
+
+    combine = params.get("combine") or "concat"
+    if combine == "keyed":
+        merged: Any = dict(values)
+    elif combine == "list":
+        merged = list(values.values())
+    elif combine == "concat":
+        merged = str(params.get("separator", "\n")).join(_text(value) for value in values.values())
+    else:
+        raise ValueError(f"Unknown merge combine mode: {combine}")
+    return {"output": merged, "sources": list(values)}
@@ -0,0 +1,307 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Sequence, Tuple
+
+# Prometheus' default buckets, extended for LLM calls that routinely take tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_shard_lock = threading.Lock()
+
+class _ShardedValues:
+    """Per-thread value arrays summed at scrape time.
+
+    Each thread writes only to its own array, so updates from the event loop and
+    from driver/executor threads never contend. The lock is taken once per thread
+    when its shard is created.
+    """
+
+    __slots__ = ("_local", "_shards", "_size")
+
+    def __init__(self, size: int):
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._size = size
+
+    def shard(self) -> List[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = [0.0] * self._size
+            with _shard_lock:
+                self._shards.append(values)
+            return values
+
+    def snapshot(self) -> List[float]:
+        totals = [0.0] * self._size
+        with _shard_lock:
+            shards = list(self._shards)
+        for values in shards:
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        """Return the child for a label combination, creating it on first use"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            # setdefault keeps a single child if two threads race on creation
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child holding one label combination's values"""
+
+    @abstractmethod
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        """Sample lines for one child"""
+
+    def _render_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        if not self.labelnames:
+            self.labels()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+class _CounterChild:
+    __slots__ = ("_values",)
+
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount: float = 1.0):
+        self._values.shard()[0] += amount
+
+    def value(self) -> float:
+        return self._values.snapshot()[0]
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._render_labels(key)} {_format(child.value())}"]
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        self._values.shard()[0] -= amount
+
+class Gauge(Counter):
+    """Up/down gauge built from sharded increments; use inc() and dec()"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_values")
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds = bounds
+        # Layout: one slot per bucket, then +Inf, then sum
+        self._values = _ShardedValues(len(bounds) + 2)
+
+    def observe(self, value: float):
+        values = self._values.shard()
+        values[bisect.bisect_left(self._bounds, value)] += 1
+        values[-1] += value
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, key, child):
+        values = child._values.snapshot()
+        lines = []
+        cumulative = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format(bound)
+            le_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{self._render_labels(key, le_label)} {_format(cumulative)}")
+        lines.append(f"{self.name}_sum{self._render_labels(key)} {_format(values[-1])}")
+        lines.append(f"{self.name}_count{self._render_labels(key)} {_format(cumulative)}")
+        return lines
+
+class _SummaryChild:
+    __slots__ = ("_lock", "_window", "_count", "_sum")
+
+    def __init__(self, window: int):
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=window)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._window.append(value)
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[float], int, float]:
+        with self._lock:
+            return sorted(self._window), self._count, self._sum
+
+class Summary(_Metric):
+    """Quantiles over the most recent `window` observations, plus lifetime count and sum.
+
+    Meant for low-rate series such as a periodic probe; every observe takes a lock.
+    """
+
+    type_name = "summary"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), quantiles: Sequence[float] = (0.5, 0.9, 0.99), window: int = 1000):
+        super().__init__(name, documentation, labelnames)
+        self.quantiles = tuple(quantiles)
+        self.window = window
+
+    def _new_child(self):
+        return _SummaryChild(self.window)
+
+    def _render_child(self, key, child):
+        values, count, total = child.snapshot()
+        lines = []
+        for quantile in self.quantiles:
+            value = values[min(len(values) - 1, int(quantile * len(values)))] if values else float("nan")
+            quantile_label = f'quantile="{_format(quantile)}"'
+            lines.append(f"{self.name}{self._render_labels(key, quantile_label)} {_format(value)}")
+        lines.append(f"{self.name}_sum{self._render_labels(key)} {_format(total)}")
+        lines.append(f"{self.name}_count{self._render_labels(key)} {_format(count)}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value == int(value) else repr(value)
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Metrics shared across the app
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"]
+)
+NODE_EXECUTION_DURATION = Histogram(
+    "workflow_node_duration_seconds", "Workflow node execution time by node type",
+    ["node_type", "status"]
+)
+MODEL_REQUEST_DURATION = Histogram(
+    "model_request_duration_seconds", "AI provider request latency",
+    ["provider", "model"]
+)
+MODEL_TOKENS = Counter(
+    "model_tokens_total", "Tokens consumed from AI providers",
+    ["provider", "model", "direction"]
+)
+MONGO_OPERATION_DURATION = Histogram(
+    "mongo_operation_duration_seconds", "MongoDB command latency",
+    ["command", "collection", "status"]
+)
+NODE_CPU_SECONDS = Counter(
+    "workflow_node_cpu_seconds_total", "Event loop CPU time spent in workflow nodes",
+    ["node_type"]
+)
+NODE_WAIT_SECONDS = Counter(
+    "workflow_node_wait_seconds_total", "Time workflow nodes spent queued on limiters and pools",
+    ["node_type"]
+)
+NODE_BYTES = Counter(
+    "workflow_node_bytes_total", "Approximate serialized size of node inputs and outputs",
+    ["node_type", "direction"]
+)
+EVENT_LOOP_LAG = Summary(
+    "event_loop_lag_seconds", "Delay between when a loop probe was due and when it ran"
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls_total", "Times a callback blocked the event loop past the slow-callback threshold"
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "workflow_admission_wait_seconds", "Time executions waited for an execution slot",
+    ["lane", "plan", "outcome"]
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "workflow_admission_queue_depth", "Executions waiting for an execution slot",
+    ["lane", "plan"]
+)
+ADMISSION_REJECTED = Counter(
+    "workflow_admission_rejected_total", "Executions rejected with 429",
+    ["reason"]
+)
+NODES_SKIPPED = Counter(
+    "workflow_nodes_skipped_total", "Nodes skipped because they were only reachable through condition branches not taken",
+    ["node_type"]
+)
+NODES_CANCELLED = Counter(
+    "workflow_nodes_cancelled_total", "Nodes cancelled because a merge went ahead without them",
+    ["node_type"]
+)
+FOR_EACH_ITEMS = Counter(
+    "workflow_for_each_items_total", "Loop body runs by for-each nodes",
+    ["status"]
+)
+PLAN_CACHE_LOOKUPS = Counter(
+    "workflow_plan_cache_lookups_total", "Compiled plan lookups in the in-process cache",
+    ["result"]
+)
+SCHEDULED_RUNS = Counter(
+    "workflow_scheduled_runs_total", "Runs dispatched by the scheduler by outcome",
+    ["outcome"]
+)
+SCHEDULE_LAG = Histogram(
+    "workflow_schedule_lag_seconds", "How late scheduled runs were dispatched, jitter included"
+)
+SCHEDULER_LEADER = Gauge(
+    "workflow_scheduler_leader", "1 while this process holds the scheduler leader lease"
+)
+WEBHOOK_DELIVERIES = Counter(
+    "workflow_webhook_deliveries_total", "Webhook deliveries by outcome, from receipt to execution",
+    ["outcome"]
+)
+EXECUTIONS_IN_FLIGHT = Gauge(
+    "workflow_executions_in_flight", "Workflow executions currently running"
+)
@@ -0,0 +1,63 @@
+"""CPU-bound node executors.
+
+Each executor takes (params, inputs) and returns the node's output dict. They
+run in the CPU pool's worker processes, so they must stay module-level, pure
+and free of app state.
+"""
+import json
+from typing import Any, Dict
+
+from utils.process_pool import cpu_bound
+
+def _substitute(template: str, inputs: Dict[str, Any]) -> str:
+    for key, value in inputs.items():
+        template = template.replace(f"{{{{{key}}}}}", value if isinstance(value, str) else json.dumps(value))
+    return template
+
+def _parse_document(params: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+    source = params.get("jsonString") or inputs.get("input", "")
+    source = _substitute(source, inputs) if isinstance(source, str) else source
+    return json.loads(source) if isinstance(source, str) else source
+
+def _lookup(document: Any, path: str) -> Any:
+    """Follow a dotted path such as user.addresses.0.city"""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return None
+    return value
+
+@cpu_bound("json-handler")
+def json_handler(params: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    operation = params.get("operation", "read-json-value")
+    try:
+        if operation == "read-json-value":
+            document = _parse_document(params, inputs)
+            keys = [key for key in params.get("keys", []) if key]
+            if not keys:
+                return {"output": json.dumps(document)}
+            values = {key: _lookup(document, key) for key in keys}
+            if len(keys) == 1:
+                value = values[keys[0]]
+                return {"output": value if isinstance(value, str) else json.dumps(value), "values": values}
+            return {"output": json.dumps(values), "values": values}
+
+        if operation == "write-json-value":
+            if params.get("subOperation") == "update-json":
+                document = _parse_document(params, inputs)
+                if not isinstance(document, dict):
+                    raise ValueError("update-json needs a JSON object")
+            else:
+                document = {}
+            for field in params.get("fields", []):
+                if field.get("key"):
+                    document[field["key"]] = _substitute(str(field.get("value", "")), inputs)
+            return {"output": json.dumps(document)}
+
+        raise ValueError(f"Unknown JSON operation: {operation}")
+    except (ValueError, TypeError) as e:
+        return {"error": str(e), "output": f"Error: {str(e)}"}
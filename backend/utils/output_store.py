@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("workflow_api.engine")
+
+def estimate_size(output: Any) -> int:
+    """Approximate in-memory size of a node output by its serialized length"""
+    try:
+        return len(json.dumps(output, default=str))
+    except (TypeError, ValueError):
+        return len(str(output))
+
+# Marks a slot with no live output
+_EMPTY = object()
+
+class OutputStore:
+    """Node outputs for one execution, released once their last consumer has run.
+
+    Outputs are held in a list indexed by the node's position in the plan.
+    consumers[i] is the number of edges reading node i's output and retained[i]
+    says whether it must be kept to the end. Retained outputs are never
+    released or spilled. When live outputs exceed memory_limit bytes, the
+    largest releasable ones are pickled to a temporary directory and read back
+    when a consumer needs them. Loading and spilling take turns, so an output a
+    node has just loaded is not spilled again before the node reads it.
+    on_release, if given, is called with the index and output of each
+    in-memory output released after its last consumer has read it.
+    """
+
+    def __init__(
+        self,
+        node_ids: List[str],
+        consumers: List[int],
+        retained: List[bool],
+        memory_limit: int = 0,
+        spill_dir: Optional[str] = None,
+        on_release: Optional[Callable[[int, Any], None]] = None
+    ):
+        self._node_ids = node_ids
+        self._consumers = list(consumers)
+        self._retained = retained
+        self._memory_limit = memory_limit
+        self._spill_root = spill_dir
+        self._on_release = on_release
+        self._spill_dir: Optional[str] = None
+        self._outputs: List[Any] = [_EMPTY] * len(node_ids)
+        self._sizes: List[int] = [0] * len(node_ids)
+        self._spilled: Dict[int, str] = {}
+        self.live_bytes = 0
+        self.peak_bytes = 0
+        self.spill_count = 0
+        self.released: List[int] = []
+        self._lock = asyncio.Lock()
+
+    def __contains__(self, index: int) -> bool:
+        return self._outputs[index] is not _EMPTY or index in self._spilled
+
+    def __getitem__(self, index: int) -> Any:
+        # Spilled outputs must be brought back with load() before they are read
+        output = self._outputs[index]
+        if output is _EMPTY:
+            raise KeyError(self._node_ids[index])
+        return output
+
+    def put(self, index: int, output: Any, size: Optional[int] = None):
+        if self._consumers[index] == 0 and not self._retained[index]:
+            # Nothing reads it and nobody asked for it
+            self.released.append(index)
+            return
+        self._outputs[index] = output
+        if self._memory_limit:
+            size = estimate_size(output) if size is None else size
+            self._sizes[index] = size
+            self.live_bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+
+    def consume(self, sources: Iterable[int]) -> List[int]:
+        """Record that one edge from each source has been read; returns the indices released"""
+        released = []
+        for source in sources:
+            remaining = self._consumers[source] - 1
+            self._consumers[source] = remaining
+            if remaining <= 0 and not self._retained[source] and source in self:
+                if self._on_release is not None and self._outputs[source] is not _EMPTY:
+                    self._on_release(source, self._outputs[source])
+                self._drop(source)
+                released.append(source)
+        self.released.extend(released)
+        return released
+
+    def _drop(self, index: int):
+        if self._outputs[index] is not _EMPTY:
+            self._outputs[index] = _EMPTY
+            self.live_bytes -= self._sizes[index]
+            self._sizes[index] = 0
+        path = self._spilled.pop(index, None)
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def load(self, indices: Iterable[int]):
+        """Read spilled outputs back into memory; read them before the next await"""
+        if not self._spilled:
+            return
+        async with self._lock:
+            for index in indices:
+                path = self._spilled.get(index)
+                if path is None:
+                    continue
+                output = await asyncio.to_thread(self._read, path)
+                del self._spilled[index]
+                os.remove(path)
+                self._outputs[index] = output
+                self._sizes[index] = estimate_size(output)
+                self.live_bytes += self._sizes[index]
+                self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+
+    async def spill_if_needed(self, keep: Iterable[int] = ()):
+        """Spill the largest releasable outputs until live bytes fit under the limit"""
+        if not self._memory_limit or self.live_bytes <= self._memory_limit:
+            return
+        keep = set(keep)
+        async with self._lock:
+            candidates = sorted(
+                (
+                    index for index, output in enumerate(self._outputs)
+                    if output is not _EMPTY and not self._retained[index] and index not in keep
+                ),
+                key=lambda index: self._sizes[index],
+                reverse=True
+            )
+            for index in candidates:
+                if self.live_bytes <= self._memory_limit:
+                    break
+                output = self._outputs[index]
+                if output is _EMPTY:
+                    # Released while an earlier candidate was being written
+                    continue
+                if self._spill_dir is None:
+                    self._spill_dir = tempfile.mkdtemp(prefix="execution-", dir=self._spill_root)
+                path = os.path.join(self._spill_dir, f"{index}.pickle")
+                await asyncio.to_thread(self._write, path, output)
+                if self._outputs[index] is not output:
+                    # Released while it was being written
+                    os.remove(path)
+                    continue
+                self._spilled[index] = path
+                self._outputs[index] = _EMPTY
+                self.live_bytes -= self._sizes[index]
+                self._sizes[index] = 0
+                self.spill_count += 1
+                logger.info("Spilled output of node %s to disk (%d bytes live)", self._node_ids[index], self.live_bytes)
+
+    @staticmethod
+    def _write(path: str, output: Any):
+        with open(path, "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _read(path: str) -> Any:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def close(self):
+        """Delete any spill files left over"""
+        for path in self._spilled.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._spilled.clear()
+        if self._spill_dir:
+            try:
+                os.rmdir(self._spill_dir)
+            except OSError:
+                pass
+            self._spill_dir = None
@@ -0,0 +1,545 @@
+"""Compiled execution plans.
+
+A plan is everything the engine needs to run a workflow, derived once when the
+workflow is saved: nodes in execution order with their params, each node's
+input bindings (by index into the plan), compiled prompt templates and the
+number of edges reading each node's output. A for-each node carries the plan
+of its loop body. Plans are stored on the workflow document, so they must stay
+plain BSON: lists, dicts, strings and numbers. Loaded plans are turned into
+ExecutionPlan objects, which the engine walks by index.
+
+A pipeline node embeds another workflow. Its stored plan only names that
+workflow; when the plan is loaded for a run, inline_pipelines splices in the
+embedded workflow's plan, so its nodes are scheduled alongside the parent's.
+"""
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.conditions import Condition
+from utils.metrics import PLAN_CACHE_LOOKUPS
+
+# Bump when the stored layout changes; plans in an older format are recompiled on load
+PLAN_FORMAT = 3
+
+# {{key}} placeholders; a key never contains braces, so "{{{x}}}" keeps its outer pair
+_PLACEHOLDER = re.compile(r"\{\{([^{}]*)\}\}")
+
+# Params compiled into templates ahead of time
+TEMPLATE_PARAMS = ("prompt",)
+
+# A for-each node sends each element out on its item handle; the loop body is
+# everything reachable from there, and an edge back into the node's results
+# handle picks the value gathered for each element
+FOR_EACH_ITEM_HANDLE = "item"
+FOR_EACH_RESULTS_HANDLE = "results"
+# Type of the node standing in for the for-each node inside its body plan
+FOR_EACH_ITEM = "for-each-item"
+
+# Inlined pipelines: each input node of the embedded workflow becomes a
+# pipeline-input node fed by the edges into the pipeline node, each output node
+# a pipeline-output node the pipeline node reads
+PIPELINE = "pipeline"
+PIPELINE_INPUT = "pipeline-input"
+PIPELINE_OUTPUT = "pipeline-output"
+
+def calculate_execution_order(nodes, edges):
+    """Calculate the topological sort of nodes for execution order"""
+    # Create a graph representation
+    graph = {node["id"]: [] for node in nodes}
+
+    # Add edges to the graph
+    for edge in edges:
+        source = edge["source"]
+        target = edge["target"]
+        if source in graph:
+            graph[source].append(target)
+
+    # Perform topological sort
+    visited = set()
+    temp_visited = set()
+    order = []
+    nodes_by_id = {}
+    for node in nodes:
+        nodes_by_id.setdefault(node["id"], node)
+
+    def visit(start):
+        # Depth-first with an explicit stack; plans are compiled on save, so
+        # long chains must not hit the recursion limit
+        temp_visited.add(start)
+        stack = [(start, iter(graph.get(start, [])))]
+        while stack:
+            node_id, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if neighbor in temp_visited:
+                    raise ValueError(f"Circular dependency detected at node {neighbor}")
+                if neighbor not in visited:
+                    temp_visited.add(neighbor)
+                    stack.append((neighbor, iter(graph.get(neighbor, []))))
+                    break
+            else:
+                stack.pop()
+                temp_visited.remove(node_id)
+                visited.add(node_id)
+
+                # Get the node and add to order
+                node = nodes_by_id.get(node_id)
+                if node:
+                    order.append(node)
+
+    # Start with input nodes or nodes with no incoming edges
+    targets = {edge["target"] for edge in edges}
+    start_nodes = [
+        node["id"] for node in nodes
+        if node["type"] == "input" or node["id"] not in targets
+    ]
+
+    # If no start nodes, start with any node
+    if not start_nodes and nodes:
+        start_nodes = [nodes[0]["id"]]
+
+    # Visit all nodes
+    for node_id in start_nodes:
+        if node_id not in visited:
+            visit(node_id)
+
+    # Make sure all nodes are visited
+    remaining = [node for node in nodes if node["id"] not in visited]
+    order.extend(remaining)
+
+    # Reverse the order to get the correct execution flow (input first, output last)
+    return list(reversed(order))
+
+def compile_template(template: str) -> List[str]:
+    """Split a template into alternating literal text and placeholder keys.
+
+    Even positions are literals and odd positions are keys, so rendering is a
+    single join with no scanning.
+    """
+    return _PLACEHOLDER.split(template)
+
+def render_template(segments: List[str], inputs: Dict[str, Any]) -> str:
+    parts = segments[:]
+    for i in range(1, len(parts), 2):
+        key = parts[i]
+        # Unknown placeholders are left as written
+        parts[i] = str(inputs[key]) if key in inputs else f"{{{{{key}}}}}"
+    return "".join(parts)
+
+def input_key(node_id: str) -> Optional[str]:
+    """The execution input an input node reads: input-3 reads inputs["input_3"]"""
+    if not node_id.startswith("input"):
+        return None
+    node_parts = node_id.split('-')
+    return f"input_{node_parts[1] if len(node_parts) > 1 else '0'}"
+
+def _is_loop_back(edge, loop_ids) -> bool:
+    return edge["target"] in loop_ids and edge.get("targetHandle") == FOR_EACH_RESULTS_HANDLE
+
+def extract_loop_bodies(nodes, edges):
+    """Split the outermost for-each loops out of a graph.
+
+    Returns (nodes, edges, bodies): the graph with every loop body removed and
+    bodies mapping each outermost for-each node ID to (body_nodes, body_edges,
+    result), where result is (node ID, output field) or None. Inside a body, a
+    for-each-item node stands in for the loop: it outputs the element on its
+    item handle, and on handle @k the k-th value the body reads from outside
+    the loop. Each such value becomes an input @k of the for-each node in the
+    outer graph, so it is computed before the loop starts. Nested loops stay
+    in their enclosing body and are split out when the body is compiled.
+    """
+    loop_ids = {node["id"] for node in nodes if node["type"] == "for-each"}
+    if not loop_ids:
+        return nodes, edges, {}
+
+    successors: Dict[str, List[str]] = {}
+    for edge in edges:
+        if not _is_loop_back(edge, loop_ids):
+            successors.setdefault(edge["source"], []).append(edge["target"])
+
+    loop_bodies = {}
+    for loop_id in loop_ids:
+        body = set()
+        stack = [
+            edge["target"] for edge in edges
+            if edge["source"] == loop_id and edge.get("sourceHandle") == FOR_EACH_ITEM_HANDLE
+        ]
+        while stack:
+            node_id = stack.pop()
+            if node_id in body:
+                continue
+            if node_id == loop_id:
+                raise ValueError(f"The loop body of for-each node {loop_id} leads back into it")
+            body.add(node_id)
+            stack.extend(successors.get(node_id, []))
+        loop_bodies[loop_id] = body
+
+    outermost = sorted(
+        loop_id for loop_id in loop_ids
+        if not any(loop_id in body for body in loop_bodies.values())
+    )
+    owner: Dict[str, str] = {}
+    for loop_id in outermost:
+        for node_id in loop_bodies[loop_id]:
+            if node_id in owner:
+                raise ValueError(f"Node {node_id} is in the loop body of both {owner[node_id]} and {loop_id}")
+            owner[node_id] = loop_id
+
+    outer_edges = []
+    # (loop, source node, output field) -> the loop input carrying it into the body
+    outer_bindings: Dict[Tuple[str, str, str], str] = {}
+    body_edges: Dict[str, List[Dict[str, Any]]] = {loop_id: [] for loop_id in outermost}
+    results: Dict[str, Tuple[str, str]] = {}
+    for edge in edges:
+        source_loop, target_loop = owner.get(edge["source"]), owner.get(edge["target"])
+        if source_loop is None and target_loop is None:
+            outer_edges.append(edge)
+        elif source_loop is not None and source_loop == target_loop:
+            body_edges[source_loop].append(edge)
+        elif source_loop is not None:
+            if edge["target"] != source_loop or edge.get("targetHandle") != FOR_EACH_RESULTS_HANDLE:
+                raise ValueError(f"Edge {edge['id']} leaves the loop body of for-each node {source_loop}")
+            if source_loop in results:
+                raise ValueError(f"For-each node {source_loop} has more than one results edge")
+            results[source_loop] = (edge["source"], edge.get("sourceHandle") or "output")
+        elif edge["source"] == target_loop:
+            if edge.get("sourceHandle") != FOR_EACH_ITEM_HANDLE:
+                raise ValueError(f"Node {edge['target']} reads the output of for-each node {target_loop} from inside its loop body")
+            body_edges[target_loop].append({**edge, "source": f"{target_loop}:item"})
+        else:
+            output_field = edge.get("sourceHandle") or "output"
+            key = (target_loop, edge["source"], output_field)
+            if key not in outer_bindings:
+                outer_bindings[key] = f"@{sum(1 for bound in outer_bindings if bound[0] == target_loop)}"
+                outer_edges.append({
+                    "id": f"{edge['id']}:outer", "source": edge["source"], "target": target_loop,
+                    "sourceHandle": output_field, "targetHandle": outer_bindings[key]
+                })
+            body_edges[target_loop].append({**edge, "source": f"{target_loop}:item", "sourceHandle": outer_bindings[key]})
+
+    bodies = {}
+    for loop_id in outermost:
+        body = loop_bodies[loop_id]
+        item_node = {"id": f"{loop_id}:item", "type": FOR_EACH_ITEM, "data": {"params": {}}}
+        bodies[loop_id] = (
+            [item_node] + [node for node in nodes if node["id"] in body],
+            body_edges[loop_id],
+            results.get(loop_id)
+        )
+    return [node for node in nodes if node["id"] not in owner], outer_edges, bodies
+
+def compile_plan(nodes, edges) -> Dict[str, Any]:
+    """Compile a workflow graph into an execution plan.
+
+    A graph with a cycle, or with a for-each loop that can't be split out,
+    still compiles, keeping the saved node order, but the plan carries the
+    error and executing it fails the same way an uncompiled run would.
+    """
+    error = None
+    bodies = {}
+    try:
+        nodes, edges, bodies = extract_loop_bodies(nodes, edges)
+        ordered = calculate_execution_order(nodes, edges)
+    except ValueError as e:
+        ordered = list(nodes)
+        error = str(e)
+
+    index = {node["id"]: i for i, node in enumerate(ordered)}
+    plan_nodes = []
+    for node in ordered:
+        params = node.get("data", {}).get("params", {})
+        templates = {
+            name: compile_template(params[name])
+            for name in TEMPLATE_PARAMS if isinstance(params.get(name), str)
+        }
+        plan_nodes.append({
+            "id": node["id"],
+            "type": node["type"],
+            "params": params,
+            "sources": [],
+            "consumers": 0,
+            "input_key": input_key(node["id"]),
+            "templates": templates
+        })
+
+    for edge in edges:
+        source, target = index.get(edge["source"]), index.get(edge["target"])
+        if source is None or target is None:
+            continue
+        # The editor leaves the handle unset on nodes with a single handle of each kind
+        plan_nodes[target]["sources"].append(
+            [source, edge.get("sourceHandle") or "output", edge.get("targetHandle") or "input"]
+        )
+        plan_nodes[source]["consumers"] += 1
+
+    for loop_id, (body_nodes, body_edges, result) in bodies.items():
+        body = compile_plan(body_nodes, body_edges)
+        error = error or body.get("error")
+        if result is not None:
+            body_index = {node["id"]: i for i, node in enumerate(body["nodes"])}
+            result = [body_index[result[0]], result[1]]
+        plan_nodes[index[loop_id]]["body"] = body
+        plan_nodes[index[loop_id]]["result"] = result
+
+    plan = {"format": PLAN_FORMAT, "nodes": plan_nodes}
+    if error:
+        plan["error"] = error
+    return plan
+
+def node_data(node: Dict[str, Any]) -> Dict[str, Any]:
+    """What execute_node is given for a stored plan node, with conditions compiled"""
+    data = {"params": node["params"], "templates": node["templates"]}
+    if node["type"] == "condition":
+        data["condition"] = Condition(node["params"].get("paths") or [])
+    elif node["type"] == "for-each" and "body" in node:
+        data["node_id"] = node["id"]
+        data["body"] = ExecutionPlan.from_document(node["body"])
+        data["item_index"] = data["body"].index[f"{node['id']}:item"]
+        data["result"] = tuple(node["result"]) if node["result"] else None
+        # Fingerprints must change when anything in the body does
+        data["body_digest"] = hashlib.sha256(
+            json.dumps(node["body"], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:32]
+    return data
+
+def _pipeline_workflows(nodes) -> Dict[str, str]:
+    """Pipeline node ID -> embedded workflow ID for pipelines not inlined yet, including in loop bodies"""
+    pipelines = {}
+    for node in nodes:
+        if node.type == PIPELINE and node.params.get("pipeline") and "outputs" not in node.data:
+            pipelines[node.id] = str(node.params["pipeline"])
+        elif node.type == "for-each" and "body" in node.data:
+            pipelines.update(node.data["body"].pipelines)
+    return pipelines
+
+def _node_name(node) -> str:
+    return str(node.params.get("nodeName") or node.id)
+
+class PlanNode:
+    """One node of a loaded plan; sources are (index, output field, input field) tuples"""
+
+    __slots__ = ("index", "id", "type", "params", "data", "sources", "consumers", "input_key")
+
+    def __init__(self, index, node_id, node_type, params, data, sources, consumers, input_key):
+        self.index = index
+        self.id = node_id
+        self.type = node_type
+        self.params = params
+        # What execute_node reads, built once per loaded plan instead of once per run
+        self.data = data
+        self.sources = sources
+        self.consumers = consumers
+        self.input_key = input_key
+
+class ExecutionPlan:
+    """In-memory form of a stored plan, shared by every execution of one workflow version.
+
+    Nodes are addressed by their integer index in execution order; ids maps an
+    index back to the node ID, and index maps a node ID to its index.
+    pipelines maps each pipeline node still to be inlined to the workflow it
+    embeds, and dependencies maps every workflow the plan was built from to
+    its version.
+    """
+
+    __slots__ = ("nodes", "ids", "index", "error", "pipelines", "dependencies", "inlined")
+
+    def __init__(self, nodes: List[PlanNode], error: Optional[str] = None):
+        self.nodes = nodes
+        self.ids = [node.id for node in nodes]
+        self.index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.error = error
+        self.pipelines = _pipeline_workflows(nodes)
+        self.dependencies: Dict[str, int] = {}
+        # (dependencies, plan) of the last inlining of this plan's pipelines
+        self.inlined: Optional[Tuple[Tuple[Tuple[str, int], ...], "ExecutionPlan"]] = None
+
+    @classmethod
+    def from_document(cls, plan: Dict[str, Any]) -> "ExecutionPlan":
+        return cls(
+            [
+                PlanNode(
+                    i, node["id"], node["type"], node["params"], node_data(node),
+                    tuple((source, output_field, input_field) for source, output_field, input_field in node["sources"]),
+                    node["consumers"], node["input_key"]
+                )
+                for i, node in enumerate(plan["nodes"])
+            ],
+            plan.get("error")
+        )
+
+    def prune(self, target_ids) -> Tuple["ExecutionPlan", List[str]]:
+        """Keep only the target nodes and their transitive dependencies.
+
+        Returns (plan, pruned_node_ids); the kept nodes stay in execution order.
+        """
+        nodes = self.nodes
+        required = set()
+        stack = [self.index[node_id] for node_id in target_ids if node_id in self.index]
+        while stack:
+            i = stack.pop()
+            if i in required:
+                continue
+            required.add(i)
+            stack.extend(source for source, _, _ in nodes[i].sources)
+
+        kept = sorted(required)
+        remap = {old: new for new, old in enumerate(kept)}
+        consumers = [0] * len(kept)
+        kept_nodes = []
+        for new, old in enumerate(kept):
+            node = nodes[old]
+            sources = tuple((remap[source], output_field, input_field) for source, output_field, input_field in node.sources)
+            for source, _, _ in sources:
+                consumers[source] += 1
+            kept_nodes.append(PlanNode(new, node.id, node.type, node.params, node.data, sources, 0, node.input_key))
+        for node, count in zip(kept_nodes, consumers):
+            node.consumers = count
+        pruned = [node.id for node in nodes if node.index not in required]
+        return ExecutionPlan(kept_nodes, self.error), pruned
+
+def plan_digest(plan: ExecutionPlan) -> str:
+    """Hash of everything in a loaded plan that can affect what its nodes output"""
+    payload = json.dumps(
+        [[node.id, node.type, node.params, node.sources, node.data.get("body_digest")] for node in plan.nodes],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def inline_pipelines(plan: ExecutionPlan, children: Dict[str, ExecutionPlan]) -> ExecutionPlan:
+    """Splice the plans of embedded workflows into a plan, by pipeline node ID.
+
+    An embedded workflow's nodes take IDs prefixed with the pipeline node's ID
+    and go right before it. Its input nodes become pipeline-input nodes reading
+    the edges into the pipeline node: an edge whose input handle names an
+    input node (by nodeName or input key) feeds that one, any other edge feeds
+    every input node not named by an edge. Its output nodes become
+    pipeline-output nodes, which the pipeline node reads in order of name. Errors in an
+    embedded plan become errors of the whole plan.
+    """
+    error = plan.error
+    nodes: List[PlanNode] = []
+    remap: Dict[int, int] = {}
+
+    def add(node_id, node_type, params, data, sources, input_key=None):
+        nodes.append(PlanNode(len(nodes), node_id, node_type, params, data, tuple(sources), 0, input_key))
+        return len(nodes) - 1
+
+    for node in plan.nodes:
+        sources = [(remap[source], output_field, input_field) for source, output_field, input_field in node.sources]
+        data = node.data
+        if node.type == "for-each" and "body" in data and data["body"].pipelines:
+            body = inline_pipelines(data["body"], children)
+            error = error or body.error
+            data = {**data, "body": body, "body_digest": plan_digest(body)}
+        elif node.type == PIPELINE and node.id in children:
+            child = children[node.id]
+            error = error or child.error
+            named = {
+                name for child_node in child.nodes if child_node.input_key
+                for name in (_node_name(child_node), child_node.input_key)
+            }
+            child_remap: Dict[int, int] = {}
+            outputs = []
+            for child_node in child.nodes:
+                child_id = f"{node.id}/{child_node.id}"
+                child_data = child_node.data
+                if "node_id" in child_data:
+                    child_data = {**child_data, "node_id": child_id}
+                if child_node.input_key:
+                    names = (_node_name(child_node), child_node.input_key)
+                    bound = [
+                        (source, output_field, "input") for source, output_field, input_field in sources
+                        if input_field in names or input_field not in named
+                    ]
+                    child_remap[child_node.index] = add(child_id, PIPELINE_INPUT, child_node.params, child_data, bound)
+                    continue
+                child_sources = [
+                    (child_remap[source], output_field, input_field)
+                    for source, output_field, input_field in child_node.sources
+                ]
+                node_type = PIPELINE_OUTPUT if child_node.type == "output" else child_node.type
+                child_remap[child_node.index] = add(child_id, node_type, child_node.params, child_data, child_sources)
+                if node_type == PIPELINE_OUTPUT:
+                    outputs.append((child_remap[child_node.index], "output", _node_name(child_node)))
+            sources = sorted(outputs, key=lambda binding: binding[2])
+            data = {**data, "outputs": [name for _, _, name in sources]}
+        remap[node.index] = add(node.id, node.type, node.params, data, sources, node.input_key)
+
+    consumers = [0] * len(nodes)
+    for node in nodes:
+        for source, _, _ in node.sources:
+            consumers[source] += 1
+    for node, count in zip(nodes, consumers):
+        node.consumers = count
+    return ExecutionPlan(nodes, error)
+
+def compute_node_fingerprints(plan: ExecutionPlan, inputs, mode) -> Dict[str, str]:
+    """Hash each node's type, params, execution inputs and upstream fingerprints.
+
+    A node's fingerprint changes whenever anything that can affect its output
+    changes, including anything upstream of it.
+    """
+    fingerprints: List[Optional[str]] = [None] * len(plan.nodes)
+    for node in plan.nodes:
+        upstream = [fingerprints[source] for source, _, _ in node.sources]
+        if None in upstream:
+            # On or after a cycle; never served from cache
+            continue
+        input_value = None
+        if node.input_key:
+            input_value = inputs.get(node.input_key)
+            if hasattr(input_value, "dict"):
+                input_value = input_value.dict()
+        sources = sorted(
+            (output_field or "", input_field or "", fingerprint)
+            for (_, output_field, input_field), fingerprint in zip(node.sources, upstream)
+        )
+        key = [node.type, node.params, mode, input_value, sources]
+        if "body_digest" in node.data:
+            key.append(node.data["body_digest"])
+        payload = json.dumps(key, sort_keys=True, default=str)
+        fingerprints[node.index] = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    return {node_id: fingerprint for node_id, fingerprint in zip(plan.ids, fingerprints) if fingerprint is not None}
+
+class PlanCache:
+    """LRU of compiled plans keyed by (workflow_id, version).
+
+    A saved workflow always gets a new version, so entries never go stale; old
+    versions simply age out.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._plans: "OrderedDict[Tuple[str, int], ExecutionPlan]" = OrderedDict()
+
+    def get(self, workflow_id: str, version: int) -> Optional[ExecutionPlan]:
+        plan = self._plans.get((workflow_id, version))
+        if plan is None:
+            PLAN_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        self._plans.move_to_end((workflow_id, version))
+        PLAN_CACHE_LOOKUPS.labels("hit").inc()
+        return plan
+
+    def put(self, workflow_id: str, version: int, plan: ExecutionPlan):
+        if self.max_size <= 0:
+            return
+        self._plans[(workflow_id, version)] = plan
+        self._plans.move_to_end((workflow_id, version))
+        while len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+
+_cache = PlanCache()
+
+def configure_plan_cache(max_size: int):
+    global _cache
+    _cache = PlanCache(max_size)
+
+def get_plan_cache() -> PlanCache:
+    return _cache
+
+def is_current(plan: Optional[Dict[str, Any]]) -> bool:
+    """Whether a stored plan can be used as is"""
+    return bool(plan) and plan.get("format") == PLAN_FORMAT
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import secrets
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, Optional
+
+from utils.accounting import record_wait
+from utils.tracing import start_span
+
+logger = logging.getLogger("workflow_api")
+
+# node type -> module-level function(params, inputs) -> output dict, run in the pool
+CPU_BOUND_EXECUTORS: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = {}
+
+def cpu_bound(node_type: str):
+    """Declare a node executor as CPU-bound so execute_node runs it in the process pool.
+
+    The function must be defined at module level so worker processes can import it.
+    """
+    def register(func):
+        CPU_BOUND_EXECUTORS[node_type] = func
+        return func
+    return register
+
+class CPUTaskTimeout(Exception):
+    pass
+
+class SharedBuffer:
+    """Handle to a str/bytes value placed in shared memory instead of being pickled"""
+
+    __slots__ = ("name", "size", "is_text")
+
+    def __init__(self, name: str, size: int, is_text: bool):
+        self.name = name
+        self.size = size
+        self.is_text = is_text
+
+def _share(value: Any, threshold: int, name: Optional[str] = None):
+    """Move a large str/bytes value into shared memory; returns (value or handle, segment or None)"""
+    if isinstance(value, str) and len(value) >= threshold:
+        data, is_text = value.encode("utf-8"), True
+    elif isinstance(value, (bytes, bytearray)) and len(value) >= threshold:
+        data, is_text = value, False
+    else:
+        return value, None
+    segment = shared_memory.SharedMemory(name=name, create=True, size=max(len(data), 1))
+    segment.buf[:len(data)] = data
+    return SharedBuffer(segment.name, len(data), is_text), segment
+
+def _unshare(value: Any, unlink: bool) -> Any:
+    if not isinstance(value, SharedBuffer):
+        return value
+    segment = shared_memory.SharedMemory(name=value.name)
+    try:
+        data = bytes(segment.buf[:value.size])
+    finally:
+        segment.close()
+        if unlink:
+            segment.unlink()
+    return data.decode("utf-8") if value.is_text else data
+
+def _output_segment(prefix: str, index: int) -> str:
+    return f"{prefix}_{index}"
+
+def _run_task(func, params, inputs, threshold, output_prefix):
+    """Worker side: resolve shared inputs, run the executor, share large outputs back.
+
+    Output segments are named from output_prefix in order, so the parent can
+    find and unlink them if this worker dies before returning the handles.
+    """
+    started = time.time()
+    inputs = {key: _unshare(value, unlink=False) for key, value in inputs.items()}
+    output = func(params, inputs)
+    shared_output = {}
+    created = 0
+    for key, value in output.items():
+        shared_value, segment = _share(value, threshold, _output_segment(output_prefix, created))
+        if segment is not None:
+            # The parent unlinks it after reading
+            segment.close()
+            created += 1
+        shared_output[key] = shared_value
+    return started, shared_output
+
+def _unlink_orphaned_outputs(output_prefix: str):
+    """Remove output segments a task created before its worker was killed"""
+    index = 0
+    while True:
+        try:
+            segment = shared_memory.SharedMemory(name=_output_segment(output_prefix, index))
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+        index += 1
+
+def _warm():
+    # Long enough that every warm-up task lands on its own worker
+    time.sleep(0.05)
+    return os.getpid()
+
+def _pool_context():
+    """forkserver where available, else spawn; never fork.
+
+    The API process runs threads (log writer, trace exporter, loop watchdog,
+    driver pools), and a forked child can deadlock on a lock one of them held.
+    The fork server is a clean single-threaded process started once, and it
+    preloads the executors instead of the app's main module.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["utils.node_executors"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+class CPUPool:
+    """Process pool for CPU-bound node executors with per-task timeouts.
+
+    A task that times out cannot be interrupted inside its worker, so the pool is
+    torn down and restarted. Only the timed-out task fails; other tasks running
+    in the old pool at that moment are resubmitted to the new one. A cancelled
+    task that has started runs to completion and its outputs are discarded.
+    """
+
+    # Resubmissions of a task whose pool broke for reasons of its own, e.g. a worker crashing
+    MAX_RETRIES = 1
+
+    def __init__(self, workers: int, task_timeout: float, shm_threshold: int):
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.shm_threshold = shm_threshold
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Pools torn down because of another task's timeout
+        self._recycled: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+
+    def start(self, wait: bool = True):
+        # Workers must share our resource tracker, or each one would report the shared
+        # memory segments it touched as leaked
+        resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+        # Start every worker up front so requests don't pay for interpreter start-up
+        warming = [self._executor.submit(_warm) for _ in range(self.workers)]
+        if wait:
+            pids = {future.result() for future in warming}
+            logger.info(f"CPU pool started with {self.workers} workers ({len(pids)} warm)")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        if executor is not self._executor:
+            # Another task already replaced this pool
+            return
+        self._executor = None
+        if executor is not None:
+            self._recycled.add(executor)
+            # Running tasks can't be cancelled, so stop the workers themselves
+            for process in list(getattr(executor, "_processes", {}).values()):
+                process.terminate()
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.start(wait=False)
+
+    async def run(self, func, params: Dict[str, Any], inputs: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        executor = self._executor
+        if executor is None:
+            raise RuntimeError("CPU pool is not running")
+        segments = []
+        shared_inputs = {}
+        for key, value in inputs.items():
+            shared_value, segment = _share(value, self.shm_threshold)
+            if segment is not None:
+                segments.append(segment)
+            shared_inputs[key] = shared_value
+        submitted = time.time()
+        retries = 0
+        try:
+            while True:
+                output_prefix = f"wfo_{secrets.token_hex(8)}"
+                try:
+                    future = executor.submit(_run_task, func, params, shared_inputs, self.shm_threshold, output_prefix)
+                    started, output = await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.task_timeout)
+                    break
+                except asyncio.TimeoutError:
+                    logger.warning(f"CPU task {func.__name__} timed out after {timeout or self.task_timeout}s, restarting pool")
+                    self._restart(executor)
+                    _unlink_orphaned_outputs(output_prefix)
+                    raise CPUTaskTimeout(f"{func.__name__} exceeded {timeout or self.task_timeout}s")
+                except asyncio.CancelledError:
+                    # A task that already started keeps running in its worker; remove
+                    # the output segments it leaves once it is done
+                    if not future.cancel():
+                        future.add_done_callback(lambda _, prefix=output_prefix: _unlink_orphaned_outputs(prefix))
+                    raise
+                except BrokenProcessPool:
+                    _unlink_orphaned_outputs(output_prefix)
+                    if executor not in self._recycled:
+                        logger.error("CPU pool broke while running a task, restarting")
+                        self._restart(executor)
+                        if retries >= self.MAX_RETRIES:
+                            raise
+                        retries += 1
+                    # Killed along with another task's pool; not this task's fault
+                    executor = self._executor
+                    if executor is None:
+                        raise
+            record_wait(max(0.0, started - submitted))
+            return {key: _unshare(value, unlink=True) for key, value in output.items()}
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+_pool: Optional[CPUPool] = None
+
+def start_cpu_pool(workers: Optional[int], task_timeout: float, shm_threshold: int):
+    global _pool
+    _pool = CPUPool(workers or os.cpu_count() or 1, task_timeout, shm_threshold)
+    _pool.start()
+
+def shutdown_cpu_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+async def run_cpu_bound(node_type: str, params: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a registered CPU-bound executor in the pool, or in a thread when no pool is running"""
+    func = CPU_BOUND_EXECUTORS[node_type]
+    with start_span("pool.task", **{"node.type": node_type}):
+        if _pool is None:
+            return await asyncio.to_thread(func, params, inputs)
+        return await _pool.run(func, params, inputs)
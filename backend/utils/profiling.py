@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+PROFILE_KINDS = ("cpu", "alloc")
+
+# Frames from the profiler itself are noise in every stack
+_IGNORED_FILES = (tracemalloc.__file__, __file__)
+
+_active_lock = threading.Lock()
+
+class ProfileBusy(Exception):
+    """Raised when another execution is already being profiled"""
+
+def _frame_label(filename: str, name: str, lineno: int) -> str:
+    # ';' separates frames in the folded format, so it must not appear in a label
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ":")
+
+class SamplingProfiler:
+    """Sample one thread's Python stack at a fixed interval from a helper thread.
+
+    The event loop thread is shared, so samples also include any other request
+    that happened to be running on the loop while the profile was active.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cpu-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename not in _IGNORED_FILES:
+                    stack.append(_frame_label(code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+class Profile:
+    """Result of a profiled block in collapsed-stack ("folded") form, one `stack weight` per line"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.stacks: Dict[str, int] = {}
+        self.duration = 0.0
+        self.summary: Dict[str, float] = {}
+
+    def folded(self) -> str:
+        lines = [f"{stack} {weight}" for stack, weight in sorted(self.stacks.items())]
+        return "\n".join(lines) + "\n"
+
+@contextmanager
+def profile_block(kind: str, interval: float = 0.005):
+    """Profile the enclosed block: "cpu" samples stacks, "alloc" records net allocations by traceback.
+
+    Only one block is profiled at a time process-wide; a second caller gets ProfileBusy.
+    """
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"Unknown profile kind: {kind}")
+    if not _active_lock.acquire(blocking=False):
+        raise ProfileBusy("Another execution is already being profiled")
+    profile = Profile(kind)
+    start = time.perf_counter()
+    try:
+        if kind == "cpu":
+            profiler = SamplingProfiler(threading.get_ident(), interval)
+            profiler.start()
+            try:
+                yield profile
+            finally:
+                profiler.stop()
+                profile.stacks = dict(profiler.samples)
+                profile.summary = {"samples": sum(profiler.samples.values()), "interval": interval}
+        else:
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start(32)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            try:
+                yield profile
+            finally:
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if not was_tracing:
+                    tracemalloc.stop()
+                profile.stacks = _allocation_stacks(before, after)
+                profile.summary = {"net_bytes": sum(profile.stacks.values()), "peak_bytes": peak}
+    finally:
+        profile.duration = time.perf_counter() - start
+        _active_lock.release()
+
+def _allocation_stacks(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> Dict[str, int]:
+    """Bytes still allocated at the end of the block, grouped by allocation traceback"""
+    filters = [tracemalloc.Filter(False, path) for path in _IGNORED_FILES]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+    stacks: Dict[str, int] = {}
+    for stat in stats:
+        if stat.size_diff <= 0:
+            continue
+        # Traceback frames run from the oldest call to the allocation site
+        stack = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback)
+        stacks[stack] = stacks.get(stack, 0) + stat.size_diff
+    return stacks
+
+def profile_path(directory: str, execution_id: str, kind: str) -> str:
+    return os.path.join(directory, f"{execution_id}-{kind}.folded")
+
+def save_profile(directory: str, execution_id: str, profile: Profile) -> str:
+    """Write the folded stacks to disk; blocking, call through a thread from async code"""
+    os.makedirs(directory, exist_ok=True)
+    path = profile_path(directory, execution_id, profile.kind)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profile.folded())
+    return path
+
+def load_profile(directory: str, execution_id: str, kind: str) -> Optional[str]:
+    if kind not in PROFILE_KINDS or not all(c in "0123456789abcdef" for c in execution_id):
+        return None
+    try:
+        with open(profile_path(directory, execution_id, kind), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+ProgressListener = Callable[[Dict[str, Any]], None]
+
+_listener: ContextVar[Optional[ProgressListener]] = ContextVar("progress_listener", default=None)
+
+@contextmanager
+def progress_listener(listener: ProgressListener):
+    """Send progress events reported below, including from tasks started here, to listener"""
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+def report_progress(event: str, **fields: Any):
+    """Report a progress event to the execution's listener; a no-op when nobody is listening"""
+    listener = _listener.get()
+    if listener is not None:
+        listener({"event": event, **fields})
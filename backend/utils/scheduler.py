@@ -0,0 +1,290 @@
+"""Built-in scheduler for cron and interval workflow schedules.
+
+Schedules live in the workflow_schedules collection, each with the nominal
+time of its next run in next_run_at. Every API process runs a Scheduler, but
+only the one holding the leader lease in Redis dispatches runs. The leader
+keeps each enabled schedule's due time in a heap and sleeps until the
+earliest. It claims a run by moving next_run_at forward with an update
+conditioned on the value it read, so a run is never started twice, even
+while leadership changes hands.
+
+Each run starts up to `jitter` seconds after its nominal time, so schedules
+sharing a time don't all start at once. A run found more than the misfire
+grace late (the scheduler was down, or no process held the lease) is handled
+by the schedule's misfire policy: skip it, run once for all missed runs, or
+catch up on each missed run.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from redis.exceptions import WatchError
+
+from utils.cron import CronExpression
+from utils.metrics import SCHEDULED_RUNS, SCHEDULE_LAG, SCHEDULER_LEADER
+
+logger = logging.getLogger("workflow_api.scheduler")
+
+MISFIRE_POLICIES = ("skip", "run-once", "catch-up")
+
+LEADER_KEY = "scheduler:leader"
+
+@lru_cache(maxsize=1024)
+def parse_cron(expression: str) -> CronExpression:
+    return CronExpression(expression)
+
+def next_run(schedule: Dict[str, Any], after: datetime) -> datetime:
+    """The first nominal run time of a schedule strictly after `after`.
+
+    Interval schedules stay on the grid of their anchor, the time they were
+    created, so late runs don't make later ones drift.
+    """
+    if schedule.get("cron"):
+        return parse_cron(schedule["cron"]).next_after(after)
+    interval = timedelta(seconds=schedule["interval"])
+    anchor = schedule["anchor"]
+    if after < anchor:
+        return anchor
+    return anchor + interval * (math.floor((after - anchor) / interval) + 1)
+
+def jitter_offset(schedule_id: str, nominal: datetime, jitter: float) -> float:
+    """Seconds a run starts after its nominal time; the same on every scheduler process"""
+    if not jitter:
+        return 0.0
+    return random.Random(f"{schedule_id}:{nominal.isoformat()}").uniform(0, jitter)
+
+class Scheduler:
+    """Dispatch due schedules while holding the leader lease.
+
+    run is called once per run with the schedule document and the run's
+    nominal time; it owns admission and recording the execution.
+    """
+
+    def __init__(
+        self,
+        db,
+        redis,
+        run: Callable[[Dict[str, Any], datetime], Awaitable[Any]],
+        lease_ttl: float = 30.0,
+        refresh_interval: float = 15.0,
+        misfire_grace: float = 60.0,
+        max_catch_up: int = 10,
+        leader_election: bool = True
+    ):
+        self.collection = db["workflow_schedules"]
+        self.redis = redis
+        self.run = run
+        self.lease_ttl = lease_ttl
+        self.refresh_interval = refresh_interval
+        self.misfire_grace = timedelta(seconds=misfire_grace)
+        self.max_catch_up = max_catch_up
+        self.leader_election = leader_election
+        self.instance_id = uuid.uuid4().hex
+        self.is_leader = False
+        # Schedule ID -> (nominal time, due time) of its next run; heap entries
+        # that no longer match are stale and dropped when they surface
+        self._entries: Dict[str, Tuple[datetime, datetime]] = {}
+        self._heap: List[Tuple[datetime, str, datetime]] = []
+        self._next_refresh = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._runs: set = set()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.is_leader and self.leader_election:
+            await asyncio.to_thread(self._release_lease)
+        self._set_leader(False)
+
+    def notify(self):
+        """Pick up schedule changes made by this process without waiting for the next refresh"""
+        self._next_refresh = 0.0
+        self._wake.set()
+
+    # Leader lease: a Redis key holding the leader's instance ID, renewed well before it expires
+
+    def _hold_lease(self) -> bool:
+        ttl_ms = int(self.lease_ttl * 1000)
+        if self.redis.set(LEADER_KEY, self.instance_id, nx=True, px=ttl_ms):
+            return True
+        # Renew only while the key is still ours
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(LEADER_KEY)
+                if pipe.get(LEADER_KEY) != self.instance_id:
+                    return False
+                pipe.multi()
+                pipe.pexpire(LEADER_KEY, ttl_ms)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def _release_lease(self):
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(LEADER_KEY)
+                if pipe.get(LEADER_KEY) == self.instance_id:
+                    pipe.multi()
+                    pipe.delete(LEADER_KEY)
+                    pipe.execute()
+            except WatchError:
+                pass
+
+    def _set_leader(self, leader: bool):
+        if leader != self.is_leader:
+            logger.info("Scheduler %s %s leadership", self.instance_id, "took" if leader else "lost")
+            # A new leader starts from the stored schedules
+            self._entries.clear()
+            self._heap.clear()
+            self._next_refresh = 0.0
+            if leader:
+                SCHEDULER_LEADER.labels().inc()
+            else:
+                SCHEDULER_LEADER.labels().dec()
+        self.is_leader = leader
+
+    async def _loop(self):
+        renew_every = self.lease_ttl / 3
+        next_renewal = 0.0
+        while True:
+            self._wake.clear()
+            if time.monotonic() >= next_renewal:
+                try:
+                    leader = await asyncio.to_thread(self._hold_lease) if self.leader_election else True
+                except Exception as e:
+                    # Without Redis this process can't tell whether it still leads
+                    logger.error("Scheduler lease check failed: %s", e)
+                    leader = False
+                self._set_leader(leader)
+                next_renewal = time.monotonic() + renew_every
+            try:
+                timeout = next_renewal - time.monotonic()
+                if self.is_leader:
+                    if time.monotonic() >= self._next_refresh:
+                        await self._refresh()
+                    await self._fire_due()
+                    timeout = min(timeout, self._next_refresh - time.monotonic())
+                    if self._heap:
+                        timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+            except Exception as e:
+                logger.error("Scheduler iteration failed: %s", e, exc_info=True)
+                timeout = min(renew_every, self.refresh_interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self):
+        """Reload the due times of enabled schedules, picking up changes from any process"""
+        entries = {}
+        cursor = self.collection.find({"enabled": True}, {"next_run_at": 1, "jitter": 1})
+        async for schedule in cursor:
+            schedule_id = str(schedule["_id"])
+            nominal = schedule["next_run_at"]
+            entry = (nominal, nominal + timedelta(seconds=jitter_offset(schedule_id, nominal, schedule.get("jitter", 0.0))))
+            entries[schedule_id] = entry
+            if self._entries.get(schedule_id) != entry:
+                heapq.heappush(self._heap, (entry[1], schedule_id, nominal))
+        self._entries = entries
+        if len(self._heap) > 2 * len(entries) + 64:
+            # Mostly stale entries; rebuild rather than drain them one by one
+            self._heap = [(due, schedule_id, nominal) for schedule_id, (nominal, due) in entries.items()]
+            heapq.heapify(self._heap)
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+    async def _fire_due(self):
+        now = datetime.utcnow()
+        while self._heap and self._heap[0][0] <= now:
+            due, schedule_id, nominal = heapq.heappop(self._heap)
+            if self._entries.get(schedule_id) != (nominal, due):
+                continue
+            del self._entries[schedule_id]
+            await self._fire(schedule_id, nominal, due, now)
+
+    def _missed_runs(self, schedule: Dict[str, Any], nominal: datetime, now: datetime) -> List[datetime]:
+        """Nominal times of the runs owed at `now`, given the first one due was `nominal`"""
+        runs = [nominal]
+        while len(runs) <= self.max_catch_up:
+            following = next_run(schedule, runs[-1])
+            if following > now:
+                break
+            runs.append(following)
+        if now - nominal <= self.misfire_grace:
+            return runs[-1:]
+        policy = schedule.get("misfire", "run-once")
+        if policy == "skip":
+            return []
+        if policy == "catch-up":
+            return runs[-self.max_catch_up:] if self.max_catch_up > 0 else []
+        return runs[-1:]
+
+    async def _fire(self, schedule_id: str, nominal: datetime, due: datetime, now: datetime):
+        schedule = await self.collection.find_one({"_id": ObjectId(schedule_id), "next_run_at": nominal, "enabled": True})
+        if schedule is None:
+            # Changed or deleted since the last refresh
+            return
+        runs = self._missed_runs(schedule, nominal, now)
+        following = next_run(schedule, max(now, nominal))
+        update = {"next_run_at": following}
+        if runs:
+            update["last_run_at"] = now
+        claimed = await self.collection.update_one(
+            {"_id": schedule["_id"], "next_run_at": nominal, "enabled": True},
+            {"$set": update}
+        )
+        if claimed.modified_count == 0:
+            # Another scheduler claimed it first
+            return
+        next_due = following + timedelta(seconds=jitter_offset(schedule_id, following, schedule.get("jitter", 0.0)))
+        self._entries[schedule_id] = (following, next_due)
+        heapq.heappush(self._heap, (next_due, schedule_id, following))
+
+        if not runs:
+            SCHEDULED_RUNS.labels("skipped").inc()
+            logger.warning("Schedule %s missed its run at %s; skipped per its misfire policy", schedule_id, nominal.isoformat())
+            return
+        SCHEDULE_LAG.labels().observe(max(0.0, (now - due).total_seconds()))
+        for run_at in runs:
+            task = asyncio.create_task(self._dispatch(schedule, run_at))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+
+    async def _dispatch(self, schedule: Dict[str, Any], nominal: datetime):
+        try:
+            await self.run(schedule, nominal)
+        except Exception as e:
+            SCHEDULED_RUNS.labels("error").inc()
+            logger.error("Scheduled run of workflow %s failed: %s", schedule["workflow_id"], e, exc_info=True)
+
+_scheduler: Optional[Scheduler] = None
+
+def start_scheduler(db, redis, run, lease_ttl: float, refresh_interval: float, misfire_grace: float, max_catch_up: int, leader_election: bool):
+    """Start the scheduler loop; call from inside the event loop"""
+    global _scheduler
+    _scheduler = Scheduler(db, redis, run, lease_ttl, refresh_interval, misfire_grace, max_catch_up, leader_election)
+    _scheduler.start()
+
+async def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
+
+def notify_scheduler():
+    """Tell this process's scheduler that schedules changed"""
+    if _scheduler is not None:
+        _scheduler.notify()
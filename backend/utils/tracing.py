@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("workflow_api")
+
+SERVICE_NAME = "flowmind-api"
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_CLIENT = 3
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[str] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.error = error
+        self.trace.spans.append(self)
+
+class _NoopSpan:
+    """Returned when no trace is active so instrumented code needs no branches"""
+
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def end(self, error: Optional[str] = None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        # list.append is atomic, so spans ended from driver threads need no lock
+        self.spans: List[Span] = []
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+_enabled = True
+_sample_rate = 1.0
+_exporter: Optional["FileSpanExporter"] = None
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def begin_span(name: str, parent: Optional[Span] = None, kind: int = KIND_INTERNAL, **attributes):
+    """Start a span without making it current; the caller must call end().
+
+    Used where start and end happen in different callbacks, e.g. driver command listeners.
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+@contextmanager
+def start_span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Record a child of the current span; a no-op outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    span = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(error=str(e) or type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Open a new trace rooted at this span and export it when the span ends"""
+    if not _enabled or (_sample_rate < 1.0 and random.random() >= _sample_rate):
+        yield NOOP_SPAN
+        return
+    span = Span(Trace(), name, None, KIND_INTERNAL, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(error=str(e) or type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        if _exporter is not None:
+            _exporter.export(span.trace)
+
+# OTLP/JSON encoding
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """Encode a finished trace as an OTLP/JSON ExportTraceServiceRequest"""
+    spans = []
+    for span in trace.spans:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "workflow_api"}, "spans": spans}]
+        }]
+    }
+
+class FileSpanExporter:
+    """Write each finished trace to <directory>/<trace_id>.json from a background thread.
+
+    Only the newest max_files traces are kept; older files are deleted as new
+    ones are written.
+    """
+
+    def __init__(self, directory: str, queue_size: int = 1000, max_files: int = 10000):
+        self.directory = directory
+        self.max_files = max_files
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        os.makedirs(directory, exist_ok=True)
+        # Files left by earlier runs count towards the cap, oldest first
+        with os.scandir(directory) as entries:
+            existing = [entry for entry in entries if entry.name.endswith(".json") and entry.is_file()]
+        existing.sort(key=lambda entry: entry.stat().st_mtime)
+        self._files = deque(entry.path for entry in existing)
+        self._prune()
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning(f"Trace export queue full, dropping trace {trace.trace_id}")
+
+    def path_for(self, trace_id: str) -> str:
+        return os.path.join(self.directory, f"{trace_id}.json")
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                break
+            path = self.path_for(trace.trace_id)
+            try:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(to_otlp(trace), f)
+            except Exception as e:
+                logger.error(f"Failed to export trace {trace.trace_id}: {str(e)}")
+                continue
+            self._files.append(path)
+            self._prune()
+
+    def _prune(self):
+        while len(self._files) > self.max_files:
+            try:
+                os.remove(self._files.popleft())
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to remove old trace file: {str(e)}")
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+def configure_tracing(enabled: bool, directory: str, sample_rate: float = 1.0, max_files: int = 10000):
+    global _enabled, _sample_rate, _exporter
+    _enabled = enabled
+    _sample_rate = sample_rate
+    if enabled and _exporter is None:
+        _exporter = FileSpanExporter(directory, max_files=max_files)
+
+def shutdown_tracing():
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+def load_trace(trace_id: str) -> Optional[Dict[str, Any]]:
+    """Read an exported trace back; blocking, call through a thread from async code"""
+    if _exporter is None or not all(c in "0123456789abcdef" for c in trace_id):
+        return None
+    try:
+        with open(_exporter.path_for(trace_id), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def render_waterfall(otlp: Dict[str, Any], width: int = 60) -> str:
+    """Render an OTLP/JSON trace as an indented text waterfall"""
+    spans = [span for rs in otlp["resourceSpans"] for ss in rs["scopeSpans"] for span in ss["spans"]]
+    if not spans:
+        return ""
+    start = min(int(span["startTimeUnixNano"]) for span in spans)
+    end = max(int(span["endTimeUnixNano"]) for span in spans)
+    total = max(end - start, 1)
+
+    children: Dict[str, List[Dict[str, Any]]] = {}
+    for span in spans:
+        children.setdefault(span["parentSpanId"], []).append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: int(span["startTimeUnixNano"]))
+
+    label_width = 48
+    lines = [f"{'span':<{label_width}} {'start':>9} {'duration':>9}  timeline"]
+
+    def walk(parent_id: str, depth: int):
+        for span in children.get(parent_id, []):
+            span_start = int(span["startTimeUnixNano"]) - start
+            span_duration = int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+            offset = int(span_start / total * width)
+            length = max(1, int(span_duration / total * width))
+            attributes = {attr["key"]: next(iter(attr["value"].values())) for attr in span["attributes"]}
+            detail = next((attributes[key] for key in ("node.id", "provider", "db.collection") if key in attributes), None)
+            label = ("  " * depth + span["name"] + (f" {detail}" if detail else ""))[:label_width]
+            marker = "!" if span["status"].get("code") == 2 else ""
+            lines.append(
+                f"{label:<{label_width}} {span_start / 1e6:>7.1f}ms {span_duration / 1e6:>7.1f}ms  "
+                f"{' ' * offset}{'█' * length}{marker}"
+            )
+            walk(span["spanId"], depth + 1)
+
+    walk("", 0)
+    return "\n".join(lines)
@@ -0,0 +1,282 @@
+"""Inbound webhook deliveries: token lookup, the Redis stream, and its consumer.
+
+POST /hooks/{workflow_id}/{token} only checks the token and appends the
+delivery to a Redis stream, so it answers in about one Redis round trip. A
+workflow's token is stored as its SHA-256 digest, and digests are cached in
+process for WEBHOOK_TOKEN_CACHE_TTL seconds, so most checks need no database
+read.
+
+Every API process runs a consumer in the stream's consumer group. It reads
+deliveries in batches, drops duplicates by idempotency key, and runs the rest
+in the background with bounded concurrency. A delivery is acknowledged once
+its execution has finished. If admission rejects it, or its consumer dies
+first, it stays pending, and a consumer claims it again after
+WEBHOOK_CLAIM_IDLE seconds.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from redis.exceptions import ResponseError
+
+from utils.admission import AdmissionRejected
+from utils.metrics import WEBHOOK_DELIVERIES
+
+logger = logging.getLogger("workflow_api.webhooks")
+
+STREAM = "webhooks:deliveries"
+GROUP = "webhook-workers"
+DEDUP_PREFIX = "webhooks:seen:"
+
+# The token segment of a hook URL; it is a credential and must never reach the logs
+_HOOK_TOKEN = re.compile(r"^(/hooks/[^/]*/)[^/]+")
+
+def redact_hook_path(path: str) -> str:
+    return _HOOK_TOKEN.sub(r"\1***", path)
+
+class HookTokenFilter(logging.Filter):
+    """Redact hook tokens from uvicorn access log lines"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access args: (client address, method, path with query, HTTP version, status)
+        if isinstance(record.args, tuple) and len(record.args) >= 3 and isinstance(record.args[2], str):
+            record.args = (*record.args[:2], redact_hook_path(record.args[2]), *record.args[3:])
+        return True
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class TokenCache:
+    """Webhook token digest and owner per workflow, cached for a short while.
+
+    Missing workflows and workflows without a token are cached too, so
+    unauthorized floods don't reach the database either.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[float, Optional[str], Optional[str]]] = {}
+
+    async def lookup(self, workflow_collection, workflow_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """(token digest, owner user ID) of a workflow; (None, None) when it takes no webhooks"""
+        entry = self._entries.get(workflow_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1], entry[2]
+        workflow = None
+        if ObjectId.is_valid(workflow_id):
+            workflow = await workflow_collection.find_one({"_id": ObjectId(workflow_id)}, {"webhook": 1, "user_id": 1})
+        digest = user_id = None
+        if workflow and workflow.get("webhook"):
+            digest, user_id = workflow["webhook"]["token_hash"], workflow["user_id"]
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+        self._entries[workflow_id] = (time.monotonic() + self.ttl, digest, user_id)
+        return digest, user_id
+
+    def invalidate(self, workflow_id: str):
+        self._entries.pop(workflow_id, None)
+
+def token_matches(token: str, digest: Optional[str]) -> bool:
+    return digest is not None and hmac.compare_digest(token_digest(token), digest)
+
+def webhook_inputs(payload: str, content_type: str) -> Dict[str, Any]:
+    """Execution inputs for a delivery.
+
+    A JSON object with an "inputs" object is taken as the inputs, as in an
+    execute request. Any other payload becomes input_0: JSON bodies as the
+    parsed value, anything else as text.
+    """
+    value: Any = payload
+    if "json" in content_type:
+        try:
+            value = json.loads(payload)
+        except ValueError:
+            pass
+        if isinstance(value, dict) and isinstance(value.get("inputs"), dict):
+            return {
+                key: item if isinstance(item, dict) and "value" in item else {"value": item}
+                for key, item in value["inputs"].items()
+            }
+    return {"input_0": {"value": value, "type": "Text"}}
+
+class WebhookConsumer:
+    """Run deliveries from the stream, at most `concurrency` at a time.
+
+    run is called with each delivery's fields and entry ID. AdmissionRejected
+    leaves the delivery pending for a retry; any other error acknowledges it
+    as failed.
+    """
+
+    def __init__(
+        self,
+        redis,
+        run: Callable[[Dict[str, str], str], Awaitable[Any]],
+        batch_size: int = 100,
+        concurrency: int = 16,
+        claim_idle: float = 60.0,
+        dedup_ttl: int = 86400
+    ):
+        self.redis = redis
+        self.run = run
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.claim_idle = claim_idle
+        self.dedup_ttl = dedup_ttl
+        self.consumer_name = uuid.uuid4().hex
+        self._running: set = set()
+        self._slot_free = asyncio.Event()
+        self._next_claim = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        # Unfinished deliveries stay pending and are claimed by another consumer
+        tasks = [task for task in (self._task, *self._running) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _create_group(self):
+        try:
+            self.redis.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self, count: int) -> List[Tuple[str, Dict[str, str]]]:
+        """Claim deliveries abandoned by other consumers, or else read new ones"""
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + self.claim_idle / 2
+            _, claimed, *_ = self.redis.xautoclaim(
+                STREAM, GROUP, self.consumer_name, min_idle_time=int(self.claim_idle * 1000), start_id="0-0", count=count
+            )
+            if claimed:
+                WEBHOOK_DELIVERIES.labels("retried").inc(len(claimed))
+                return claimed
+        response = self.redis.xreadgroup(GROUP, self.consumer_name, {STREAM: ">"}, count=count, block=1000)
+        return response[0][1] if response else []
+
+    def _first_deliveries(self, entries: List[Tuple[str, Dict[str, str]]]) -> List[bool]:
+        """Whether each delivery is the first with its idempotency key.
+
+        The key is marked with the first delivery's entry ID, so that delivery
+        still counts as first when it is claimed again for a retry.
+        """
+        keyed = [
+            (i, f"{DEDUP_PREFIX}{fields['workflow_id']}:{fields['idempotency_key']}", entry_id)
+            for i, (entry_id, fields) in enumerate(entries) if fields.get("idempotency_key")
+        ]
+        first = [True] * len(entries)
+        if not keyed:
+            return first
+        with self.redis.pipeline(transaction=False) as pipe:
+            for _, key, entry_id in keyed:
+                pipe.set(key, entry_id, nx=True, ex=self.dedup_ttl)
+            marked = pipe.execute()
+        taken = [binding for binding, was_set in zip(keyed, marked) if not was_set]
+        if taken:
+            # Already marked: a duplicate, unless it was marked by this very delivery
+            with self.redis.pipeline(transaction=False) as pipe:
+                for _, key, _ in taken:
+                    pipe.get(key)
+                marked_by = pipe.execute()
+            for (i, _, entry_id), owner in zip(taken, marked_by):
+                first[i] = owner == entry_id
+        return first
+
+    async def _loop(self):
+        await asyncio.to_thread(self._create_group)
+        while True:
+            try:
+                while len(self._running) >= self.concurrency:
+                    self._slot_free.clear()
+                    await self._slot_free.wait()
+                count = min(self.batch_size, self.concurrency - len(self._running))
+                entries = await asyncio.to_thread(self._read, count)
+                # Entries trimmed from the stream while pending come back without fields
+                trimmed = [entry_id for entry_id, fields in entries if not fields]
+                if trimmed:
+                    await asyncio.to_thread(self.redis.xack, STREAM, GROUP, *trimmed)
+                entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+                if not entries:
+                    continue
+                first = await asyncio.to_thread(self._first_deliveries, entries)
+                duplicates = [entry_id for (entry_id, _), is_first in zip(entries, first) if not is_first]
+                if duplicates:
+                    WEBHOOK_DELIVERIES.labels("duplicate").inc(len(duplicates))
+                    await asyncio.to_thread(self.redis.xack, STREAM, GROUP, *duplicates)
+                for (entry_id, fields), is_first in zip(entries, first):
+                    if is_first:
+                        task = asyncio.create_task(self._deliver(entry_id, fields))
+                        self._running.add(task)
+                        task.add_done_callback(self._finished)
+            except Exception as e:
+                logger.error("Webhook consumer iteration failed: %s", e, exc_info=True)
+                await asyncio.sleep(1.0)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        self._slot_free.set()
+
+    async def _deliver(self, entry_id: str, fields: Dict[str, str]):
+        try:
+            await self.run(fields, entry_id)
+            WEBHOOK_DELIVERIES.labels("completed").inc()
+        except AdmissionRejected as e:
+            # Left pending; claimed again once it has been idle for claim_idle
+            WEBHOOK_DELIVERIES.labels("rejected").inc()
+            logger.warning("Webhook delivery %s for workflow %s deferred: %s", entry_id, fields.get("workflow_id"), e.reason)
+            return
+        except Exception as e:
+            WEBHOOK_DELIVERIES.labels("failed").inc()
+            logger.error("Webhook delivery %s for workflow %s failed: %s", entry_id, fields.get("workflow_id"), e, exc_info=True)
+        await asyncio.to_thread(self.redis.xack, STREAM, GROUP, entry_id)
+
+def enqueue_delivery(redis, workflow_id: str, user_id: str, payload: str, content_type: str, idempotency_key: str, max_length: int) -> str:
+    """Append a delivery to the stream; returns its entry ID"""
+    return redis.xadd(
+        STREAM,
+        {
+            "workflow_id": workflow_id,
+            "user_id": user_id,
+            "payload": payload,
+            "content_type": content_type,
+            "idempotency_key": idempotency_key,
+            "received_at": datetime.utcnow().isoformat()
+        },
+        maxlen=max_length,
+        approximate=True
+    )
+
+_tokens = TokenCache()
+_consumer: Optional[WebhookConsumer] = None
+
+def configure_webhook_tokens(ttl: float):
+    global _tokens
+    _tokens = TokenCache(ttl)
+
+def get_webhook_tokens() -> TokenCache:
+    return _tokens
+
+def start_webhook_consumer(redis, run, batch_size: int, concurrency: int, claim_idle: float, dedup_ttl: int):
+    """Start consuming deliveries; call from inside the event loop"""
+    global _consumer
+    _consumer = WebhookConsumer(redis, run, batch_size, concurrency, claim_idle, dedup_ttl)
+    _consumer.start()
+
+async def stop_webhook_consumer():
+    global _consumer
+    if _consumer is not None:
+        await _consumer.stop()
+        _consumer = None